@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import csv
+import io
+import os
+import re
+import zipfile
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import IO, NamedTuple
+
+from sqlalchemy import func, select, Select, String, type_coerce
+
+import matcher
+from cache import DaySnapshot, Snapshot
+from constants import DAY_FORMAT
+from models import Drop, Player, Task, Team
+
+# Rows are streamed from the database this many at a time, no table is ever loaded whole. They are read on a plain
+# connection rather than a session, the ORM has nothing to add to tuples of columns.
+CHUNK_SIZE = 10000
+ITEM_PATTERN = re.compile(r"^I found (?:an? |some |the )?(.+?)\.?$", re.IGNORECASE)
+
+
+class PlayerDay(NamedTuple):
+    rsn: str
+    team: str
+    day: date
+    drops: int
+
+
+class ItemCount(NamedTuple):
+    item: str
+    drops: int
+
+
+class TaskCompletion(NamedTuple):
+    day: date
+    task_id: int
+    description: str
+    team: str
+    seconds: float | None
+
+
+def item_name(message: str) -> str:
+    match: re.Match | None = ITEM_PATTERN.match(message)
+    return match.group(1).lower() if match else message.lower()
+
+
+def export_queries(competition_id: int) -> dict:
+    """The columns that are exported per table, without internal keys that only mean something in this
+    database such as cursors and dedupe keys."""
+    return {
+        # Dates are written as SQLite stores them, parsing a million of them only to print them again is slow
+        "drop": select(Drop.drop_id, Player.rsn, Team.name.label("team"), Drop.message,
+                       type_coerce(Drop.date, String).label("date")).join(Drop.player).join(
+            Player.team).where(Team.competition_id == competition_id).order_by(Drop.drop_id),
+        "task": select(Task.task_id, Task.day, Task.description, Task.regex_search, Task.number_required).where(
+            Task.competition_id == competition_id).order_by(Task.day, Task.task_id),
+        "team": select(Team.team_id, Team.name, Team.lives).where(Team.competition_id == competition_id).order_by(
+            Team.team_id),
+    }
+
+
+async def export(competition_id: int, file: IO[bytes]) -> dict[str, int]:
+    """Writes the drops, tasks and teams of the competition to `file` as a zip with a CSV per table, streaming
+    the rows in chunks. Returns the number of rows written per table."""
+    import database as db
+    rows: dict[str, int] = {}
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        async with db.engine.connect() as connection:
+            for table, query in export_queries(competition_id).items():
+                rows[table] = 0
+                with archive.open(f"{table}.csv", "w", force_zip64=True) as entry:
+                    text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+                    writer = csv.writer(text)
+                    result = await connection.stream(query.execution_options(yield_per=CHUNK_SIZE))
+                    writer.writerow(result.keys())
+                    async for partition in result.partitions():
+                        writer.writerows(partition)
+                        rows[table] += len(partition)
+                    text.flush()
+                    text.detach()
+    return rows
+
+
+async def drops_per_player(competition_id: int, day: date | None = None) -> list[PlayerDay]:
+    """Counts the drops of every player per day, most drops first. SQLite does the grouping, so only the counts
+    leave the database."""
+    import database as db
+    drop_day = func.date(Drop.date)
+    query: Select = select(Player.rsn, Team.name, drop_day, func.count()).join(Drop.player).join(Player.team).where(
+        Team.competition_id == competition_id).group_by(Player.player_id, drop_day)
+    if day:
+        start, end = db.day_range(day)
+        query = query.where(Drop.date >= start, Drop.date < end)
+    async with db.engine.connect() as connection:
+        counts: list[PlayerDay] = [PlayerDay(rsn, team, date.fromisoformat(drop_day), drops)
+                                   for rsn, team, drop_day, drops in (await connection.execute(query)).all()]
+    return sorted(counts, key=lambda count: (count.day, -count.drops, count.rsn))
+
+
+async def common_items(competition_id: int, limit: int = 25) -> list[ItemCount]:
+    """Counts the drops per item. Identical messages are counted by SQLite, so the names are only parsed once per
+    distinct message."""
+    import database as db
+    query: Select = select(Drop.message, func.count()).join(Drop.player).join(Player.team).where(
+        Team.competition_id == competition_id).group_by(Drop.message)
+    items: Counter[str] = Counter()
+    async with db.engine.connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=CHUNK_SIZE))
+        async for partition in result.partitions():
+            for message, drops in partition:
+                items[item_name(message)] += drops
+    return [ItemCount(item, drops) for item, drops in items.most_common(limit)]
+
+
+async def completion_times(competition_id: int, day: date) -> list[TaskCompletion]:
+    """Returns how long after the start of `day` every team completed each of its tasks, or None for the tasks a
+    team hasn't completed. The day's drops are streamed in order, matching every distinct message once."""
+    import database as db
+    async with db.Session() as session:
+        snapshot: Snapshot = await db.get_snapshot(session)
+    day_object: DaySnapshot | None = snapshot.days.get((competition_id, day))
+    if day_object is None:
+        return []
+    teams: dict[int, str] = {team.team_id: team.name for team in snapshot.competition_teams(competition_id)}
+    day_matcher: matcher.DayMatcher = matcher.get_matcher(day_object)
+    start, end = db.day_range(day)
+    query: Select = select(Player.team_id, Drop.message, Drop.date).join(Drop.player).join(Player.team).where(
+        Team.competition_id == competition_id, Drop.date >= start, Drop.date < end).order_by(Drop.date)
+    required: dict[int, int] = {task.task_id: task.number_required for task in day_object.tasks}
+    matches: dict[str, list[int]] = {}
+    counts: Counter[tuple[int, int]] = Counter()
+    completed: dict[tuple[int, int], float] = {}
+    async with db.engine.connect() as connection:
+        result = await connection.stream(query.execution_options(yield_per=CHUNK_SIZE))
+        async for partition in result.partitions():
+            for team_id, message, drop_date in partition:
+                if message not in matches:
+                    matches[message] = day_matcher.matches(message)
+                for task_id in matches[message]:
+                    counts[(team_id, task_id)] += 1
+                    if counts[(team_id, task_id)] == required[task_id]:
+                        completed[(team_id, task_id)] = (drop_date.replace(tzinfo=None) - start).total_seconds()
+    return [TaskCompletion(day, task.task_id, task.description, team_name, completed.get((team_id, task.task_id)))
+            for task in day_object.tasks for team_id, team_name in teams.items()]
+
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "not completed"
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports a competition, or prints its stats, straight from the "
+                                                 "database, without the bot running.")
+    parser.add_argument("--database", help="database to read (default: $DATABASE_PATH or the bot's database)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write the drops, tasks and teams to a zip of CSV files")
+    export_parser.add_argument("competition", type=int)
+    export_parser.add_argument("output")
+    stats_parser = subparsers.add_parser("stats", help="print drops per player, common items or completion times")
+    stats_parser.add_argument("competition", type=int)
+    stats_parser.add_argument("kind", choices=["players", "items", "completion"])
+    stats_parser.add_argument("--day", help="day in DD-mmm-YYYY, required for completion times")
+    args = parser.parse_args()
+    if args.database:
+        os.environ["DATABASE_PATH"] = args.database
+    day: date | None = datetime.strptime(args.day, DAY_FORMAT).date() if getattr(args, "day", None) else None
+
+    async def run():
+        import database as db
+        if args.command == "export":
+            with open(args.output, "wb") as file:
+                rows: dict[str, int] = await export(args.competition, file)
+            print(", ".join(f"{count} {table} rows" for table, count in rows.items()) + f" written to {args.output}")
+        elif args.kind == "players":
+            for count in await drops_per_player(args.competition, day):
+                print(f"{count.day.strftime(DAY_FORMAT)}\t{count.rsn}\t{count.team}\t{count.drops}")
+        elif args.kind == "items":
+            for count in await common_items(args.competition):
+                print(f"{count.drops}\t{count.item}")
+        else:
+            for completion in await completion_times(args.competition,
+                                                     day or datetime.now(timezone.utc).date()):
+                print(f"{completion.task_id}\t{completion.description}\t{completion.team}\t"
+                      f"{format_duration(completion.seconds)}")
+        await db.engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,561 @@
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime, time as day_time, timedelta, timezone
+
+import discord
+from discord import app_commands
+from discord.ext import tasks
+import autocomplete
+import cache
+import database as db
+from dispatcher import NotificationDispatcher, notification_embed
+import rollover
+import metrics
+import runemetrics
+from response_cache import ResponseCache
+from scheduler import PollScheduler
+from constants import DAY_FORMAT, DATETIME_FORMAT
+from structures import Progress, DropNotification
+
+# Optional: claims a competition for this guild on startup, e.g. the one of a database from before competitions
+guild_id = os.environ.get("GUILD_ID")
+channel_id = os.environ.get("CHANNEL_ID")
+poll_concurrency = int(os.environ.get("POLL_CONCURRENCY", 10))
+poll_budget = int(os.environ.get("POLL_BUDGET", 500))
+# 0 polls in the bot's own process, more shards the polling and matching across that many worker processes
+poll_workers = int(os.environ.get("POLL_WORKERS", 0))
+# Records the event logs of every tick, so they can be replayed offline with replay.py
+record_ticks = os.environ.get("RECORD_TICKS")
+if record_ticks and poll_workers:
+    # The workers match the logs where they fetch them, the bot's process never sees them to record them
+    raise ValueError("RECORD_TICKS only records polls made in the bot's process, it can't be used with POLL_WORKERS")
+metrics_port = os.environ.get("METRICS_PORT")
+# Accepts drops pushed by clients on http://127.0.0.1:<port>/drops, alongside polling
+ingest_port = os.environ.get("INGEST_PORT")
+intents = discord.Intents.default()
+intents.message_content = True
+bot = discord.Client(command_prefix='.', intents=intents)
+
+
+class InstrumentedCommandTree(app_commands.CommandTree):
+    async def interaction_check(self, interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        if interaction.command in competition_commands:
+            competition = await db.get_competition(interaction.guild_id)
+            if competition is None:
+                # Suggestions can't be answered with a message
+                if interaction.type is not discord.InteractionType.autocomplete:
+                    await interaction.response.send_message("There is no competition running in this server",
+                                                            ephemeral=True)
+                return False
+            interaction.extras["competition_id"] = competition.competition_id
+        return True
+
+    async def on_error(self, interaction, error):
+        if interaction.command:
+            metrics.record_error(f"command.{interaction.command.name}")
+        await super().on_error(interaction, error)
+
+
+tree = InstrumentedCommandTree(bot)
+dispatcher = NotificationDispatcher(rate=1, capacity=5)
+response_cache = ResponseCache("database/response_cache.json", int(os.environ.get("RESPONSE_CACHE_SIZE", 5000)))
+# Even idle players are polled at least every half hour, so a late drop is still seen before the day rolls over
+scheduler = PollScheduler(base_interval=timedelta(minutes=5), max_interval=timedelta(minutes=30),
+                          idle_after=timedelta(minutes=30), budget=poll_budget)
+# Created in setup_hook, their modules are only imported when they are enabled
+worker_pool = None
+recorder = None
+ingest_server = None
+# Registered in the guild of every competition rather than globally, see register_guild
+competition_commands: list[app_commands.Command] = []
+
+
+def competition_command(name: str, description: str):
+    def decorator(callback):
+        command = app_commands.command(name=name, description=description)(callback)
+        competition_commands.append(command)
+        return command
+    return decorator
+
+
+@tasks.loop(minutes=5)
+async def send_update():
+    print("Beginning periodic update")
+    started: float = time.perf_counter()
+    current_day: date = datetime.now(timezone.utc).date()
+    players = await db.get_polled_players()
+    now: datetime = datetime.now(timezone.utc)
+    scheduler.sync(players, now)
+    await submit_notifications(await poll(scheduler.due(now), current_day, now))
+    downloaded, cpu_saved, skipped = response_cache.commit()
+    print(f"Downloaded {downloaded} bytes, skipped {skipped} unchanged profiles saving {cpu_saved * 1000:.1f}ms CPU")
+    metrics.observe("update.tick", time.perf_counter() - started)
+    await response_cache.save_if_due()
+    await rollover.prepare(current_day + timedelta(days=1))
+    print("Finished periodic update")
+
+
+async def poll(rsns: list[str], current_day: date, now: datetime) -> list[DropNotification]:
+    """Fetches the event logs of the given players and stores their new drops. Returns the notifications of
+    the drops found on `current_day`."""
+    if worker_pool:
+        from workers import ShardResult
+        with metrics.span("update.poll"):
+            result: ShardResult = await worker_pool.poll(await db.get_player_cursors(rsns), await db.get_days(),
+                                                         response_cache)
+        for rsn, head in result.heads.items():
+            scheduler.record(rsn, head, now)
+        notifications, _ = await db.apply_drop_records(current_day, result.drops, result.entries)
+        return notifications
+    with metrics.span("update.poll"):
+        event_logs, unchanged = await runemetrics.get_event_logs(rsns, poll_concurrency, await db.get_cursors(),
+                                                                 response_cache)
+    for rsn, event_log in event_logs.items():
+        scheduler.record(rsn, event_log, now)
+    changed_logs = {rsn: event_log for rsn, event_log in event_logs.items() if rsn not in unchanged}
+    if recorder:
+        recorder.record(now, changed_logs)
+    return await db.periodic_update(current_day, changed_logs)
+
+
+async def final_poll(closing_day: date):
+    """Polls every player, due or not, before `closing_day` is closed."""
+    await submit_notifications(await poll(list(await db.get_polled_players()), closing_day,
+                                          datetime.now(timezone.utc)))
+
+
+@tasks.loop(time=day_time(tzinfo=timezone.utc))
+async def roll_over_days():
+    await start_new_days(rollover.rollover_day(datetime.now(timezone.utc)))
+
+
+async def start_new_days(current_day: date):
+    await rollover.start_new_days(current_day, get_channel, final_poll)
+
+
+async def get_channel(channel_id: int) -> discord.abc.Messageable:
+    return bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+
+
+async def submit_notifications(notifications: list[DropNotification]):
+    """Queues the notifications for the channel of their competition."""
+    by_competition: dict[int, list[DropNotification]] = {}
+    for notification in notifications:
+        by_competition.setdefault(notification.competition_id, []).append(notification)
+    competitions = {competition.competition_id: competition for competition in await db.get_competitions()}
+    for competition_id, competition_notifications in by_competition.items():
+        competition = competitions.get(competition_id)
+        if competition is None or competition.channel_id is None:
+            continue
+        dispatcher.submit(await get_channel(competition.channel_id), competition_notifications)
+
+
+@tasks.loop(minutes=30)
+async def checkpoint_database():
+    await db.checkpoint()
+
+
+async def rsn_choices(interaction, current: str) -> list[app_commands.Choice[str]]:
+    index = autocomplete.roster_index(await db.get_roster(), interaction.extras["competition_id"])
+    return [app_commands.Choice(name=name, value=value) for name, value in index.rsns.search(current)]
+
+
+async def team_choices(interaction, current: str) -> list[app_commands.Choice[str]]:
+    index = autocomplete.roster_index(await db.get_roster(), interaction.extras["competition_id"])
+    return [app_commands.Choice(name=name, value=value) for name, value in index.teams.search(current)]
+
+
+async def drop_choices(interaction, current: str) -> list[app_commands.Choice[str]]:
+    competition_id: int = interaction.extras["competition_id"]
+    index = autocomplete.cached_drop_index(competition_id)
+    if index is None:
+        version: int = cache.drops.version
+        index = autocomplete.drop_index(competition_id, version, await db.get_recent_drops(competition_id))
+    entries: list[tuple[str, str]] = index.drops.search(current) if current else index.recent
+    return [app_commands.Choice(name=name, value=value) for name, value in entries]
+
+
+async def send_ephemeral_response(interaction, error, success):
+    response = error if error else success
+    await interaction.send_message(response, ephemeral=True)
+
+
+@tree.command(name="start-competition", description="Start a competition in this server")
+@app_commands.describe(name="Name of the competition")
+@app_commands.default_permissions(administrator=True)
+@app_commands.guild_only()
+async def start_competition(interaction, name: str):
+    await interaction.response.defer(ephemeral=True)
+    error = await db.start_competition(name, interaction.guild_id, interaction.channel_id)
+    if not error:
+        await register_guild(interaction.guild_id)
+        await start_new_days(datetime.now(timezone.utc).date())
+    await interaction.followup.send(error if error else f"Started {name}, drops will be posted in this channel.",
+                                    ephemeral=True)
+
+
+@competition_command(name="add-team", description="Add a Team")
+@app_commands.describe(team_name="Name of the new team")
+async def add_team(interaction, team_name: str):
+    error = await db.add_team(interaction.extras["competition_id"], team_name)
+    await send_ephemeral_response(interaction.response, error, f"Successfully added team {team_name}.")
+
+
+@competition_command(name="rename-team", description="Rename a Team")
+@app_commands.describe(old_name="Old name of the team")
+@app_commands.describe(new_name="New name of the team")
+@app_commands.autocomplete(old_name=team_choices)
+async def rename_team(interaction, old_name: str, new_name: str):
+    error = await db.rename_team(interaction.extras["competition_id"], old_name, new_name)
+    await send_ephemeral_response(interaction.response, error, f"Successfully renamed team {old_name} to {new_name}.")
+
+
+@competition_command(name="add-player", description="Add a Player")
+@app_commands.describe(rsn="RSN of the player")
+@app_commands.describe(team_name="Name of the Team to add this player to")
+@app_commands.autocomplete(team_name=team_choices)
+async def add_player(interaction, rsn: str, team_name: str):
+    error = await db.add_player(interaction.extras["competition_id"], rsn, team_name)
+    await send_ephemeral_response(interaction.response, error, f"{rsn} added to {team_name}.")
+
+
+@competition_command(name="change-rsn", description="Change a Player's RSN")
+@app_commands.describe(old_rsn="old RSN of the player")
+@app_commands.describe(new_rsn="new RSN of the player")
+@app_commands.autocomplete(old_rsn=rsn_choices)
+async def change_rsn(interaction, old_rsn: str, new_rsn: str):
+    error = await db.change_rsn(interaction.extras["competition_id"], old_rsn, new_rsn)
+    await send_ephemeral_response(interaction.response, error, f"RSN {old_rsn} updated to be {new_rsn}.")
+
+
+@competition_command(name="list-teams", description="List teams currently competing")
+async def list_teams(interaction):
+    await interaction.response.defer()
+    teams = await db.list_teams(interaction.extras["competition_id"])
+    embed = discord.Embed(title=f"__**Competitors:**__", color=0x03f8fc)
+    for team_name, members in teams.items():
+        embed.add_field(name=f'**{team_name}**', value=members, inline=True)
+    await interaction.followup.send(embed=embed)
+
+
+@competition_command(name="add-task", description="Add a task")
+@app_commands.describe(day="Day to add this task to in DD-mmm-YYYY (e.g. 01-Jan-1970)")
+@app_commands.describe(description="Human readable task description (this is shown to the players)")
+@app_commands.describe(regex_search="Regex search string (this is only used internally)")
+@app_commands.describe(number_required="Number of items of this category required")
+async def add_task(interaction, day: str, description: str, regex_search: str, number_required: int):
+    # Profiling the regex can take a few seconds
+    await interaction.response.defer(ephemeral=True)
+    date_object: date = datetime.strptime(day, DAY_FORMAT).date()
+    error, warning = await db.add_task(interaction.extras["competition_id"], date_object, description, regex_search,
+                                       number_required)
+    success: str = f"Successfully added task to {day}." + (f"\n{warning}" if warning else "")
+    await interaction.followup.send(error if error else success, ephemeral=True)
+
+
+@competition_command(name="edit-task", description="Edit a task")
+@app_commands.describe(identifier="ID of the task (can be found with /admin-day-view)")
+@app_commands.describe(description="Human readable task description (this is shown to the players)")
+@app_commands.describe(regex_search="Regex search string (this is only used internally)")
+@app_commands.describe(number_required="Number of items of this category required")
+async def edit_task(interaction, identifier: int, description: str = None, regex_search: str = None,
+                    number_required: int = None):
+    await interaction.response.defer(ephemeral=True)
+    error, warning = await db.edit_task(interaction.extras["competition_id"], identifier, description, regex_search,
+                                        number_required)
+    success: str = f"Successfully updated task {identifier}." + (f"\n{warning}" if warning else "")
+    await interaction.followup.send(error if error else success, ephemeral=True)
+
+
+@competition_command(name="remove-task", description="Remove a task")
+@app_commands.describe(identifier="ID of the task (can be found with /admin-day-view)")
+async def remove_task(interaction, identifier: int):
+    error = await db.remove_task(interaction.extras["competition_id"], identifier)
+    await send_ephemeral_response(interaction.response, error, f"Successfully removed {identifier}")
+
+
+@competition_command(name="rebuild-progress", description="Recompute task progress from the registered drops")
+@app_commands.describe(day="Day to recompute in DD-mmm-YYYY (e.g. 01-Jan-1970) - defaults to every day")
+async def rebuild_progress(interaction, day: str = None):
+    await interaction.response.defer(ephemeral=True)
+    date_object: date = datetime.strptime(day, DAY_FORMAT).date() if day else None
+    error = await db.rebuild_progress(interaction.extras["competition_id"], date_object)
+    await interaction.followup.send(error if error else "Successfully rebuilt progress.", ephemeral=True)
+
+
+@competition_command(name="set-password", description="Set the password for the given day")
+@app_commands.describe(day="Day to change password for in DD-mmm-YYYY (e.g. 01-Jan-1970)")
+@app_commands.describe(password="the password to set")
+async def set_password(interaction, day: str, password: str):
+    date_object: date = datetime.strptime(day, DAY_FORMAT).date()
+    error: str = await db.set_password(interaction.extras["competition_id"], date_object, password)
+    await send_ephemeral_response(interaction.response, error,
+                                  f"Successfully changed password for {day} to {password}.")
+
+
+@competition_command(name="set-all-required", description="Set all tasks required for a day")
+@app_commands.describe(day="Day to change requirement for in DD-mmm-YYYY (e.g. 01-Jan-1970)")
+@app_commands.describe(all_required="true if all are required")
+async def set_all_required(interaction, day: str, all_required: bool):
+    date_object: date = datetime.strptime(day, DAY_FORMAT).date()
+    error = await db.change_all_required(interaction.extras["competition_id"], date_object, all_required)
+    await send_ephemeral_response(interaction.response, error,
+                                  f"Successfully changed all required for {day} to {bool}.")
+
+
+@competition_command(name="admin-day-view", description="Admin view for a day")
+@app_commands.describe(day="Day to query in DD-mmm-YYYY (e.g. 01-Jan-1970)")
+async def admin_day_view(interaction, day: str = None):
+    if not day:
+        day: date = datetime.now(timezone.utc).date()
+    else:
+        day: date = datetime.strptime(day, DAY_FORMAT).date()
+    error, required, password, table = await db.admin_day_view(interaction.extras["competition_id"], day)
+    if error is None:
+        embed = discord.Embed(title=f"__**{day}**__", color=0x03f8fc)
+        embed.add_field(name=f'**All Required**', value=required, inline=False)
+        for task in table:
+            content = f"Description: {task[1]}\nRequired: {task[2]}\nRegex: `{task[3]}`\nMatch cost: {task[4]}"
+            embed.add_field(name=f'**Task {task[0]}**', value=content, inline=False)
+        embed.add_field(name=f'**Password**', value=password, inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+    else:
+        await send_ephemeral_response(interaction.response, error, "")
+
+
+@competition_command(name="cache-stats", description="Show roster cache statistics")
+async def cache_stats(interaction):
+    lookups: int = cache.roster.hits + cache.roster.misses
+    hit_rate: float = cache.roster.hits / lookups * 100 if lookups else 0
+    await send_ephemeral_response(interaction.response, None,
+                                  f"Version {cache.roster.version}: {cache.roster.hits} hits, {cache.roster.misses} "
+                                  f"misses ({hit_rate:.1f}% hit rate)")
+
+
+@competition_command(name="bot-stats", description="Show timings of the bot's hot paths")
+async def bot_stats(interaction):
+    embed = discord.Embed(title=f"__**Bot stats**__", color=0x03f8fc)
+    for name, hist in metrics.summary()[:25]:
+        content: str = (f"p50 {hist.quantile(0.5) * 1000:.0f}ms, p95 {hist.quantile(0.95) * 1000:.0f}ms, "
+                        f"p99 {hist.quantile(0.99) * 1000:.0f}ms\n{hist.count} calls, {hist.errors} errors")
+        embed.add_field(name=f'**{name}**', value=content, inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@competition_command(name="poll-schedule", description="Show when players are next polled")
+async def poll_schedule(interaction):
+    now: datetime = datetime.now(timezone.utc)
+    queue = scheduler.queue()
+    lines: list[str] = [f"Tracking {len(queue)} players, {scheduler.requests_last_hour(now)} requests in the last hour"]
+    for schedule in queue[:20]:
+        due_in: int = max(0, int((schedule.next_due - now).total_seconds() // 60))
+        lines.append(f"{schedule.rsn} - due in {due_in} min (every {int(schedule.interval.total_seconds() // 60)} min)")
+    await send_ephemeral_response(interaction.response, None, "\n".join(lines))
+
+
+@competition_command(name="register-drop", description="Register a drop manually")
+@app_commands.describe(rsn="Name of the player who got the drop")
+@app_commands.describe(message="Drop message")
+@app_commands.describe(timestamp="Timestamp for drop in DD-mmm-YYYY HH-MM (e.g. 01-Jan-1970 00:00)")
+@app_commands.autocomplete(rsn=rsn_choices)
+async def register_drop(interaction, rsn: str, message: str, timestamp: str):
+    error, notification = await db.add_drop(interaction.extras["competition_id"], rsn, message,
+                                               datetime.strptime(timestamp, DATETIME_FORMAT))
+    if notification:
+        await interaction.response.send_message(embed=notification_embed([notification]))
+    else:
+        await send_ephemeral_response(interaction.response, error, "successfully registered drop")
+
+
+@competition_command(name="delete-drop", description="Delete a drop")
+@app_commands.describe(identifier="identifier of drop to delete")
+@app_commands.autocomplete(identifier=drop_choices)
+async def register_drop(interaction, identifier: str):
+    error = await db.delete_drop(interaction.extras["competition_id"], identifier)
+    await send_ephemeral_response(interaction.response, error, "successfully deleted drop")
+
+
+@competition_command(name="leaderboard", description="Show the standings across all days so far")
+async def leaderboard(interaction):
+    from rendering import field_pages, send_pages
+    await interaction.response.defer()
+    fields: list[tuple[str, str]] = [
+        (f'**{rank}. {standing.team}**',
+         f'{standing.lives * '❤️'}\n{standing.days_completed}/{standing.days_played} days completed, '
+         f'{standing.drops} drops')
+        for rank, standing in enumerate(await db.get_leaderboard(interaction.extras["competition_id"]), start=1)]
+    await send_pages(interaction.followup, field_pages("Leaderboard", fields))
+
+
+@competition_command(name="team-history", description="Show how a team did on every day so far")
+@app_commands.describe(team_name="Name of the team")
+async def team_history(interaction, team_name: str):
+    from rendering import field_pages, send_pages
+    await interaction.response.defer()
+    error, results = await db.get_team_history(interaction.extras["competition_id"], team_name)
+    if error:
+        await interaction.followup.send(error, ephemeral=True)
+        return
+    fields: list[tuple[str, str]] = []
+    for result in results:
+        check: str = '✅️' if result.all_completed else '❌'
+        lines: list[str] = [f'{task.description} - {task.completed}/{task.required}' for task in result.tasks]
+        lines.append(f'{result.drops} drops, {result.lives * '❤️'}')
+        fields.append((f'**{result.date.strftime(DAY_FORMAT)} - {check}**', "\n".join(lines)))
+    await send_pages(interaction.followup, field_pages(f"History of {team_name}", fields))
+
+
+@competition_command(name="export", description="Export the drops, tasks and teams as CSV files")
+@app_commands.default_permissions(administrator=True)
+async def export(interaction):
+    import analytics
+    import tempfile
+    await interaction.response.defer(ephemeral=True)
+    # Spills to disk past a few megabytes, a long competition can have far more drops than fit in memory comfortably
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as file:
+        rows: dict[str, int] = await analytics.export(interaction.extras["competition_id"], file)
+        if file.tell() > interaction.guild.filesize_limit:
+            await interaction.followup.send("The export is too large to upload, run `python analytics.py export` "
+                                            "on the bot's host instead", ephemeral=True)
+            return
+        file.seek(0)
+        await interaction.followup.send(", ".join(f"{count} {table} rows" for table, count in rows.items()),
+                                        file=discord.File(file, filename="export.zip"), ephemeral=True)
+
+
+@competition_command(name="stats", description="Show drops per player, the most common items or completion times")
+@app_commands.describe(kind="Which stats to show")
+@app_commands.describe(day="Day to query in DD-mmm-YYYY (e.g. 01-Jan-1970) - defaults to the current day")
+@app_commands.choices(kind=[app_commands.Choice(name="Drops per player", value="players"),
+                            app_commands.Choice(name="Most common items", value="items"),
+                            app_commands.Choice(name="Time to completion", value="completion")])
+async def stats(interaction, kind: str, day: str = None):
+    import analytics
+    from rendering import MAX_FIELD_CHARACTERS, field_pages, send_pages
+    await interaction.response.defer()
+    competition_id: int = interaction.extras["competition_id"]
+    try:
+        day: date = datetime.strptime(day, DAY_FORMAT).date() if day else datetime.now(timezone.utc).date()
+    except ValueError:
+        await interaction.followup.send("Invalid day format", ephemeral=True)
+        return
+    fields: list[tuple[str, str]] = []
+    if kind == "players":
+        by_team: dict[str, list[str]] = {}
+        for count in await analytics.drops_per_player(competition_id, day):
+            by_team.setdefault(count.team, []).append(f'{count.rsn} - {count.drops}')
+        fields = [(f'**{team}**', "\n".join(lines)[:MAX_FIELD_CHARACTERS]) for team, lines in by_team.items()]
+        title: str = f"Drops per player on {day}"
+    elif kind == "items":
+        counts = await analytics.common_items(competition_id)
+        fields = [(f'**{rank}. {count.item}**', f'{count.drops} drops') for rank, count in enumerate(counts, start=1)]
+        title = "Most common items"
+    else:
+        by_task: dict[tuple[int, str], list[str]] = {}
+        for completion in await analytics.completion_times(competition_id, day):
+            by_task.setdefault((completion.task_id, completion.description), []).append(
+                f'{completion.team} - {analytics.format_duration(completion.seconds)}')
+        fields = [(f'**{description}**', "\n".join(lines)[:MAX_FIELD_CHARACTERS])
+                  for (_, description), lines in by_task.items()]
+        title = f"Time to completion on {day}"
+    await send_pages(interaction.followup, field_pages(title, fields))
+
+
+@competition_command(name="check-progress", description="Check progress on a day")
+@app_commands.describe(day="Day to query in DD-mmm-YYYY (e.g. 01-Jan-1970) - defaults to the current day")
+async def check_progress(interaction, day: str = None):
+    from rendering import send_progress
+    await interaction.response.defer()
+    today: date = datetime.now(timezone.utc).date()
+    if not day:
+        day: date = today
+    else:
+        try:
+            day: date = datetime.strptime(day, DAY_FORMAT).date()
+        except:
+            await interaction.followup.send("Invalid day format", ephemeral=True)
+            return
+    if day > today:
+        await interaction.followup.send("You cannot check progress on future days", ephemeral=True)
+        return
+    progress: Progress = Progress()
+    error = await db.check_day(interaction.extras["competition_id"], day, progress)
+    if error:
+        await interaction.followup.send(error, ephemeral=True)
+    else:
+        await send_progress(interaction.followup, f"Current progress for {day}:", progress)
+
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    if "started" in interaction.extras:
+        metrics.observe(f"command.{command.name}", time.perf_counter() - interaction.extras["started"])
+
+
+@bot.event
+async def setup_hook():
+    # Runs once after login, unlike on_ready which fires again on every reconnect
+    global worker_pool, recorder, ingest_server
+    response_cache.load()
+    if poll_workers:
+        from workers import WorkerPool
+        worker_pool = WorkerPool(poll_workers, poll_concurrency)
+    if record_ticks:
+        from replay import Recorder
+        recorder = Recorder(record_ticks)
+    await db.create_schema()
+    if guild_id:
+        await db.claim_competition(int(guild_id), int(channel_id))
+    if metrics_port:
+        await metrics.start_server(int(metrics_port))
+    if ingest_port:
+        from ingest import IngestServer
+        ingest_server = IngestServer(submit_notifications)
+        await ingest_server.start(int(ingest_port))
+    await sync_commands(None)
+    for competition in await db.get_competitions():
+        if competition.guild_id is not None:
+            await register_guild(competition.guild_id)
+
+
+async def register_guild(guild: int):
+    """Makes the competition commands available in a guild that runs a competition."""
+    for command in competition_commands:
+        tree.add_command(command, guild=discord.Object(id=guild), override=True)
+    await sync_commands(discord.Object(id=guild))
+
+
+def command_payload(guild: discord.Object | None) -> str:
+    """The commands of a guild, or the global ones, as they are sent to Discord."""
+    return json.dumps([command.to_dict(tree) for command in tree.get_commands(guild=guild)], sort_keys=True)
+
+
+async def sync_commands(guild: discord.Object | None):
+    """Syncs the slash commands of a guild, or the global ones, with Discord, unless they are unchanged since the
+    last sync."""
+    command_hash: str = hashlib.sha256(command_payload(guild).encode()).hexdigest()
+    hash_path: str = f"database/command_hash_{guild.id}" if guild else "database/command_hash"
+    if os.path.exists(hash_path):
+        with open(hash_path) as file:
+            if file.read() == command_hash:
+                return
+    await tree.sync(guild=guild)
+    with open(hash_path, "w") as file:
+        file.write(command_hash)
+
+
+@bot.event
+async def on_ready():
+    print(f'We have logged in as {bot.user}')
+    dispatcher.start()
+    await start_new_days(datetime.now(timezone.utc).date())
+    if not roll_over_days.is_running():
+        roll_over_days.start()
+    if not send_update.is_running():
+        send_update.start()
+    if not checkpoint_database.is_running():
+        checkpoint_database.start()
+
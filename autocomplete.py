@@ -0,0 +1,79 @@
+from bisect import bisect_left
+from typing import Iterable, NamedTuple
+
+import cache
+from cache import Snapshot
+
+MAX_CHOICES = 25
+
+
+class PrefixIndex:
+    """Finds names by prefix, with a binary search over the sorted names, and then by any substring of three or
+    more characters, through the names that contain every trigram of it. Case is ignored."""
+
+    def __init__(self, names: Iterable[tuple[str, str]]):
+        # Pairs of what is shown and what is filled in, sorted on what is shown
+        self.entries: list[tuple[str, str]] = sorted(set(names), key=lambda entry: entry[0].lower())
+        self.keys: list[str] = [name.lower() for name, _ in self.entries]
+        self.trigrams: dict[str, list[int]] = {}
+        for i, key in enumerate(self.keys):
+            for trigram in {key[j:j + 3] for j in range(len(key) - 2)}:
+                self.trigrams.setdefault(trigram, []).append(i)
+
+    def search(self, query: str, limit: int = MAX_CHOICES) -> list[tuple[str, str]]:
+        query = query.lower()
+        found: list[int] = []
+        i: int = bisect_left(self.keys, query)
+        while i < len(self.keys) and len(found) < limit and self.keys[i].startswith(query):
+            found.append(i)
+            i += 1
+        if len(found) < limit and len(query) >= 3:
+            postings: list[list[int]] = sorted((self.trigrams.get(query[j:j + 3], []) for j in range(len(query) - 2)),
+                                               key=len)
+            candidates: set[int] = set(postings[0]).intersection(*postings[1:])
+            prefixed: set[int] = set(found)
+            matches: list[int] = sorted(i for i in candidates if i not in prefixed and query in self.keys[i])
+            found.extend(matches[:limit - len(found)])
+        return [self.entries[i] for i in found]
+
+
+class RosterIndex(NamedTuple):
+    version: int
+    rsns: PrefixIndex
+    teams: PrefixIndex
+
+
+class DropIndex(NamedTuple):
+    version: int
+    drops: PrefixIndex
+    # Newest first, suggested before anything is typed
+    recent: list[tuple[str, str]]
+
+
+_rosters: dict[int, RosterIndex] = {}
+_drops: dict[int, DropIndex] = {}
+
+
+def roster_index(snapshot: Snapshot, competition_id: int) -> RosterIndex:
+    """Returns the index of the competition's players and teams, rebuilding it if the roster changed since."""
+    index: RosterIndex | None = _rosters.get(competition_id)
+    if index is None or index.version != snapshot.version:
+        teams = snapshot.competition_teams(competition_id)
+        index = RosterIndex(snapshot.version, PrefixIndex((rsn, rsn) for team in teams for rsn in team.rsns),
+                            PrefixIndex((team.name, team.name) for team in teams))
+        _rosters[competition_id] = index
+    return index
+
+
+def drop_index(competition_id: int, version: int, recent_drops: list[tuple[int, str, str]]) -> DropIndex:
+    """Indexes recent drops by ID, RSN and message, for the drops version from before they were loaded."""
+    entries: list[tuple[str, str]] = [(f"{drop_id} - {rsn}: {message}"[:100], str(drop_id))
+                                      for drop_id, rsn, message in recent_drops]
+    index = DropIndex(version, PrefixIndex(entries), entries[:MAX_CHOICES])
+    _drops[competition_id] = index
+    return index
+
+
+def cached_drop_index(competition_id: int) -> DropIndex | None:
+    index: DropIndex | None = _drops.get(competition_id)
+    return index if index is not None and index.version == cache.drops.version else None
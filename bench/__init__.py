@@ -0,0 +1,2 @@
+# The benchmarks run against the scratch database of the tests, never the bot's
+import tests
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import os
+import tempfile
+from datetime import date, timedelta
+
+import analytics
+import database as db
+from bench.support import best_of, print_table, seed
+from tests.support import reset_database
+
+START = date(2024, 5, 1)
+
+
+async def run(drops: int, days: int, players: int, team_size: int, runs: int) -> list[list]:
+    await reset_database()
+    competition_days: list[date] = [START + timedelta(days=i) for i in range(days)]
+    print(f"Seeding {days} days of {drops // days:,} drops")
+    competition_id: int = await seed(players, team_size, competition_days, drops // days)
+    stored: int = drops // days * days
+    day: date = competition_days[-1]
+    sizes: list[int] = []
+
+    async def export():
+        with tempfile.TemporaryFile() as file:
+            rows: dict[str, int] = await analytics.export(competition_id, file)
+            if rows["drop"] != stored:
+                raise AssertionError(f"{rows['drop']} of the {stored} drops were exported")
+            sizes.append(file.tell())
+
+    # Drops read by each, to report how fast they get through them
+    queries: dict = {
+        "export": (export, stored),
+        "drops_per_player": (lambda: analytics.drops_per_player(competition_id), stored),
+        "drops_per_player, one day": (lambda: analytics.drops_per_player(competition_id, day), stored // days),
+        "common_items": (lambda: analytics.common_items(competition_id), stored),
+        "completion_times": (lambda: analytics.completion_times(competition_id, day), stored // days),
+    }
+    rows: list[list] = []
+    for name, (query, read) in queries.items():
+        seconds: float = await best_of(runs, query)
+        rows.append([name, f"{read:,}", seconds, read / seconds])
+    print(f"The export is {sizes[-1] / 1024 / 1024:.1f} MiB, the database "
+          f"{os.path.getsize(db.database_path) / 1024 / 1024:.1f} MiB")
+    await db.engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the analytics export and stats over a seeded competition, "
+                                                 "and reports how many drops they go through per second.")
+    parser.add_argument("--drops", type=int, default=1000000, help="drops over the whole competition")
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    rows: list[list] = asyncio.run(run(args.drops, args.days, args.players, args.team_size, args.runs))
+    print_table(["query", "drops", "s", "drops/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import random
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+import database as db
+import matcher
+from bench.support import ITEMS, best_of, print_table, seed
+from cache import DaySnapshot, Snapshot
+from models import Drop, LastEntry, Player, TeamTaskProgress
+from workers import DropRecord, EntryRecord
+from tests.support import reset_database
+
+DAY = date(2024, 5, 1)
+
+
+def tick(players: int, drops_per_player: int, day: DaySnapshot, seed: int = 0
+         ) -> (list[DropRecord], list[EntryRecord]):
+    """What the pollers hand over after a tick in which every player found `drops_per_player` things."""
+    rng: random.Random = random.Random(seed)
+    start: datetime = datetime.combine(DAY, datetime.min.time(), timezone.utc)
+    day_matcher: matcher.DayMatcher = matcher.DayMatcher(day.tasks)
+    drops: list[DropRecord] = []
+    entries: list[EntryRecord] = []
+    for player_id in range(1, players + 1):
+        for i in range(drops_per_player):
+            message: str = f"I found {rng.choice(ITEMS)}"
+            drops.append(DropRecord(player_id, message, start + timedelta(seconds=rng.randrange(86400)),
+                                    f"{player_id}:{i}", tuple(day_matcher.matches(message))))
+        entries.append(EntryRecord(player_id, "01-May-2024 23:59", f"{player_id}:0"))
+    return drops, entries
+
+
+async def orm_apply(current_day: date, drops: list[DropRecord], entries: list[EntryRecord]):
+    """The write stage before the bulk statements, as process_player did it: a SELECT to load or create every
+    cursor, one for the player's known dedupe keys, and every drop and progress counter added to one big unit
+    of work."""
+    async with db.Session() as session:
+        snapshot: Snapshot = await db.get_snapshot(session)
+        players: dict[int, Player] = {player.player_id: player
+                                      for player in (await session.scalars(select(Player))).all()}
+        by_player: dict[int, list[DropRecord]] = {}
+        for drop in drops:
+            by_player.setdefault(drop.player_id, []).append(drop)
+        for entry in entries:
+            player: Player = players[entry.player_id]
+            last_entry: LastEntry = (await session.scalars(
+                select(LastEntry).where(LastEntry.player_id == player.player_id))).one_or_none()
+            if not last_entry:
+                last_entry = LastEntry(player_id=player.player_id, date="")
+                session.add(last_entry)
+            last_entry.date, last_entry.seen = entry.date, entry.seen
+            player_drops: list[DropRecord] = by_player.get(entry.player_id, [])
+            existing: set[str] = set((await session.scalars(select(Drop.dedupe_key).where(
+                Drop.dedupe_key.in_([drop.dedupe_key for drop in player_drops])))).all())
+            for drop in player_drops:
+                if drop.dedupe_key in existing:
+                    continue
+                session.add(Drop(player_id=player.player_id, message=drop.message, date=drop.date,
+                                 dedupe_key=drop.dedupe_key))
+                day: DaySnapshot = snapshot.days.get((player.team.competition_id, drop.date.date()))
+                matched = await db.add_progress(session, day, player.team_id, set(drop.task_ids), 1)
+                if drop.date.date() == current_day:
+                    for task, completed in matched:
+                        db.drop_notification(player, drop.message, task, completed)
+        await session.commit()
+
+
+async def bulk_apply(current_day: date, drops: list[DropRecord], entries: list[EntryRecord]):
+    await db.apply_drop_records(current_day, drops, entries)
+
+
+async def stored() -> (int, dict[tuple[int, int], int]):
+    async with db.Session() as session:
+        drops: int = await session.scalar(select(func.count()).select_from(Drop))
+        progress = (await session.execute(select(TeamTaskProgress.team_id, TeamTaskProgress.task_id,
+                                                 TeamTaskProgress.completed))).all()
+    return drops, {(team_id, task_id): completed for team_id, task_id, completed in progress}
+
+
+async def run(players: int, team_size: int, sizes: list[int], runs: int) -> list[list]:
+    rows: list[list] = []
+    for drops_per_player in sizes:
+        row: list = [f"{players * drops_per_player:,}"]
+        results: list[tuple[int, dict]] = []
+        for apply in (orm_apply, bulk_apply):
+            best: float = float("inf")
+            for _ in range(runs):
+                # Every run writes the tick into a database that doesn't have it yet
+                await reset_database()
+                await seed(players, team_size, [DAY], 0)
+                async with db.Session() as session:
+                    day: DaySnapshot = (await db.get_snapshot(session)).days[(1, DAY)]
+                drops, entries = tick(players, drops_per_player, day)
+                best = min(best, await best_of(1, lambda: apply(DAY, drops, entries)))
+            results.append(await stored())
+            row += [best, len(drops) / best]
+        if results[0] != results[1]:
+            raise AssertionError("The ORM and the bulk path stored different drops or progress")
+        rows.append(row + [row[1] / row[3]])
+    await db.engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a tick's drops, cursors and progress through the ORM "
+                                                 "unit of work process_player used, and through the bulk "
+                                                 "statements of apply_drop_records, and reports rows per second.")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--drops-per-player", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    rows: list[list] = asyncio.run(run(args.players, args.team_size, args.drops_per_player, args.runs))
+    print_table(["drops", "ORM s", "ORM rows/s", "bulk s", "bulk rows/s", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+from datetime import date
+
+from sqlalchemy import String, func, select, type_coerce
+
+import database as db
+from bench.support import best_of, print_table, seed
+from cache import Snapshot
+from models import Drop, Player
+from structures import Progress
+from tests.support import reset_database
+
+DAY = date(2024, 5, 1)
+
+
+async def legacy_counts(competition_id: int, day: date) -> dict[tuple[int, int], int]:
+    """What check_day did before: a query per team and task, scanning the day's drops with a SQLite regexp on the
+    text of their date, loading every drop with its player."""
+    counts: dict[tuple[int, int], int] = {}
+    async with db.Session() as session:
+        snapshot: Snapshot = await db.get_snapshot(session)
+        for team in snapshot.competition_teams(competition_id):
+            for task in snapshot.days[(competition_id, day)].tasks:
+                drops = (await session.scalars(select(Drop).join(Drop.player).where(
+                    type_coerce(Drop.date, String).startswith(str(day)), Player.team_id == team.team_id,
+                    func.lower(Drop.message).regexp_match(task.regex_search)))).all()
+                counts[(team.team_id, task.task_id)] = len([drop.player.rsn for drop in drops])
+    return counts
+
+
+async def counts(competition_id: int, day: date) -> dict[tuple[int, int], int]:
+    async with db.Session() as session:
+        return await db.get_day_counters(session, competition_id, day)
+
+
+async def run(sizes: list[int], players: int, team_size: int, legacy_limit: int, runs: int) -> list[list]:
+    rows: list[list] = []
+    for size in sizes:
+        await reset_database()
+        competition_id: int = await seed(players, team_size, [DAY], size)
+        check: float = await best_of(runs, lambda: db.check_day(competition_id, DAY, Progress()))
+        rebuild: float = await best_of(1, lambda: db.rebuild_progress(competition_id, DAY))
+        legacy: float | str = "skipped"
+        if size <= legacy_limit:
+            expected: dict[tuple[int, int], int] = await legacy_counts(competition_id, DAY)
+            if {key: count for key, count in expected.items() if count} != await counts(competition_id, DAY):
+                raise AssertionError(f"Progress at {size} drops differs from the per-team and task queries")
+            legacy = await best_of(runs, lambda: legacy_counts(competition_id, DAY))
+        rows.append([f"{size:,}", check, rebuild, legacy])
+    await db.engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times /check-progress, and rebuilding a day's progress from its "
+                                                 "drops, on a day with a growing number of drops, against a query "
+                                                 "per team and task like check_day used to run.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--legacy-limit", type=int, default=100000,
+                        help="largest day to time the old queries on, they take minutes on a million drops")
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    rows: list[list] = asyncio.run(run(args.sizes, args.players, args.team_size, args.legacy_limit, args.runs))
+    print_table(["drops", "check_day s", "rebuild s", "per team/task queries s"], rows)
+
+
+if __name__ == "__main__":
+    main()
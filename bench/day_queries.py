@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import String, event, func, select, Select, type_coerce
+
+import analytics
+import database as db
+from bench.support import best_of, print_table, seed
+from models import Drop, Player, Team
+from structures import Progress
+from tests.support import reset_database
+
+SEASON_STARTS: list[date] = [date(2023, 1, 2), date(2023, 6, 5), date(2024, 1, 8)]
+
+
+async def legacy_count_day_messages(competition_id: int, day: date) -> list[tuple[int, str, int]]:
+    """count_day_messages with the filter the day queries used before, on the text of the date, which SQLite can't
+    answer from an index."""
+    query: Select = select(Player.team_id, Drop.message, func.count()).join(Drop.player).join(Player.team).where(
+        Team.competition_id == competition_id, type_coerce(Drop.date, String).startswith(str(day))).group_by(
+        Player.team_id, Drop.message)
+    async with db.engine.connect() as connection:
+        return [tuple(row) for row in (await connection.execute(query)).all()]
+
+
+async def count_day_messages(competition_id: int, day: date) -> list[tuple[int, str, int]]:
+    async with db.Session() as session:
+        return await db.count_day_messages(session, competition_id, day)
+
+
+async def query_plans(competition_id: int, day: date) -> dict[str, list[str]]:
+    """Runs every day query once, recording the statements that read drops, and returns what SQLite plans to do
+    for each of them."""
+    statements: list[tuple[str, tuple]] = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if '"drop"' in statement and statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    queries: dict = {
+        "check_day": lambda: db.check_day(competition_id, day, Progress()),
+        "count_day_messages": lambda: count_day_messages(competition_id, day),
+        "drops_per_player": lambda: analytics.drops_per_player(competition_id, day),
+    }
+    plans: dict[str, list[str]] = {}
+    event.listen(db.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        for name, query in queries.items():
+            statements.clear()
+            await query()
+            async with db.engine.connect() as connection:
+                for statement, parameters in statements:
+                    rows = (await connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+                    plans.setdefault(name, []).extend(detail for *_, detail in rows)
+    finally:
+        event.remove(db.engine.sync_engine, "before_cursor_execute", record)
+    return plans
+
+
+async def run(seasons: int, days: int, drops_per_day: int, players: int, team_size: int, samples: int,
+              runs: int) -> (dict[str, list[str]], list[list]):
+    await reset_database()
+    season_days: list[date] = [start + timedelta(days=i) for start in SEASON_STARTS[:seasons] for i in range(days)]
+    print(f"Seeding {len(season_days)} days of {drops_per_day:,} drops")
+    competition_id: int = await seed(players, team_size, season_days, drops_per_day)
+    sampled: list[date] = random.Random(0).sample(season_days, min(samples, len(season_days)))
+    for day in sampled:
+        if sorted(await count_day_messages(competition_id, day)) != sorted(
+                await legacy_count_day_messages(competition_id, day)):
+            raise AssertionError(f"The range and the text filters count different drops on {day}")
+    plans: dict[str, list[str]] = await query_plans(competition_id, sampled[0])
+
+    async def each_day(query):
+        for day in sampled:
+            await query(competition_id, day)
+
+    rows: list[list] = [
+        ["count_day_messages, text filter", await best_of(runs, lambda: each_day(legacy_count_day_messages))],
+        ["count_day_messages, date range", await best_of(runs, lambda: each_day(count_day_messages))],
+        ["check_day", await best_of(runs, lambda: each_day(
+            lambda competition, day: db.check_day(competition, day, Progress())))],
+        ["drops_per_player of a day", await best_of(runs, lambda: each_day(analytics.drops_per_player))],
+    ]
+    await db.engine.dispose()
+    return plans, [[name, seconds, seconds / len(sampled) * 1000] for name, seconds in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeds a database with several seasons of drops, prints how "
+                                                 "SQLite plans the queries on a single day's drops, and times them "
+                                                 "against filtering on the text of the date like they used to.")
+    parser.add_argument("--seasons", type=int, default=3, choices=range(1, len(SEASON_STARTS) + 1))
+    parser.add_argument("--days", type=int, default=60, help="days per season")
+    parser.add_argument("--drops-per-day", type=int, default=3000)
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=20, help="days queried per run")
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    plans, rows = asyncio.run(run(args.seasons, args.days, args.drops_per_day, args.players, args.team_size,
+                                  args.samples, args.runs))
+    for name, details in plans.items():
+        print(f"{name}:")
+        for detail in details:
+            print(f"    {detail}")
+    print_table(["query", "total s", "per day ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+
+import database as db
+from bench.support import ITEMS, print_table, quantile, seed
+from ingest import IngestServer
+from models import Drop
+from tests.support import reset_database
+
+DAY = date(2024, 5, 1)
+
+
+def batches(players: int, size: int, seed: str):
+    """Endless batches of drops by random players at random moments of DAY, which are all but never sent twice."""
+    rng: random.Random = random.Random(seed)
+    start: datetime = datetime.combine(DAY, datetime.min.time(), timezone.utc)
+    while True:
+        yield {"events": [{"rsn": f"player {rng.randrange(players)}", "message": f"I found {rng.choice(ITEMS)}",
+                           "timestamp": (start + timedelta(seconds=rng.randrange(86400))).isoformat()}
+                          for _ in range(size)]}
+
+
+async def send(url: str, clients: int, players: int, size: int, seconds: float) -> (list[float], int, int):
+    """Has `clients` clients post one batch after another for `seconds`, and returns the latency of every batch
+    that was applied, how many were refused as the queue was full, and how many failed otherwise."""
+    import aiohttp
+    latencies: list[float] = []
+    statuses: list[int] = []
+    deadline: float = time.perf_counter() + seconds
+
+    async def client(session: aiohttp.ClientSession, i: int):
+        # Seeded apart from the clients of the other runs, whose batches were stored already
+        for batch in batches(players, size, f"{clients}:{i}"):
+            if time.perf_counter() >= deadline:
+                return
+            started: float = time.perf_counter()
+            async with session.post(url, json=batch) as response:
+                await response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                statuses.append(response.status)
+            if response.status == 503:
+                # The server asks for 5s, a client that kept at it would only measure how fast it refuses
+                await asyncio.sleep(0.1)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=clients)) as session:
+        await asyncio.gather(*(client(session, i) for i in range(clients)))
+    refused: int = statuses.count(503)
+    return latencies, refused, len(statuses) - refused
+
+
+def clients_process(url: str, clients: int, players: int, size: int, seconds: float, results):
+    """Runs in its own process, so the clients don't take the loop of the server they are measuring."""
+    results.put(asyncio.run(send(url, clients, players, size, seconds)))
+
+
+async def stored() -> int:
+    async with db.Session() as session:
+        return (await session.execute(select(func.count(Drop.drop_id)))).scalar()
+
+
+async def run(players: int, team_size: int, client_counts: list[int], size: int, seconds: float) -> list[list]:
+    await reset_database()
+    await seed(players, team_size, [DAY], 0)
+
+    async def notify(notifications):
+        pass
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port: int = probe.getsockname()[1]
+    server: IngestServer = IngestServer(notify)
+    await server.start(port)
+    context = multiprocessing.get_context("spawn")
+    rows: list[list] = []
+    try:
+        for clients in client_counts:
+            before: int = await stored()
+            results = context.Queue()
+            process: multiprocessing.Process = context.Process(target=clients_process, args=(
+                f"http://127.0.0.1:{port}/drops", clients, players, size, seconds, results), daemon=True)
+            process.start()
+            latencies, refused, failed = await asyncio.to_thread(results.get)
+            await asyncio.to_thread(process.join)
+            accepted: int = await stored() - before
+            rows.append([clients, len(latencies) * size / seconds, accepted / seconds, refused, failed,
+                         quantile(latencies, 0.5) * 1000, quantile(latencies, 0.99) * 1000])
+    finally:
+        server.consumer.cancel()
+        await server.runner.cleanup()
+        await db.engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Has concurrent clients post batches of drop events to the ingest "
+                                                 "server, and reports how many events per second it sustains.")
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch-size", type=int, default=100, help="events per batch")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long every client count posts for")
+    args = parser.parse_args()
+    rows: list[list] = asyncio.run(run(args.players, args.team_size, args.clients, args.batch_size, args.seconds))
+    print_table(["clients", "events/s", "stored/s", "refused", "failed", "p50 ms", "p99 ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Coroutine
+
+import database as db
+from bench.support import ITEMS, print_table, quantile, seed
+from structures import Progress
+from tests.support import reset_database
+
+DAY = date(2024, 5, 1)
+HEARTBEAT = 0.01
+
+
+class BlockingDatabase:
+    """Runs every database call to completion on a loop of its own, holding up the caller's loop meanwhile, the
+    way the synchronous layer did before the data layer was made async."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine: Coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self.run(db.engine.dispose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def interactions(competition_id: int, players: int, seed: int = 0) -> list[Callable[[], Coroutine]]:
+    """The commands people use during a competition, weighted towards the ones that only read."""
+    rng: random.Random = random.Random(seed)
+    start: datetime = datetime.combine(DAY, datetime.min.time(), timezone.utc)
+
+    def add_drop():
+        return db.add_drop(competition_id, f"player {rng.randrange(players)}", f"I found {rng.choice(ITEMS)}",
+                           start + timedelta(seconds=rng.randrange(86400)))
+
+    return [lambda: db.check_day(competition_id, DAY, Progress()), lambda: db.list_teams(competition_id),
+            lambda: db.get_leaderboard(competition_id), lambda: db.list_teams(competition_id), add_drop]
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event):
+    # Stands in for the gateway heartbeat, which is late by as long as the loop is held up
+    while not stop.is_set():
+        expected: float = time.perf_counter() + HEARTBEAT
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+async def load(competition_id: int, players: int, users: int, per_user: int,
+               call: Callable[[Callable[[], Coroutine]], Awaitable]) -> (list[float], list[float], int):
+    """Has `users` people run `per_user` commands each, all at once, and returns the latency of every command, how
+    late each heartbeat was, and how many commands failed."""
+    latencies: list[float] = []
+    lags: list[float] = []
+    failures: list[Exception] = []
+
+    async def user(i: int):
+        commands: list[Callable[[], Coroutine]] = interactions(competition_id, players, i)
+        rng: random.Random = random.Random(i)
+        for _ in range(per_user):
+            # Timed from when the interaction arrives, a loop that is held up delays it before it even starts
+            delay: float = rng.random() * 0.05
+            arrived: float = time.perf_counter() + delay
+            await asyncio.sleep(delay)
+            try:
+                await call(rng.choice(commands))
+            except Exception as e:
+                # A write that waited on the database for longer than its busy timeout
+                failures.append(e)
+            latencies.append(time.perf_counter() - arrived)
+
+    # The caches and compiled patterns are loaded before anything is timed
+    for command in interactions(competition_id, players, users):
+        await call(command)
+    stop: asyncio.Event = asyncio.Event()
+    beating: asyncio.Task = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.gather(*(user(i) for i in range(users)))
+    stop.set()
+    await beating
+    if failures:
+        print(f"{len(failures)} interactions failed, the first with {failures[0]!r}")
+    return latencies, lags, len(failures)
+
+
+async def run(players: int, team_size: int, drops: int, users: int, per_user: int) -> list[list]:
+    await reset_database()
+    competition_id: int = await seed(players, team_size, [DAY], drops)
+    await db.engine.dispose()
+    rows: list[list] = []
+
+    async def awaited(command: Callable[[], Coroutine]):
+        return await command()
+
+    latencies, lags, failed = await load(competition_id, players, users, per_user, awaited)
+    rows.append(["async", len(latencies), failed, quantile(latencies, 0.5) * 1000, quantile(latencies, 0.99) * 1000,
+                 max(lags) * 1000])
+    # The pool's connections belong to the loop that opened them
+    await db.engine.dispose()
+    blocking: BlockingDatabase = BlockingDatabase()
+
+    async def blocked(command: Callable[[], Coroutine]):
+        return blocking.run(command())
+
+    try:
+        latencies, lags, failed = await load(competition_id, players, users, per_user, blocked)
+    finally:
+        blocking.close()
+    rows.append(["blocking", len(latencies), failed, quantile(latencies, 0.5) * 1000,
+                 quantile(latencies, 0.99) * 1000, max(lags) * 1000])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fires concurrent simulated interactions at the data layer and "
+                                                 "reports their latency, and how late a heartbeat on the same loop "
+                                                 "was, with the database awaited and with every call blocking the "
+                                                 "loop like the synchronous layer did.")
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--drops", type=int, default=10000, help="drops on the day that is checked")
+    parser.add_argument("--users", type=int, default=20, help="people running commands at the same time")
+    parser.add_argument("--per-user", type=int, default=50, help="commands each of them runs")
+    args = parser.parse_args()
+    rows: list[list] = asyncio.run(run(args.players, args.team_size, args.drops, args.users, args.per_user))
+    print_table(["database", "interactions", "failed", "p50 ms", "p99 ms", "max heartbeat lag ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import random
+import re
+import time
+
+import matcher
+from bench.support import ITEMS, messages, print_table
+from cache import TaskSnapshot
+
+WORDS: list[str] = ["dragon", "rune", "abyssal", "crystal", "bronze", "clue", "bones", "whip", "key", "dagger", "onyx"]
+
+
+def synthetic_tasks(count: int, seed: int = 0) -> list[TaskSnapshot]:
+    """Literal items, alternations and character classes, like the tasks admins write."""
+    rng: random.Random = random.Random(seed)
+    tasks: list[TaskSnapshot] = []
+    for task_id in range(1, count + 1):
+        kind: int = task_id % 3
+        if kind == 0:
+            regex: str = rng.choice(ITEMS).split(" ", 1)[1]
+        elif kind == 1:
+            regex = rf"(?:{rng.choice(WORDS)}|{rng.choice(WORDS)}) \w+"
+        else:
+            regex = rf"i found an? {rng.choice(WORDS)}[a-z ]*"
+        tasks.append(TaskSnapshot(task_id, f"Task {task_id}", re.escape(regex) if kind == 0 else regex, 1, None))
+    return tasks
+
+
+def search_loop(tasks: list[TaskSnapshot], corpus: list[str]) -> list[set[int]]:
+    # What process_player and add_drop did before: every task against every message
+    return [{task.task_id for task in tasks if re.search(task.regex_search, message.lower())} for message in corpus]
+
+
+def day_matcher(tasks: list[TaskSnapshot], corpus: list[str]) -> list[set[int]]:
+    compiled: matcher.DayMatcher = matcher.DayMatcher(tasks)
+    return [compiled.matches(message) for message in corpus]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares matching drops against a day's tasks with one re.search "
+                                                 "per task to matching them with a DayMatcher.")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    corpus: list[str] = messages(args.messages)
+    rows: list[list] = []
+    for count in args.tasks:
+        tasks: list[TaskSnapshot] = synthetic_tasks(count)
+        results: dict[str, list[set[int]]] = {}
+        seconds: dict[str, float] = {}
+        for name, function in (("re.search loop", search_loop), ("DayMatcher", day_matcher)):
+            seconds[name] = float("inf")
+            for _ in range(args.runs):
+                started: float = time.perf_counter()
+                results[name] = function(tasks, corpus)
+                seconds[name] = min(seconds[name], time.perf_counter() - started)
+        if results["re.search loop"] != results["DayMatcher"]:
+            raise AssertionError(f"DayMatcher disagrees with re.search for {count} tasks")
+        rows.append([count, args.messages / seconds["re.search loop"], args.messages / seconds["DayMatcher"],
+                     seconds["re.search loop"] / seconds["DayMatcher"]])
+    print_table(["tasks", "loop msg/s", "matcher msg/s", "speedup"], [
+        [count, f"{loop:,.0f}", f"{combined:,.0f}", f"{speedup:.1f}x"] for count, loop, combined, speedup in rows])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.support import print_table
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs the bot's startup up to where it would log in, with the sync stubbed out as there is no Discord to sync with
+CHILD = """
+import asyncio
+import app
+print("imported", flush=True)
+synced = []
+
+async def sync(guild=None):
+    synced.append(guild)
+
+async def start():
+    app.tree.sync = sync
+    await app.setup_hook()
+    await app.db.engine.dispose()
+
+asyncio.run(start())
+print(f"ready {len(synced)}", flush=True)
+"""
+
+
+def launch(directory: str) -> (float, float, int):
+    """Starts the bot's process in `directory`, and returns the seconds until its imports were done and until its
+    setup finished, and how many times it synced its commands."""
+    env: dict[str, str] = {**os.environ, "PYTHONPATH": ROOT, "GUILD_ID": "1", "CHANNEL_ID": "1",
+                           "DATABASE_PATH": os.path.join(directory, "database", "database.sqlite")}
+    started: float = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", CHILD], cwd=directory, env=env, stdout=subprocess.PIPE,
+                               text=True)
+    imported: float = 0.0
+    for line in process.stdout:
+        if line.startswith("imported"):
+            imported = time.perf_counter() - started
+        elif line.startswith("ready"):
+            ready: float = time.perf_counter() - started
+            process.wait()
+            return imported, ready, int(line.split()[1])
+    raise RuntimeError(f"The bot exited with {process.wait()} before it was ready")
+
+
+def run(runs: int) -> list[list]:
+    cold: list[tuple[float, float, int]] = []
+    warm: list[tuple[float, float, int]] = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="frosty-startup-") as directory:
+            os.mkdir(os.path.join(directory, "database"))
+            # The first start creates the schema and syncs, a restart finds both up to date
+            cold.append(launch(directory))
+            warm.append(launch(directory))
+    return [[name, min(imported for imported, _, _ in launches), min(ready for _, ready, _ in launches),
+             launches[-1][2]] for name, launches in (("first start", cold), ("restart", warm))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the bot's process from launch until its imports are done "
+                                                 "and until it is ready to log in, on a new database and on a "
+                                                 "restart.")
+    parser.add_argument("--runs", type=int, default=5, help="the fastest run is reported")
+    args = parser.parse_args()
+    print_table(["start", "imports s", "ready s", "syncs"], run(args.runs))
+
+
+if __name__ == "__main__":
+    main()
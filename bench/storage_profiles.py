@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from datetime import date
+from typing import Callable, Coroutine
+
+import database as db
+from bench.bulk_writes import tick
+from bench.support import print_table, quantile, seed
+from cache import DaySnapshot
+from structures import Progress
+from tests.support import reset_database
+
+DAY = date(2024, 5, 1)
+
+
+async def reads(competition_id: int, seconds: float) -> dict[str, tuple[list[float], int]]:
+    """Runs /check-progress and /list-teams reads back to back for `seconds`, and returns the latency of every read
+    and how many failed, per command."""
+    commands: dict[str, Callable[[], Coroutine]] = {
+        "check-progress": lambda: db.check_day(competition_id, DAY, Progress()),
+        "list-teams": lambda: db.list_teams(competition_id)}
+    results: dict[str, tuple[list[float], int]] = {name: ([], 0) for name in commands}
+    deadline: float = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for name, command in commands.items():
+            latencies, failed = results[name]
+            started: float = time.perf_counter()
+            try:
+                await command()
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                # A read that waited on the writer for longer than its busy timeout
+                results[name] = latencies, failed + 1
+    return results
+
+
+async def write_ticks(players: int, competition_id: int, stop, ticks, failures):
+    async with db.Session() as session:
+        day: DaySnapshot = (await db.get_snapshot(session)).days[(competition_id, DAY)]
+    while not stop.is_set():
+        drops, entries = tick(players, 1, day, seed=ticks.value)
+        # Every tick's drops are new, their dedupe keys carry the tick
+        drops = [drop._replace(dedupe_key=f"{ticks.value}:{drop.dedupe_key}") for drop in drops]
+        try:
+            await db.apply_drop_records(DAY, drops, entries)
+            ticks.value += 1
+        except Exception:
+            failures.value += 1
+    await db.engine.dispose()
+
+
+def writer(players: int, competition_id: int, stop, ticks, failures):
+    """Runs in its own process, like the bot's update next to a command served from another one, and applies one
+    poll's worth of new drops after another until `stop` is set."""
+    asyncio.run(write_ticks(players, competition_id, stop, ticks, failures))
+
+
+async def measure(players: int, team_size: int, drops: int, seconds: float) -> list[list]:
+    """Times the reads on their own, then while another process writes the drops of every tick, in this process's
+    storage profile."""
+    await reset_database()
+    competition_id: int = await seed(players, team_size, [DAY], drops)
+    context = multiprocessing.get_context("spawn")
+    rows: list[list] = []
+    for writing in (False, True):
+        stop = context.Event()
+        ticks, failures = context.Value("i", 0), context.Value("i", 0)
+        process: multiprocessing.Process = context.Process(target=writer, args=(
+            players, competition_id, stop, ticks, failures), daemon=True)
+        if writing:
+            process.start()
+            # The reads start once the first tick is written, not while the writer is still importing
+            while not ticks.value and process.is_alive():
+                await asyncio.sleep(0.05)
+        first_tick: int = ticks.value
+        results: dict[str, tuple[list[float], int]] = await reads(competition_id, seconds)
+        stop.set()
+        if writing:
+            await asyncio.to_thread(process.join)
+        for name, (latencies, failed) in results.items():
+            rows.append([name, "yes" if writing else "no", (ticks.value - first_tick) / seconds, failures.value,
+                         len(latencies), failed, quantile(latencies, 0.5) * 1000, quantile(latencies, 0.99) * 1000])
+    await db.engine.dispose()
+    return rows
+
+
+def run(profile: str, args: argparse.Namespace) -> list[list]:
+    """Measures `profile` in processes of its own, the profile is read when database.py is imported."""
+    command: list[str] = [sys.executable, "-m", "bench.storage_profiles", "--players", str(args.players),
+                          "--team-size", str(args.team_size), "--drops", str(args.drops), "--seconds",
+                          str(args.seconds), "--child"]
+    output: str = subprocess.run(command, env={**os.environ, "DB_PROFILE": profile}, stdout=subprocess.PIPE,
+                                 text=True, check=True).stdout
+    return [[profile] + row for row in json.loads(output.splitlines()[-1])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times /check-progress and /list-teams reads on their own and while "
+                                                 "another process has apply_drop_records write one tick after "
+                                                 "another, under every storage profile.")
+    parser.add_argument("--profiles", nargs="+", default=list(db.STORAGE_PROFILES),
+                        choices=list(db.STORAGE_PROFILES))
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--drops", type=int, default=10000, help="drops on the day that is checked")
+    parser.add_argument("--seconds", type=float, default=5.0, help="how long the reads run, with and without writes")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args.players, args.team_size, args.drops, args.seconds))))
+        return
+    rows: list[list] = [row for profile in args.profiles for row in run(profile, args)]
+    print_table(["profile", "read", "writing", "ticks/s", "failed ticks", "reads", "failed", "p50 ms", "p99 ms"],
+                rows)
+
+
+if __name__ == "__main__":
+    main()
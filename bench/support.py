@@ -0,0 +1,79 @@
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import insert
+
+import cache
+import database as db
+from models import Competition, Day, Drop, Player, Task, Team
+
+ITEMS: list[str] = ["some dragon bones", "a rune platebody", "an abyssal whip", "a clue scroll (hard)", "some coins",
+                    "a dragon hatchet", "a crystal key", "an onyx", "a rune scimitar", "a clue scroll (elite)",
+                    "some big bones", "a bronze dagger", "an uncut dragonstone", "a dragon dagger"]
+TASKS: list[tuple[str, str, int]] = [
+    ("Dragon bones", "dragon bones", 5),
+    ("Any rune item", r"i found an? rune \w+", 3),
+    ("Abyssal whip", "abyssal whip", 1),
+    ("Hard or elite clue", r"clue scroll \((?:hard|elite)\)", 2),
+]
+INSERT_CHUNK = 50000
+
+
+def messages(count: int, seed: int = 0) -> list[str]:
+    rng: random.Random = random.Random(seed)
+    return [f"I found {rng.choice(ITEMS)}" for _ in range(count)]
+
+
+async def seed(players: int, team_size: int, days: list[date], drops_per_day: int, seed: int = 0) -> int:
+    """Creates the schema in an empty database, and fills it with one competition, teams of `team_size` players,
+    the TASKS on every day, and `drops_per_day` drops spread over the players and the day. Rows are inserted in bulk, and the progress
+    counters rebuilt from them afterwards. Returns the competition's ID."""
+    rng: random.Random = random.Random(seed)
+    await db.create_schema()
+    async with db.engine.begin() as connection:
+        competition_id: int = (await connection.execute(
+            insert(Competition).values(name="bench", guild_id=1, channel_id=1))).inserted_primary_key[0]
+        await connection.execute(insert(Team), [{"competition_id": competition_id, "name": f"Team {i + 1}", "lives": 3}
+                                                for i in range((players + team_size - 1) // team_size)])
+        await connection.execute(insert(Player), [{"rsn": f"player {i}", "team_id": i // team_size + 1}
+                                                  for i in range(players)])
+        await connection.execute(insert(Day), [{"competition_id": competition_id, "date": day} for day in days])
+        await connection.execute(insert(Task), [
+            {"competition_id": competition_id, "day": day, "description": description, "regex_search": regex,
+             "number_required": required} for day in days for description, regex, required in TASKS])
+        for day in days:
+            start: datetime = datetime.combine(day, datetime.min.time())
+            rows: list[dict] = [{"player_id": rng.randrange(players) + 1, "message": f"I found {rng.choice(ITEMS)}",
+                                 "date": start + timedelta(seconds=rng.randrange(86400))}
+                                for _ in range(drops_per_day)]
+            for i in range(0, len(rows), INSERT_CHUNK):
+                await connection.execute(insert(Drop), rows[i:i + INSERT_CHUNK])
+    cache.roster.invalidate()
+    cache.drops.invalidate()
+    await db.rebuild_progress(competition_id, None)
+    return competition_id
+
+
+async def best_of(runs: int, function: Callable[[], Awaitable]) -> float:
+    """Returns the fastest of `runs` timed calls, in seconds."""
+    best: float = float("inf")
+    for _ in range(runs):
+        started: float = time.perf_counter()
+        await function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def quantile(values: list[float], q: float) -> float:
+    ordered: list[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def print_table(headers: list[str], rows: list[list]):
+    cells: list[list[str]] = [headers] + [[f"{value:.3f}" if isinstance(value, float) else str(value)
+                                           for value in row] for row in rows]
+    widths: list[int] = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for row in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import os
+import time
+
+import database as db
+import runemetrics
+from bench.support import print_table, seed
+from bench.worker_throughput import DAY, start_stub
+from tests.support import reset_database
+
+
+async def tick(rsns: list[str], concurrency: int) -> (float, float, int):
+    """One update of the bot without worker processes: the logs of every player are fetched, then their new drops
+    stored. Returns the seconds each took, and the notifications."""
+    started: float = time.perf_counter()
+    event_logs, _ = await runemetrics.get_event_logs(rsns, concurrency, await db.get_cursors())
+    fetched: float = time.perf_counter()
+    notifications = await db.periodic_update(DAY, event_logs)
+    return fetched - started, time.perf_counter() - fetched, len(notifications)
+
+
+async def run(player_counts: list[int], team_size: int, concurrency: int, runs: int) -> list[list]:
+    rows: list[list] = []
+    for players in player_counts:
+        rsns: list[str] = [f"player {i}" for i in range(players)]
+        # The first tick stores a full page of drops for everyone, the ones after it find the same page again
+        for name, new in (("first", True), ("next", False)):
+            best: tuple[float, float, int] = (float("inf"), float("inf"), 0)
+            if not new:
+                await reset_database()
+                await seed(players, team_size, [DAY], 0)
+                await tick(rsns, concurrency)
+            for _ in range(runs):
+                if new:
+                    await reset_database()
+                    await seed(players, team_size, [DAY], 0)
+                timings: tuple[float, float, int] = await tick(rsns, concurrency)
+                best = min(best, timings, key=lambda timing: timing[0] + timing[1])
+            fetch, update, notifications = best
+            rows.append([players, name, notifications, fetch, update, 1 / (fetch + update),
+                         players / (fetch + update)])
+    await runemetrics.close_session()
+    await db.engine.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times whole update ticks, fetching the event logs from a local "
+                                                 "stand-in for RuneMetrics and storing their drops, and reports "
+                                                 "ticks per second.")
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight, the bot's default")
+    parser.add_argument("--servers", type=int, default=1, help="processes serving the stub API")
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    url, servers = start_stub(max(args.players), args.servers)
+    os.environ["RUNEMETRICS_URL"] = runemetrics.API_URL = url
+    try:
+        rows: list[list] = asyncio.run(run(args.players, args.team_size, args.concurrency, args.runs))
+    finally:
+        for server in servers:
+            server.terminate()
+    print_table(["players", "tick", "notifications", "fetch s", "update s", "ticks/s", "players/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
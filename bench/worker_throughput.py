@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import runemetrics
+import workers
+from bench.support import ITEMS, TASKS, best_of, print_table
+from cache import DaySnapshot, TaskSnapshot
+from constants import DATETIME_FORMAT
+from response_cache import ResponseCache
+from workers import PlayerCursor, ShardResult, WorkerPool
+
+DAY = date(2024, 5, 1)
+DAYS: dict[tuple[int, date], DaySnapshot] = {(1, DAY): DaySnapshot(1, DAY, 1, None, tuple(
+    TaskSnapshot(task_id, description, regex, required, None)
+    for task_id, (description, regex, required) in enumerate(TASKS, start=1)))}
+
+
+def event_logs(players: int, seed: int = 0) -> dict[str, list[dict[str, str]]]:
+    """A full first page of activity for every player, most of it drops during DAY."""
+    rng: random.Random = random.Random(seed)
+    start: datetime = datetime.combine(DAY, datetime.min.time(), timezone.utc) + timedelta(hours=1)
+    logs: dict[str, list[dict[str, str]]] = {}
+    for i in range(players):
+        moments: list[datetime] = sorted((start + timedelta(minutes=rng.randrange(20 * 60))
+                                          for _ in range(runemetrics.PAGE_SIZE)), reverse=True)
+        logs[f"player {i}"] = [
+            {"date": moment.astimezone(runemetrics.london()).strftime(DATETIME_FORMAT), "text": text, "details": text}
+            for moment in moments
+            for text in [f"I found {rng.choice(ITEMS)}" if rng.random() < 0.7 else "I levelled my Slayer skill"]]
+    return logs
+
+
+def serve(port: int, players: int):
+    """Runs in its own process: answers every profile request with a body encoded ahead of time, so the stub
+    takes as little of the CPU the pollers are measured on as it can."""
+    from aiohttp import web
+    bodies: dict[str, bytes] = {rsn: json.dumps({"activities": log}).encode()
+                                for rsn, log in event_logs(players).items()}
+
+    async def profile(request: web.Request) -> web.Response:
+        return web.Response(body=bodies[request.query["user"]], content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/runemetrics/profile/profile", profile)
+    web.run_app(app, host="127.0.0.1", port=port, reuse_port=True, print=None)
+
+
+def start_stub(players: int, servers: int) -> (str, list[multiprocessing.Process]):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port: int = probe.getsockname()[1]
+    processes: list[multiprocessing.Process] = [
+        multiprocessing.get_context("spawn").Process(target=serve, args=(port, players), daemon=True)
+        for _ in range(servers)]
+    for process in processes:
+        process.start()
+    deadline: float = time.monotonic() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+    return f"http://127.0.0.1:{port}/runemetrics", processes
+
+
+async def run(players: int, worker_counts: list[int], concurrency: int, runs: int) -> list[list]:
+    cursors: list[PlayerCursor] = [PlayerCursor(i + 1, f"player {i}", 1, "", None) for i in range(players)]
+    drops: dict[str, int] = {}
+
+    async def in_process():
+        result: ShardResult = await workers._poll_shard(cursors, DAYS, {}, concurrency)
+        drops["in process"] = len(result.drops)
+
+    rows: list[list] = []
+    await in_process()
+    seconds: float = await best_of(runs, in_process)
+    rows.append(["in process", seconds, players / seconds])
+    for count in worker_counts:
+        pool: WorkerPool = WorkerPool(count, concurrency)
+
+        async def pooled():
+            # A fresh cache every time, so no response is skipped as unchanged
+            result: ShardResult = await pool.poll(cursors, DAYS, ResponseCache("", 2 * players))
+            drops[f"{count} workers"] = len(result.drops)
+
+        try:
+            # Starting the processes and their imports aren't part of a poll
+            await pooled()
+            seconds = await best_of(runs, pooled)
+        finally:
+            await asyncio.to_thread(pool.executor.shutdown)
+        rows.append([f"{count} workers", seconds, players / seconds])
+    if len(set(drops.values())) != 1:
+        raise AssertionError(f"Every mode should find the same drops: {drops}")
+    print(f"{drops['in process']:,} drops found per poll")
+    return [row + [rows[0][1] / row[1]] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Polls a local stand-in for RuneMetrics and matches the drops, "
+                                                 "in the bot's process and sharded over worker processes, and "
+                                                 "reports how many players are polled per second.")
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight, split over the workers")
+    parser.add_argument("--servers", type=int, default=2, help="processes serving the stub API")
+    parser.add_argument("--runs", type=int, default=3, help="the fastest run is reported")
+    args = parser.parse_args()
+    # The stub runs on the same machine, workers beyond the cores it leaves free can't add anything
+    print(f"{os.cpu_count()} CPUs, shared with {args.servers} processes serving the stub")
+    url, servers = start_stub(args.players, args.servers)
+    # Read at import, by this process and by every worker it spawns
+    os.environ["RUNEMETRICS_URL"] = runemetrics.API_URL = url
+    try:
+        rows: list[list] = asyncio.run(run(args.players, args.workers, args.concurrency, args.runs))
+    finally:
+        for server in servers:
+            server.terminate()
+    print_table(["mode", "poll s", "players/s", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
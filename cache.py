@@ -0,0 +1,85 @@
+from datetime import date
+from typing import NamedTuple
+
+
+class TaskSnapshot(NamedTuple):
+    task_id: int
+    description: str
+    regex_search: str
+    number_required: int
+    match_cost: float | None
+
+
+class CompetitionSnapshot(NamedTuple):
+    competition_id: int
+    name: str
+    guild_id: int | None
+    channel_id: int | None
+
+
+class DaySnapshot(NamedTuple):
+    competition_id: int
+    date: date
+    all_required: int
+    password: str | None
+    tasks: tuple[TaskSnapshot, ...]
+
+
+class TeamSnapshot(NamedTuple):
+    team_id: int
+    competition_id: int
+    name: str
+    lives: int
+    rsns: tuple[str, ...]
+
+
+class Snapshot(NamedTuple):
+    version: int
+    competitions: dict[int, CompetitionSnapshot]
+    teams: tuple[TeamSnapshot, ...]
+    days: dict[tuple[int, date], DaySnapshot]
+
+    def competition_teams(self, competition_id: int) -> list[TeamSnapshot]:
+        return [team for team in self.teams if team.competition_id == competition_id]
+
+
+class SnapshotCache:
+    """Holds an immutable snapshot of the competitions, teams, players, days and tasks, which only change when
+    an admin runs a command. Every change bumps the version, so a snapshot that was being loaded while the data
+    changed is thrown away instead of being stored."""
+
+    def __init__(self):
+        self.snapshot: Snapshot | None = None
+        self.version: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self) -> Snapshot | None:
+        if self.snapshot is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return self.snapshot
+
+    def store(self, snapshot: Snapshot):
+        if snapshot.version == self.version:
+            self.snapshot = snapshot
+
+    def invalidate(self):
+        self.version += 1
+        self.snapshot = None
+
+
+class Version:
+    """Counts changes to data that is too busy to be part of the snapshot, such as drops, so whatever is derived
+    from it knows when to rebuild."""
+
+    def __init__(self):
+        self.version: int = 0
+
+    def invalidate(self):
+        self.version += 1
+
+
+roster: SnapshotCache = SnapshotCache()
+drops: Version = Version()
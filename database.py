@@ -1,269 +1,762 @@
-import re
-from datetime import date, datetime, timezone
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
 from typing import Sequence, Type
 
-from sqlalchemy import create_engine, select, Select, func
-from sqlalchemy.orm import sessionmaker
-from models import Team, Player, Drop, Task, Day, Base, LastEntry, LastDay
+from sqlalchemy import select, Select, func, delete, insert, update, inspect, event, text, Table
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from models import Competition, Team, Player, Drop, Task, Day, Base, LastEntry, LastDay, TeamTaskProgress, \
+    TeamDayResult, TeamDayTaskResult
 
 from constants import *
+import cache
+import matcher
+import metrics
 import runemetrics
-from structures import Score, Progress, DropNotification
-
-
-def get_last_day() -> date:
-    with Session.begin() as session:
-        day_object: LastDay = session.execute(select(LastDay).where(LastDay.id == 0)).scalars().one_or_none()
+from runemetrics import EventLogEntry
+from cache import Snapshot, CompetitionSnapshot, DaySnapshot, TaskSnapshot, TeamSnapshot
+from structures import Score, Progress, DropNotification, TaskProgress, Standing, DayOutcome
+from workers import PlayerCursor, DropRecord, EntryRecord, find_drop_records
+
+
+async def get_roster() -> Snapshot:
+    async with transaction() as session:
+        return await get_snapshot(session)
+
+
+async def get_competitions() -> list[CompetitionSnapshot]:
+    async with transaction() as session:
+        return list((await get_snapshot(session)).competitions.values())
+
+
+async def get_competition(guild_id: int) -> CompetitionSnapshot | None:
+    async with transaction() as session:
+        for competition in (await get_snapshot(session)).competitions.values():
+            if competition.guild_id == guild_id:
+                return competition
+        return None
+
+
+async def start_competition(name: str, guild_id: int, channel_id: int):
+    async with write_session() as session:
+        if (await session.scalars(select(Competition).where(Competition.guild_id == guild_id))).one_or_none():
+            return f"A competition is already running in this server"
+        session.add(Competition(name=name, guild_id=guild_id, channel_id=channel_id))
+    cache.roster.invalidate()
+
+
+async def claim_competition(guild_id: int, channel_id: int):
+    """Makes sure this guild runs a competition, handing it the one without a guild if there is one."""
+    async with write_session() as session:
+        competition: Competition = (await session.scalars(
+            select(Competition).where(Competition.guild_id == guild_id))).one_or_none()
+        if not competition:
+            competition = (await session.scalars(
+                select(Competition).where(Competition.guild_id.is_(None)).order_by(Competition.competition_id)
+            )).first()
+        if not competition:
+            competition = Competition(name="default")
+            session.add(competition)
+        competition.guild_id = guild_id
+        competition.channel_id = channel_id
+    cache.roster.invalidate()
+
+
+async def get_last_day(competition_id: int) -> date:
+    async with transaction() as session:
+        day_object: LastDay = await session.get(LastDay, competition_id)
         return None if day_object is None else day_object.day
 
 
-def set_new_day(new_day: date):
-    with Session.begin() as session:
-        last_day: LastDay = session.execute(select(LastDay).where(LastDay.id == 0)).scalars().one_or_none()
-        if last_day:
-            last_day.day = new_day
+async def get_polled_players() -> dict[str, datetime | None]:
+    """Returns every player to poll once, with the time of their last known activity."""
+    async with transaction() as session:
+        query: Select = select(Player.rsn, LastEntry.date, func.max(Drop.date)).outerjoin(
+            LastEntry, LastEntry.player_id == Player.player_id).outerjoin(
+            Drop, Drop.player_id == Player.player_id).group_by(Player.player_id)
+        players: dict[str, datetime | None] = {}
+        for rsn, last_entry_date, last_drop_date in (await session.execute(query)).all():
+            if rsn.startswith("*"):
+                continue
+            activity: list[datetime] = []
+            if last_entry_date:
+                activity.append(runemetrics.parse_date(last_entry_date))
+            if last_drop_date:
+                activity.append(last_drop_date.replace(tzinfo=timezone.utc))
+            if players.get(rsn):
+                activity.append(players[rsn])
+            players[rsn] = max(activity) if activity else None
+        return players
+
+
+async def get_cursors() -> dict[str, set[str]]:
+    async with transaction() as session:
+        query: Select = select(Player.rsn, LastEntry.seen).join(LastEntry, LastEntry.player_id == Player.player_id)
+        cursors: dict[str, set[str]] = {}
+        for rsn, seen in (await session.execute(query)).all():
+            if seen:
+                cursors.setdefault(rsn, set()).update(seen.split(","))
+        return cursors
+
+
+async def periodic_update(current_day: date, event_logs: dict[str, list[EventLogEntry]]) -> list[DropNotification]:
+    players: list[PlayerCursor] = await get_player_cursors(list(event_logs))
+    drops, entries = find_drop_records(players, event_logs, await get_days(), matcher.get_matcher)
+    notifications, _ = await apply_drop_records(current_day, drops, entries)
+    return notifications
+
+
+async def get_player_cursors(rsns: list[str]) -> list[PlayerCursor]:
+    """Returns the cursors of the given players, in the order of `rsns`."""
+    async with transaction() as session:
+        query: Select = select(Player.player_id, Player.rsn, Team.competition_id, LastEntry.date, LastEntry.seen).join(
+            Player.team).outerjoin(LastEntry, LastEntry.player_id == Player.player_id).where(Player.rsn.in_(rsns))
+        order: dict[str, int] = {rsn: i for i, rsn in enumerate(rsns)}
+        cursors: list[PlayerCursor] = [PlayerCursor(player_id, rsn, competition_id, last_date or "", seen)
+                                       for player_id, rsn, competition_id, last_date, seen in
+                                       (await session.execute(query)).all()]
+        return sorted(cursors, key=lambda cursor: order[cursor.rsn])
+
+
+async def get_days() -> dict[tuple[int, date], DaySnapshot]:
+    async with transaction() as session:
+        return (await get_snapshot(session)).days
+
+
+async def apply_drop_records(current_day: date, drops: list[DropRecord],
+                             entries: list[EntryRecord]) -> (list[DropNotification], set[str]):
+    """Stores the drops and cursors of a tick. Returns the notifications and the newly stored dedupe keys."""
+    with metrics.span("database.write"):
+        async with write_session() as session:
+            notifiable_drops: list[DropNotification] = []
+            snapshot: Snapshot = await get_snapshot(session)
+            player_ids: set[int] = {entry.player_id for entry in entries} | {drop.player_id for drop in drops}
+            players: dict[int, Player] = {player.player_id: player for player in (await session.scalars(
+                select(Player).where(Player.player_id.in_(player_ids)))).all()}
+            inserted: set[str] = set()
+            if drops:
+                # Drops that were already stored, e.g. by a tick that was interrupted, are skipped by the unique key
+                statement = sqlite_insert(Drop).on_conflict_do_nothing(index_elements=[Drop.dedupe_key])
+                inserted.update((await session.scalars(statement.returning(Drop.dedupe_key), [
+                    {"player_id": drop.player_id, "message": drop.message, "date": drop.date,
+                     "dedupe_key": drop.dedupe_key} for drop in drops])).all())
+            new_drops: list[DropRecord] = [drop for drop in drops if drop.dedupe_key in inserted]
+
+            task_ids: set[int] = {task_id for drop in new_drops for task_id in drop.task_ids}
+            completed: dict[tuple[int, int], int] = {
+                (team_id, task_id): count for team_id, task_id, count in (await session.execute(
+                    select(TeamTaskProgress.team_id, TeamTaskProgress.task_id, TeamTaskProgress.completed).where(
+                        TeamTaskProgress.task_id.in_(task_ids)))).all()}
+            increments: dict[tuple[int, int], int] = {}
+            for drop in new_drops:
+                player: Player = players[drop.player_id]
+                day: DaySnapshot = snapshot.days.get((player.team.competition_id, drop.date.date()))
+                for task in day.tasks if day else ():
+                    if task.task_id in drop.task_ids:
+                        key: tuple[int, int] = (player.team_id, task.task_id)
+                        increments[key] = increments.get(key, 0) + 1
+                        completed[key] = completed.get(key, 0) + 1
+                        if drop.date.date() == current_day:
+                            notifiable_drops.append(drop_notification(player, drop.message, task, completed[key]))
+            if increments:
+                statement = sqlite_insert(TeamTaskProgress)
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=[TeamTaskProgress.team_id, TeamTaskProgress.task_id],
+                    set_={"completed": TeamTaskProgress.completed + statement.excluded.completed}), [
+                    {"team_id": team_id, "task_id": task_id, "completed": increment}
+                    for (team_id, task_id), increment in increments.items()])
+            if entries:
+                statement = sqlite_insert(LastEntry)
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=[LastEntry.player_id],
+                    set_={"date": statement.excluded.date, "seen": statement.excluded.seen}), [
+                    {"player_id": entry.player_id, "date": entry.date, "seen": entry.seen} for entry in entries])
+    if inserted:
+        cache.drops.invalidate()
+    return notifiable_drops, inserted
+
+
+def drop_notification(player: Player, message: str, task: TaskSnapshot, completed: int) -> DropNotification:
+    return DropNotification(player.rsn, f"{player.rsn} {message[2:]} for {player.team.name}",
+                            f"{task.description}: {completed}/{task.number_required}",
+                            player.team.name, task.task_id, player.team.competition_id)
+
+
+async def count_drop(session, day: DaySnapshot, drop: Drop, delta: int) -> list[tuple[TaskSnapshot, int]]:
+    """Counts the drop towards every task of `day` it matches. Returns those tasks with their completions."""
+    if not day:
+        return []
+    with metrics.span("drops.match"):
+        matched_tasks: set[int] = matcher.get_matcher(day).matches(drop.message)
+    return await add_progress(session, day, drop.player.team_id, matched_tasks, delta)
+
+
+async def add_progress(session, day: DaySnapshot, team_id: int, matched_tasks: set[int],
+                       delta: int) -> list[tuple[TaskSnapshot, int]]:
+    if not day:
+        return []
+    matched: list[tuple[TaskSnapshot, int]] = []
+    for task in day.tasks:
+        if task.task_id in matched_tasks:
+            progress: TeamTaskProgress = await session.get(TeamTaskProgress, (team_id, task.task_id))
+            if not progress:
+                progress = TeamTaskProgress(team_id=team_id, task_id=task.task_id, completed=0)
+                session.add(progress)
+            progress.completed += delta
+            matched.append((task, progress.completed))
+    return matched
+
+
+async def rebuild_progress_counters(session, competition_id: int, day: date):
+    tasks: Sequence[Task] = (await session.scalars(
+        select(Task).where(Task.competition_id == competition_id, Task.day == day))).all()
+    if not tasks:
+        return
+    task_ids: list[int] = [task.task_id for task in tasks]
+    await session.execute(delete(TeamTaskProgress).where(TeamTaskProgress.task_id.in_(task_ids)))
+    day_matcher: matcher.DayMatcher = matcher.DayMatcher(tasks)
+    counts: dict[tuple[int, int], int] = {}
+    for team_id, message, count in await count_day_messages(session, competition_id, day):
+        for task_id in day_matcher.matches(message):
+            counts[(team_id, task_id)] = counts.get((team_id, task_id), 0) + count
+    session.add_all([TeamTaskProgress(team_id=team_id, task_id=task_id, completed=completed)
+                     for (team_id, task_id), completed in counts.items()])
+
+
+def day_range(day: date) -> (datetime, datetime):
+    start: datetime = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+async def count_day_messages(session, competition_id: int, day: date) -> list[tuple[int, str, int]]:
+    """Returns how often every team found each distinct message on `day`."""
+    start, end = day_range(day)
+    query: Select = select(Player.team_id, Drop.message, func.count()).join(Drop.player).join(Player.team).where(
+        Team.competition_id == competition_id, Drop.date >= start, Drop.date < end).group_by(
+        Player.team_id, Drop.message)
+    return [tuple(row) for row in (await session.execute(query)).all()]
+
+
+async def get_day(session, competition_id: int, day: date) -> Day:
+    return await session.get(Day, (competition_id, day))
+
+
+async def get_team(session, competition_id: int, name: str) -> Team:
+    query: Select = select(Team).where(Team.competition_id == competition_id, Team.name == name)
+    return (await session.scalars(query)).one_or_none()
+
+
+async def get_player(session, competition_id: int, rsn: str) -> Player:
+    query: Select = select(Player).join(Player.team).where(Team.competition_id == competition_id, Player.rsn == rsn)
+    return (await session.scalars(query)).one_or_none()
+
+
+async def get_task(session, competition_id: int, identifier: int) -> Task:
+    query: Select = select(Task).where(Task.competition_id == competition_id, Task.task_id == identifier)
+    return (await session.scalars(query)).one_or_none()
+
+
+async def get_snapshot(session) -> Snapshot:
+    snapshot: Snapshot = cache.roster.get()
+    if snapshot is None:
+        version: int = cache.roster.version
+        competitions: dict[int, CompetitionSnapshot] = {
+            competition.competition_id: CompetitionSnapshot(competition.competition_id, competition.name,
+                                                            competition.guild_id, competition.channel_id)
+            for competition in (await session.scalars(select(Competition))).all()}
+        rsns: dict[int, list[str]] = {}
+        for player in (await session.scalars(select(Player).order_by(Player.player_id))).all():
+            rsns.setdefault(player.team_id, []).append(player.rsn)
+        teams: tuple[TeamSnapshot, ...] = tuple(
+            TeamSnapshot(team.team_id, team.competition_id, team.name, team.lives, tuple(rsns.get(team.team_id, [])))
+            for team in (await session.scalars(select(Team).order_by(Team.team_id))).all())
+        days: dict[tuple[int, date], DaySnapshot] = {
+            (day.competition_id, day.date): DaySnapshot(
+                day.competition_id, day.date, day.all_required, day.password, tuple(
+                    TaskSnapshot(task.task_id, task.description, task.regex_search, task.number_required,
+                                 task.match_cost)
+                    for task in day.tasks))
+            for day in (await session.scalars(select(Day))).all()}
+        snapshot = Snapshot(version, competitions, teams, days)
+        cache.roster.store(snapshot)
+    return snapshot
+
+
+async def get_cached_day(session, competition_id: int, day: date) -> DaySnapshot | None:
+    return (await get_snapshot(session)).days.get((competition_id, day))
+
+
+async def roll_over(competition_id: int, new_day: date) -> (bool, date | None, list[DayOutcome]):
+    """Ends the previous day and moves the competition on to `new_day`. Does nothing if it is already there."""
+    async with write_session() as session:
+        last_day: date | None = (await session.scalars(
+            select(LastDay.day).where(LastDay.competition_id == competition_id))).one_or_none()
+        if last_day is not None and last_day >= new_day:
+            return False, last_day, []
+        # Claimed by compare and set, a concurrent rollover that got here first leaves nothing to update
+        if last_day is None:
+            claim = sqlite_insert(LastDay).values(competition_id=competition_id, day=new_day).on_conflict_do_nothing()
         else:
-            last_day = LastDay(id=0, day=new_day)
-            session.add(last_day)
-        session.commit()
-
-
-def periodic_update(current_day: date) -> list[DropNotification]:
-    with Session.begin() as session:
-        notifiable_drops: list[DropNotification] = []
-        players: Sequence[Player] = session.execute(select(Player)).scalars().all()
-        for player in players:
-            process_player(session, current_day, notifiable_drops, player)
-        session.commit()
-        return notifiable_drops
-
-
-def process_player(session, current_day: date, notifiable_drops: list[DropNotification], player: Player):
-    query: Select = select(LastEntry).where(LastEntry.player_id == player.player_id)
-    last_entry: LastEntry = session.execute(query).scalars().one_or_none()
-    if not last_entry:
-        last_entry: LastEntry = LastEntry(player_id=player.player_id, date="")
-        session.add(last_entry)
-    drops: list[Drop] = runemetrics.extract_relevant_activities(player, last_entry)
-    for drop in drops:
-        session.add(drop)
-        day = get_day(session, current_day)
-        if day and drop.date.date() == current_day:
-            for task in day.tasks:
-                if re.search(task.regex_search, drop.message.lower()):
-                    completed = len(
-                        get_drops_for_team_day(session, drop.player.team, current_day, task.regex_search))
-                    notifiable_drops.append(DropNotification(drop.player.rsn,
-                                                             f"{drop.player.rsn} {drop.message[2:]} for {drop.player.team.name}",
-                                                             f"{task.description}: {completed}/{task.number_required}"))
-
-
-def get_drops_for_team_day(session, team: Team, day: date, regex_search: str):
-    return session.query(Drop).join(Player).join(Team).filter(
-        Drop.date.startswith(day)).filter(
-        Team.team_id == team.team_id).filter(
-        func.lower(Drop.message).regexp_match(regex_search)).all()
-
-
-def get_day(session, day: date) -> Day:
-    return session.execute(select(Day).where(Day.date == day)).scalars().one_or_none()
-
-
-def get_regex(session, day: date) -> str:
-    tasks: Sequence[Task] = session.execute(select(Task).join(Day).where(Day.date == day)).scalars().all()
-    task_regexes: list[str] = [task.regex_search for task in tasks]
-    regex: str = "(" + ")|(".join(task_regexes) + ")"
-    return regex
-
-
-def update_lives(team: str, all_completed: bool) -> int:
-    with Session.begin() as session:
-        team: Team = session.execute(select(Team).where(Team.name == team)).scalars().one_or_none()
-        lives: int = team.lives
-        if not all_completed:
-            team.lives -= 1
-            lives = team.lives
-            session.commit()
-        return lives
-
-
-def get_day_task_description(day: date) -> (str, str):
-    with Session.begin() as session:
-        day_object: Day = session.execute(select(Day).where(Day.date == day)).scalars().one_or_none()
+            claim = update(LastDay).where(LastDay.competition_id == competition_id, LastDay.day == last_day).values(
+                day=new_day)
+        if (await session.execute(claim)).rowcount == 0:
+            return False, last_day, []
+        snapshot: Snapshot = await get_snapshot(session)
+        day_object: DaySnapshot = snapshot.days.get((competition_id, last_day))
         if not day_object:
-            return f"{day} was not found", None
-        joiner: str = " and " if day_object.all_required else " or "
-        tasks_description: str = joiner.join([str(task.number_required) + " " + task.description for task in day_object.tasks])
-        password: str = "" if day_object.password is None else "\nPassword: _" + day_object.password + "_"
-        return None, tasks_description + password
-
-
-def add_team(team_name):
-    with Session.begin() as session:
-        team = session.query(Team).filter(Team.name == team_name).one_or_none()
+            return True, last_day, []
+        counters: dict[tuple[int, int], int] = await get_day_counters(session, competition_id, last_day)
+        drops: dict[int, int] = await get_day_drop_counts(session, competition_id, day_object)
+        outcomes: list[DayOutcome] = []
+        failed: list[int] = []
+        for team in snapshot.competition_teams(competition_id):
+            counts: list[int] = [counters.get((team.team_id, task.task_id), 0) for task in day_object.tasks]
+            completions: list[bool] = [count >= task.number_required for count, task in zip(counts, day_object.tasks)]
+            all_complete: bool = all(completions) if day_object.all_required else any(completions)
+            lives: int = team.lives if all_complete else team.lives - 1
+            if not all_complete:
+                failed.append(team.team_id)
+            outcomes.append(DayOutcome(team.name, all_complete, lives))
+            tasks: list[TeamDayTaskResult] = [
+                TeamDayTaskResult(task_id=task.task_id, description=task.description, completed=count,
+                                  required=task.number_required) for count, task in zip(counts, day_object.tasks)]
+            session.add(TeamDayResult(team_id=team.team_id, date=last_day, competition_id=competition_id,
+                                      all_completed=all_complete, tasks_completed=sum(completions),
+                                      drops=drops.get(team.team_id, 0), lives=lives, tasks=tasks))
+        if failed:
+            await session.execute(update(Team).where(Team.team_id.in_(failed)).values(lives=Team.lives - 1))
+    if failed:
+        cache.roster.invalidate()
+    return True, last_day, outcomes
+
+
+async def get_day_drop_counts(session, competition_id: int, day: DaySnapshot) -> dict[int, int]:
+    """Returns the number of drops per team on `day` that matched any of its tasks."""
+    day_matcher: matcher.DayMatcher = matcher.get_matcher(day)
+    drops: dict[int, int] = {}
+    for team_id, message, count in await count_day_messages(session, competition_id, day.date):
+        if day_matcher.matches(message):
+            drops[team_id] = drops.get(team_id, 0) + count
+    return drops
+
+
+def describe_day(day_object: DaySnapshot) -> str:
+    joiner: str = " and " if day_object.all_required else " or "
+    tasks_description: str = joiner.join([str(task.number_required) + " " + task.description for task in day_object.tasks])
+    password: str = "" if day_object.password is None else "\nPassword: _" + day_object.password + "_"
+    return tasks_description + password
+
+
+async def add_team(competition_id: int, team_name):
+    async with write_session() as session:
+        team = await get_team(session, competition_id, team_name)
         if team:
             return f"Team name {team_name} is already in use"
-        new_team = Team(name=team_name)
+        new_team = Team(competition_id=competition_id, name=team_name)
         session.add(new_team)
+    cache.roster.invalidate()
 
 
-def rename_team(old_name, new_name):
-    with Session.begin() as session:
-        team_to_rename = session.query(Team).filter(Team.name == old_name).one_or_none()
+async def rename_team(competition_id: int, old_name, new_name):
+    async with write_session() as session:
+        team_to_rename = await get_team(session, competition_id, old_name)
         if not team_to_rename:
             return f"Could not rename {old_name}, this team does not exist"
-        if session.query(Team).filter(Team.name == new_name).one_or_none():
+        if await get_team(session, competition_id, new_name):
             return f"Team name {new_name} is already in use"
         team_to_rename.name = new_name
+    cache.roster.invalidate()
 
 
-def add_player(rsn, team_name):
-    with Session.begin() as session:
-        team = session.query(Team).filter(Team.name == team_name).one_or_none()
+async def add_player(competition_id: int, rsn, team_name):
+    async with write_session() as session:
+        team = await get_team(session, competition_id, team_name)
         if not team:
             return f"Could not create {rsn}, team {team_name} was not found"
+        if await get_player(session, competition_id, rsn):
+            return f"RSN {rsn} is already in use"
         player = Player(rsn=rsn, team_id=team.team_id)
         session.add(player)
+    cache.roster.invalidate()
 
 
-def change_rsn(old_rsn, new_rsn):
-    with Session.begin() as session:
-        old_player = session.query(Player).filter(Player.rsn == old_rsn).one_or_none()
+async def change_rsn(competition_id: int, old_rsn, new_rsn):
+    async with write_session() as session:
+        old_player = await get_player(session, competition_id, old_rsn)
         if not old_player:
             return f"Could not update rsn for {old_rsn}, this player does not exist"
-        if session.query(Player).filter(Player.rsn == new_rsn).one_or_none():
+        if await get_player(session, competition_id, new_rsn):
             return f"RSN {new_rsn} is already in use"
         old_player.rsn = new_rsn
+    cache.roster.invalidate()
 
 
-def list_teams():
-    with Session.begin() as session:
+async def list_teams(competition_id: int):
+    async with transaction() as session:
         teams = {}
-        for team in session.query(Team).all():
-            players = ""
-            for player in session.query(Player).join(Team).filter(Team.name == team.name).all():
-                players += f"{player.rsn}\n"
-            teams[team.name] = players[0:-1] + f"\n{team.lives * '❤️'}"
+        for team in (await get_snapshot(session)).competition_teams(competition_id):
+            teams[team.name] = "\n".join(team.rsns) + f"\n{team.lives * '❤️'}"
         return teams
 
 
-def add_task(task_day: date, description: str, regex_search: str, number_required: int):
-    with Session.begin() as session:
-        day = session.query(Day).filter(Day.date == task_day).one_or_none()
+async def get_sample_messages(limit: int = 500) -> list[str]:
+    async with transaction() as session:
+        messages: Sequence[str] = (await session.scalars(
+            select(Drop.message).order_by(Drop.drop_id.desc()).limit(limit * 4))).all()
+        return list(dict.fromkeys(messages))[:limit]
+
+
+async def profile_regex(regex_search: str) -> (str | None, float | None, str | None):
+    error, cost = await matcher.profile(regex_search, await get_sample_messages())
+    warning: str | None = None
+    if not error and cost >= matcher.WARN_COST:
+        warning = f"Regex `{regex_search}` is slow to match ({matcher.describe_cost(cost)}), consider simplifying it"
+    return error, cost, warning
+
+
+async def add_task(competition_id: int, task_day: date, description: str, regex_search: str,
+                   number_required: int) -> (str | None, str | None):
+    error, cost, warning = await profile_regex(regex_search.lower())
+    if error:
+        return error, None
+    async with write_session() as session:
+        day = await get_day(session, competition_id, task_day)
         if not day:
-            day = Day(date=task_day)
+            day = Day(competition_id=competition_id, date=task_day)
             session.add(day)
         new_task = Task(description=description, regex_search=regex_search.lower(), number_required=number_required,
-                        day=day.date)
+                        competition_id=competition_id, day=day.date, match_cost=cost)
         session.add(new_task)
-
-
-def edit_task(identifier: int, description: str, regex_search: str, number_required: int):
-    with Session.begin() as session:
-        task = session.query(Task).filter(Task.task_id == identifier).one_or_none()
+        await session.flush()
+        await rebuild_progress_counters(session, competition_id, task_day)
+    matcher.invalidate(competition_id, task_day)
+    cache.roster.invalidate()
+    return None, warning
+
+
+async def edit_task(competition_id: int, identifier: int, description: str, regex_search: str,
+                    number_required: int) -> (str | None, str | None):
+    cost, warning = None, None
+    if regex_search:
+        error, cost, warning = await profile_regex(regex_search.lower())
+        if error:
+            return error, None
+    async with write_session() as session:
+        task = await get_task(session, competition_id, identifier)
         if not task:
-            return f"Could not edit task {identifier}, this task does not exist"
+            return f"Could not edit task {identifier}, this task does not exist", None
         if description:
             task.description = description
         if regex_search:
             task.regex_search = regex_search.lower()
+            task.match_cost = cost
         if number_required:
             task.number_required = number_required
-        session.commit()
+        task_day: date = task.day
+        if regex_search:
+            await rebuild_progress_counters(session, competition_id, task_day)
+    if regex_search:
+        matcher.invalidate(competition_id, task_day)
+    cache.roster.invalidate()
+    return None, warning
 
 
-def remove_task(identifier: int):
-    with Session.begin() as session:
-        task = session.query(Task).filter(Task.task_id == identifier).one_or_none()
-        if task:
-            session.delete(task)
+async def remove_task(competition_id: int, identifier: int):
+    async with write_session() as session:
+        task = await get_task(session, competition_id, identifier)
+        if not task:
+            return
+        task_day: date = task.day
+        await session.execute(delete(TeamTaskProgress).where(TeamTaskProgress.task_id == task.task_id))
+        await session.delete(task)
+    matcher.invalidate(competition_id, task_day)
+    cache.roster.invalidate()
 
 
-def change_all_required(day: date, all_required: bool):
-    with Session.begin() as session:
-        day_object: Type[Day] = session.query(Day).filter(Day.date == day).one_or_none()
+async def rebuild_progress(competition_id: int, day: date | None):
+    async with write_session() as session:
+        if day and not await get_day(session, competition_id, day):
+            return f"Day {day.strftime(DAY_FORMAT)} was not found"
+        days: Sequence[date] = [day] if day else (await session.scalars(
+            select(Day.date).where(Day.competition_id == competition_id))).all()
+        for task_day in days:
+            await rebuild_progress_counters(session, competition_id, task_day)
+
+
+async def change_all_required(competition_id: int, day: date, all_required: bool):
+    async with write_session() as session:
+        day_object: Type[Day] = await get_day(session, competition_id, day)
         if not day_object:
             return f"Day {day.strftime(DAY_FORMAT)} was not found"
         day_object.all_required = all_required
+    cache.roster.invalidate()
 
 
-def set_password(day: date, password: str):
-    with Session.begin() as session:
-        day_object: Type[Day] = session.query(Day).filter(Day.date == day).one_or_none()
+async def set_password(competition_id: int, day: date, password: str):
+    async with write_session() as session:
+        day_object: Type[Day] = await get_day(session, competition_id, day)
         if not day_object:
             return f"Day {day.strftime(DAY_FORMAT)} was not found"
         day_object.password = password
+    cache.roster.invalidate()
 
 
-def add_drop(rsn: str, message: str, timestamp: datetime) -> (str, DropNotification):
-    with Session.begin() as session:
+async def add_drop(competition_id: int, rsn: str, message: str, timestamp: datetime) -> (str, DropNotification):
+    async with write_session() as session:
         error = None
         notification = None
-        player = session.query(Player).filter(Player.rsn == rsn).one_or_none()
+        player = await get_player(session, competition_id, rsn)
         if not player:
             return f"Could not add drop, {rsn} does not exist in database", None
         else:
             drop = Drop(player_id=player.player_id, player=player, message=message, date=timestamp)
-            day = get_day(session, timestamp.date())
+            day = await get_cached_day(session, competition_id, timestamp.date())
             session.add(drop)
             if day:
-                for task in day.tasks:
-                    if re.search(task.regex_search, drop.message.lower()):
-                        completed = len(
-                            get_drops_for_team_day(session, drop.player.team, timestamp.date(), task.regex_search))
-                        notification: DropNotification = (DropNotification(drop.player.rsn,
-                                                                           f"{drop.player.rsn} {drop.message[2:]} for {drop.player.team.name}",
-                                                                           f"{task.description}: {completed}/{task.number_required}"))
+                for task, completed in await count_drop(session, day, drop, 1):
+                    notification: DropNotification = drop_notification(player, message, task, completed)
                 if notification is None:
                     error = f"Drop was added successfully, but it did not match any task"
             else:
                 error = f"Drop was added successfully, but it did not match a day with tasks"
-            return error, notification
+    cache.drops.invalidate()
+    return error, notification
 
 
-def delete_drop(identifier: str):
-    with Session.begin() as session:
-        drop = session.query(Drop).filter(Drop.drop_id == identifier).one_or_none()
-        if not drop:
+async def delete_drop(competition_id: int, identifier: str):
+    async with write_session() as session:
+        drop = (await session.scalars(select(Drop).where(Drop.drop_id == identifier))).one_or_none()
+        if not drop or drop.player.team.competition_id != competition_id:
             return f"Could not delete drop, {identifier} does not exist in database"
         else:
-            session.delete(drop)
+            await count_drop(session, await get_cached_day(session, competition_id, drop.date.date()), drop, -1)
+            await session.delete(drop)
+    cache.drops.invalidate()
+
 
+async def get_recent_drops(competition_id: int, limit: int = 1000) -> list[tuple[int, str, str]]:
+    async with transaction() as session:
+        query: Select = select(Drop.drop_id, Player.rsn, Drop.message).join(Drop.player).join(Player.team).where(
+            Team.competition_id == competition_id).order_by(Drop.drop_id.desc()).limit(limit)
+        return [tuple(row) for row in (await session.execute(query)).all()]
 
-def admin_day_view(day: date):
-    with Session.begin() as session:
-        day_object = session.query(Day).filter(Day.date == day).one_or_none()
+
+async def admin_day_view(competition_id: int, day: date):
+    async with transaction() as session:
+        day_object: DaySnapshot = await get_cached_day(session, competition_id, day)
         if not day_object:
             return f"Day {day.strftime(DAY_FORMAT)} was not found", None, None, None
+        day_matcher: matcher.DayMatcher = matcher.get_matcher(day_object)
         lines: list[list] = []
         for task in day_object.tasks:
-            lines.append([f"{task.task_id}", f"{task.description}", f"{task.number_required}", f"{task.regex_search}"])
+            cost: str = matcher.describe_cost(task.match_cost)
+            if task.task_id in day_matcher.overruns:
+                cost += (f" - went over the {matcher.MATCH_BUDGET * 1000:.0f}ms budget "
+                         f"{day_matcher.overruns[task.task_id]} times, "
+                         + ("no longer matched until it is edited" if task.task_id in day_matcher.skipped
+                            else "consider editing it"))
+            lines.append([f"{task.task_id}", f"{task.description}", f"{task.number_required}", f"{task.regex_search}",
+                          cost])
         return None, bool(day_object.all_required), day_object.password, lines
 
 
-def check_day(day: date, progress: Progress):
-    with Session.begin() as session:
-        day_object: Type[Day] = session.query(Day).filter(Day.date == day).one_or_none()
+async def check_day(competition_id: int, day: date, progress: Progress):
+    async with transaction() as session:
+        snapshot: Snapshot = await get_snapshot(session)
+        day_object: DaySnapshot = snapshot.days.get((competition_id, day))
         if not day_object:
             return f"Day {day.strftime(DAY_FORMAT)} was not found"
         progress.set_all_required(day_object.all_required)
-        for team in session.query(Team).all():
+        day_matcher: matcher.DayMatcher = matcher.get_matcher(day_object)
+        counters: dict[tuple[int, int], int] = await get_day_counters(session, competition_id, day)
+        start, end = day_range(day)
+        # Only the columns that are shown, a busy day has too many drops to load as objects
+        query: Select = select(Player.team_id, Player.rsn, Drop.message).join(Drop.player).join(Player.team).where(
+            Team.competition_id == competition_id, Drop.date >= start, Drop.date < end).order_by(Drop.drop_id)
+        connection = await session.connection()
+        rows: Sequence[tuple[int, str, str]] = (await connection.execute(query)).all()
+        # Matching a busy day would hold up the loop
+        team_task_drops: dict[tuple[int, int], list[tuple[str, str]]] = await asyncio.to_thread(
+            group_task_drops, rows, day_matcher)
+        for team in snapshot.competition_teams(competition_id):
             completions: list[bool] = []
             score: Score = Score()
             for task in day_object.tasks:
-                drops: list[Type[Drop]] = get_drops_for_team_day(session, team, day, task.regex_search)
-                drops_number: int = len(drops)
-                completed: bool = drops_number >= task.number_required
-                check: str = '✅️' if completed else '❌'
-                score.add_line(f'{task.description} - {drops_number}/{task.number_required} - {check}')
-                for drop in drops:
-                    score.add_line(f'- *{drop.player.rsn}{drop.message[1:]}*')
-                completions.append(completed)
+                drops_number: int = counters.get((team.team_id, task.task_id), 0)
+                score.add_task(TaskProgress(task.description, drops_number, task.number_required,
+                                            tuple(team_task_drops.get((team.team_id, task.task_id), ()))))
+                completions.append(drops_number >= task.number_required)
             all_complete = all(completions) if day_object.all_required else any(completions)
             score.set_all_completed(all_complete)
             progress.add_score(team.name, score)
 
 
-engine = create_engine("sqlite:///database/database.sqlite")
-Base.metadata.create_all(bind=engine)
-Session = sessionmaker(engine)
+def group_task_drops(rows: Sequence[tuple[int, str, str]],
+                     day_matcher: matcher.DayMatcher) -> dict[tuple[int, int], list[tuple[str, str]]]:
+    team_task_drops: dict[tuple[int, int], list[tuple[str, str]]] = {}
+    # The same few items drop over and over, each distinct message is only matched once
+    matches: dict[str, set[int]] = {}
+    for team_id, rsn, message in rows:
+        if message not in matches:
+            matches[message] = day_matcher.matches(message)
+        for task_id in matches[message]:
+            team_task_drops.setdefault((team_id, task_id), []).append((rsn, message))
+    return team_task_drops
+
+
+async def get_day_counters(session, competition_id: int, day: date) -> dict[tuple[int, int], int]:
+    query: Select = select(TeamTaskProgress.team_id, TeamTaskProgress.task_id, TeamTaskProgress.completed).join(
+        Task).where(Task.competition_id == competition_id, Task.day == day)
+    return {(team_id, task_id): completed for team_id, task_id, completed in (await session.execute(query)).all()}
+
+
+async def get_leaderboard(competition_id: int) -> list[Standing]:
+    async with transaction() as session:
+        query: Select = select(TeamDayResult.team_id, func.sum(TeamDayResult.all_completed), func.count(),
+                               func.sum(TeamDayResult.drops)).where(
+            TeamDayResult.competition_id == competition_id).group_by(TeamDayResult.team_id)
+        totals: dict[int, tuple[int, int, int]] = {
+            team_id: (completed, played, drops)
+            for team_id, completed, played, drops in (await session.execute(query)).all()}
+        standings: list[Standing] = [Standing(team.name, team.lives, *totals.get(team.team_id, (0, 0, 0)))
+                                     for team in (await get_snapshot(session)).competition_teams(competition_id)]
+        return sorted(standings, key=lambda standing: (-standing.lives, -standing.days_completed, -standing.drops))
+
+
+async def get_team_history(competition_id: int, team_name: str) -> (str, list[TeamDayResult]):
+    async with transaction() as session:
+        team: Team = await get_team(session, competition_id, team_name)
+        if not team:
+            return f"Team {team_name} was not found", None
+        query: Select = select(TeamDayResult).where(TeamDayResult.team_id == team.team_id).order_by(TeamDayResult.date)
+        return None, (await session.scalars(query)).all()
+
+
+# Bump whenever the models change, so create_schema runs the migrations again on existing databases
+SCHEMA_VERSION = 4
+
+
+async def create_schema():
+    async with engine.begin() as connection:
+        if (await connection.execute(text("PRAGMA user_version"))).scalar() == SCHEMA_VERSION:
+            return
+        existing_tables: list[str] = await connection.run_sync(lambda sync: inspect(sync).get_table_names())
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(migrate)
+        await connection.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+    if existing_tables and TeamTaskProgress.__tablename__ not in existing_tables:
+        for competition in await get_competitions():
+            await rebuild_progress(competition.competition_id, None)
+
+
+def migrate(connection):
+    """Brings a database created by an older version up to date."""
+    inspector = inspect(connection)
+    team_columns: set[str] = {column["name"] for column in inspector.get_columns(Team.__tablename__)}
+    if "competition_id" not in team_columns:
+        # From before competitions: everything moves into one competition, which the configured guild claims
+        connection.execute(insert(Competition).values(competition_id=1, name="default"))
+        # Keeps SQLite from pointing the foreign keys of other tables at the renamed copies
+        connection.execute(text("PRAGMA legacy_alter_table = ON"))
+        for table in (Team.__table__, Player.__table__, Day.__table__, Task.__table__, LastDay.__table__):
+            rebuild_table(connection, inspector, table)
+        connection.execute(text("PRAGMA legacy_alter_table = OFF"))
+        # The inspector caches what it read, which the rebuilt tables no longer look like
+        inspector = inspect(connection)
+    for table in (Drop.__table__, LastEntry.__table__, Task.__table__):
+        existing_columns: set[str] = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type: str = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {column.name} {column_type}'))
+    for index in Drop.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+
+def rebuild_table(connection, inspector, table: Table):
+    """Recreates a table whose keys changed, which SQLite can't alter, with its rows in the first competition."""
+    existing_columns: set[str] = {column["name"] for column in inspector.get_columns(table.name)}
+    old_name: str = f"{table.name}_old"
+    connection.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"'))
+    table.create(bind=connection)
+    columns: list[str] = [column.name for column in table.columns
+                          if column.name in existing_columns or column.name == "competition_id"]
+    names: str = ", ".join(f'"{column}"' for column in columns)
+    values: str = ", ".join("1" if column == "competition_id" else f'"{column}"' for column in columns)
+    connection.execute(text(f'INSERT INTO "{table.name}" ({names}) SELECT {values} FROM "{old_name}"'))
+    connection.execute(text(f'DROP TABLE "{old_name}"'))
+
+
+async def checkpoint():
+    async with engine.connect() as connection:
+        await connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+
+
+# Selected with the DB_PROFILE environment variable, WAL lets commands read while an update is writing
+STORAGE_PROFILES: dict[str, dict] = {
+    "default": {
+        "pool_size": 5,
+        "pragmas": {"journal_mode": "DELETE", "synchronous": "FULL"},
+    },
+    "wal": {
+        "pool_size": 5,
+        "pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 5000,
+                    "mmap_size": 256 * 1024 * 1024, "cache_size": -64 * 1024},
+    },
+}
+profile_name: str = os.environ.get("DB_PROFILE", "wal")
+if profile_name not in STORAGE_PROFILES:
+    raise ValueError(f"DB_PROFILE {profile_name!r} is not one of {', '.join(STORAGE_PROFILES)}")
+storage_profile: dict = STORAGE_PROFILES[profile_name]
+# Overridden by the replay harness, which runs against a throwaway copy
+database_path: str = os.environ.get("DATABASE_PATH", "database/database.sqlite")
+
+# File databases only get a queue pool by default from SQLAlchemy 2.0.38, before that pool_size is rejected
+engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=AsyncAdaptedQueuePool,
+                             pool_size=storage_profile["pool_size"], max_overflow=0)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class _Turns:
+
+    def __init__(self):
+        # The pool isn't first come, first served, and sessions beyond the cores only contend for the GIL
+        self.sessions: asyncio.Semaphore = asyncio.Semaphore(min(storage_profile["pool_size"], os.cpu_count() or 1))
+        self.writer: asyncio.Lock = asyncio.Lock()
+
+
+# Locks can only be waited on in the loop they were first waited on, the tests and benchmarks run several
+_turns: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Turns] = weakref.WeakKeyDictionary()
+
+
+def turns() -> _Turns:
+    return _turns.setdefault(asyncio.get_running_loop(), _Turns())
+
+
+@asynccontextmanager
+async def transaction():
+    """A session in a transaction, admitted first come, first served."""
+    async with turns().sessions:
+        async with Session.begin() as session:
+            yield session
+
+
+@asynccontextmanager
+async def write_session():
+    """A transaction for changes, one at a time."""
+    async with transaction() as session:
+        # Queued here rather than by SQLite's busy handler, which sleeps for up to 100ms between tries
+        async with turns().writer:
+            yield session
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def apply_storage_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in storage_profile["pragmas"].items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import discord
+
+import metrics
+from structures import DropNotification
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_FIELDS_PER_EMBED = 25
+MAX_CHARACTERS_PER_MESSAGE = 6000
+
+
+def notification_embed(notifications: list[DropNotification]) -> discord.Embed:
+    """Builds one embed for drops of the same team and task, with a field per drop."""
+    embed = discord.Embed(color=0x03f8fc)
+    for notification in notifications:
+        embed.add_field(name=notification.header, value=notification.body, inline=False)
+    embed.set_thumbnail(
+        url=f"https://secure.runescape.com/m=avatar-rs/{notifications[0].rsn.replace(' ', "_")}/chat.png")
+    return embed
+
+
+def build_embeds(notifications: list[DropNotification]) -> list[discord.Embed]:
+    groups: dict[tuple[str, int], list[DropNotification]] = {}
+    for notification in notifications:
+        groups.setdefault((notification.team, notification.task_id), []).append(notification)
+    embeds: list[discord.Embed] = []
+    for group in groups.values():
+        for i in range(0, len(group), MAX_FIELDS_PER_EMBED):
+            embeds.append(notification_embed(group[i:i + MAX_FIELDS_PER_EMBED]))
+    return embeds
+
+
+def pack_messages(embeds: list[discord.Embed]) -> list[list[discord.Embed]]:
+    """Packs embeds into as few messages as Discord's per-message embed and character limits allow."""
+    messages: list[list[discord.Embed]] = []
+    size: int = 0
+    for embed in embeds:
+        full: bool = len(messages[-1]) == MAX_EMBEDS_PER_MESSAGE if messages else True
+        if full or size + len(embed) > MAX_CHARACTERS_PER_MESSAGE:
+            messages.append([])
+            size = 0
+        messages[-1].append(embed)
+        size += len(embed)
+    return messages
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate: float = rate
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now: float = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """Sends drop notifications from a queue in the background, so the update loop never waits on Discord.
+    Everything queued by the time a send starts is merged into as few messages as possible, and sends are
+    paced by a token bucket to stay under Discord's rate limits."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.bucket: TokenBucket = TokenBucket(rate, capacity)
+        self.queue: asyncio.Queue[tuple[discord.abc.Messageable, list[DropNotification]]] = asyncio.Queue()
+        self.task: asyncio.Task | None = None
+        self.messages_sent: int = 0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def submit(self, channel: discord.abc.Messageable, notifications: list[DropNotification]):
+        if notifications:
+            self.queue.put_nowait((channel, notifications))
+
+    async def run(self):
+        while True:
+            channel, notifications = await self.queue.get()
+            pending: dict[discord.abc.Messageable, list[DropNotification]] = {channel: list(notifications)}
+            while not self.queue.empty():
+                channel, notifications = self.queue.get_nowait()
+                pending.setdefault(channel, []).extend(notifications)
+            for channel, notifications in pending.items():
+                # Anything else going wrong with one channel must not stop notifications for good
+                try:
+                    await self.send(channel, notifications)
+                except Exception as e:
+                    print(f"Failed to send {len(notifications)} drop notifications: {e!r}")
+                    metrics.record_error("discord.send")
+
+    async def send(self, channel: discord.abc.Messageable, notifications: list[DropNotification]):
+        for embeds in pack_messages(build_embeds(notifications)):
+            await self.bucket.acquire()
+            try:
+                with metrics.span("discord.send"):
+                    await channel.send(embeds=embeds)
+                self.messages_sent += 1
+            except discord.HTTPException as e:
+                print(f"Could not send {len(embeds)} drop notifications: {e}")
@@ -0,0 +1,173 @@
+import asyncio
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable, NamedTuple
+
+import database as db
+import matcher
+import metrics
+import runemetrics
+from cache import DaySnapshot
+from constants import DATETIME_FORMAT
+from structures import DropNotification
+from workers import DropRecord, PlayerCursor
+
+MAX_EVENTS_PER_BATCH = 1000
+
+
+class DropEvent(NamedTuple):
+    rsn: str
+    message: str
+    date: datetime
+
+
+class BatchResult(NamedTuple):
+    accepted: int
+    duplicates: int
+    unknown: list[str]
+
+
+class IngestError(ValueError):
+    pass
+
+
+def parse_events(payload) -> list[DropEvent]:
+    """Validates a batch of the form {"events": [{"rsn": ..., "message": ..., "timestamp": ...}]}. Timestamps are
+    ISO 8601, and taken as UTC when they have no offset."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("events"), list):
+        raise IngestError('Expected an object with a list of "events"')
+    if len(payload["events"]) > MAX_EVENTS_PER_BATCH:
+        raise IngestError(f"A batch can't have more than {MAX_EVENTS_PER_BATCH} events")
+    events: list[DropEvent] = []
+    for i, event in enumerate(payload["events"]):
+        try:
+            timestamp: datetime = datetime.fromisoformat(event["timestamp"])
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            events.append(DropEvent(str(event["rsn"]), str(event["message"]), timestamp.astimezone(timezone.utc)))
+        except (TypeError, KeyError, ValueError) as e:
+            raise IngestError(f"Event {i} is invalid: {e!r}")
+    return events
+
+
+def ingested_drop_records(players: list[PlayerCursor], events: list[DropEvent],
+                          days: dict[tuple[int, date], DaySnapshot]) -> list[DropRecord]:
+    """Matches the events against the tasks of every competition their player is in. The dedupe key is the one
+    the poller would give the same entry of the event log, so a drop that is both pushed and polled counts once.
+    Identical events within a minute are told apart by their order in the batch, like entries of one log."""
+    by_rsn: dict[str, list[PlayerCursor]] = {}
+    for player in players:
+        by_rsn.setdefault(player.rsn, []).append(player)
+    occurrences: dict[tuple[str, str, str], int] = {}
+    drops: list[DropRecord] = []
+    for event in events:
+        event_date: str = event.date.astimezone(runemetrics.london()).strftime(DATETIME_FORMAT)
+        occurrence: int = occurrences.get((event.rsn, event_date, event.message), 0)
+        occurrences[(event.rsn, event_date, event.message)] = occurrence + 1
+        key: str = runemetrics.entry_key(event_date, event.message, occurrence)
+        for player in by_rsn.get(event.rsn, []):
+            day: DaySnapshot = days.get((player.competition_id, event.date.date()))
+            task_ids: tuple[int, ...] = ()
+            if day:
+                with metrics.span("drops.match"):
+                    task_ids = tuple(matcher.get_matcher(day).matches(event.message))
+            drops.append(DropRecord(player.player_id, event.message, event.date, f"{player.player_id}:{key}",
+                                    task_ids))
+    return drops
+
+
+class IngestServer:
+    """Accepts batches of drop events over HTTP on http://127.0.0.1:<port>/drops, from a client plugin or an
+    import, and runs them through the same matching, storage and notifications as polled drops, without waiting
+    for the next poll.
+
+    Batches wait in a bounded queue, and are refused with a 503 once it is full. Batches that are waiting
+    together are written in one transaction. A batch sent with an Idempotency-Key header that was seen recently
+    gets the response of the first attempt, without being applied again."""
+
+    def __init__(self, notify: Callable[[list[DropNotification]], Awaitable[None]], max_pending: int = 100,
+                 max_keys: int = 10000):
+        self.notify: Callable[[list[DropNotification]], Awaitable[None]] = notify
+        self.queue: asyncio.Queue[tuple[list[DropEvent], asyncio.Future]] = asyncio.Queue(max_pending)
+        self.max_keys: int = max_keys
+        self.results: OrderedDict[str, asyncio.Future] = OrderedDict()
+        self.runner = None
+        self.consumer: asyncio.Task | None = None
+
+    async def start(self, port: int):
+        from aiohttp import web
+
+        async def handle(request: web.Request) -> web.Response:
+            key: str | None = request.headers.get("Idempotency-Key")
+            # A batch that failed is applied again when it is retried
+            if key and key in self.results and not (self.results[key].done() and self.results[key].exception()):
+                self.results.move_to_end(key)
+                return await self.respond(self.results[key])
+            try:
+                events: list[DropEvent] = parse_events(await request.json())
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+            future: asyncio.Future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((events, future))
+            except asyncio.QueueFull:
+                return web.json_response({"error": "Too many pending batches"}, status=503,
+                                         headers={"Retry-After": "5"})
+            if key:
+                self.results[key] = future
+                while len(self.results) > self.max_keys:
+                    self.results.popitem(last=False)
+            return await self.respond(future)
+
+        app = web.Application(client_max_size=4 * 1024 * 1024)
+        app.router.add_post("/drops", handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        self.consumer = asyncio.create_task(self.consume())
+
+    async def respond(self, future: asyncio.Future):
+        from aiohttp import web
+        try:
+            result: BatchResult = await asyncio.shield(future)
+        except Exception as e:
+            return web.json_response({"error": repr(e)}, status=500)
+        return web.json_response(result._asdict())
+
+    async def consume(self):
+        while True:
+            batches: list[tuple[list[DropEvent], asyncio.Future]] = [await self.queue.get()]
+            while not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            try:
+                results, notifications = await self.apply([events for events, _ in batches])
+            except Exception as e:
+                print(f"Failed to ingest {len(batches)} batches: {e!r}")
+                for _, future in batches:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batches, results):
+                future.set_result(result)
+            if notifications:
+                try:
+                    await self.notify(notifications)
+                except Exception as e:
+                    print(f"Failed to send notifications of ingested drops: {e!r}")
+
+    async def apply(self, batches: list[list[DropEvent]]) -> (list[BatchResult], list[DropNotification]):
+        with metrics.span("ingest.batch"):
+            rsns: list[str] = list(dict.fromkeys(event.rsn for events in batches for event in events))
+            players: list[PlayerCursor] = await db.get_player_cursors(rsns)
+            days: dict[tuple[int, date], DaySnapshot] = await db.get_days()
+            records: list[list[DropRecord]] = [ingested_drop_records(players, events, days) for events in batches]
+            notifications, inserted = await db.apply_drop_records(
+                datetime.now(timezone.utc).date(), [drop for drops in records for drop in drops], [])
+        known: set[str] = {player.rsn for player in players}
+        results: list[BatchResult] = []
+        for events, drops in zip(batches, records):
+            # A drop sent in two of the batches is only accepted for the first one
+            accepted: int = sum(drop.dedupe_key in inserted for drop in drops)
+            inserted -= {drop.dedupe_key for drop in drops}
+            unknown: list[str] = list(dict.fromkeys(event.rsn for event in events if event.rsn not in known))
+            results.append(BatchResult(accepted, len(drops) - accepted, unknown))
+        return results, notifications
@@ -0,0 +1,155 @@
+import asyncio
+import re
+import threading
+import time
+from datetime import date
+
+import metrics
+from models import Day, Task
+
+# A pattern that takes longer than this on a single message stalls the tick, it is reported to the admins
+MATCH_BUDGET = 0.005
+# Patterns whose worst case on the sample corpus is above this are flagged as slow to the admins
+WARN_COST = MATCH_BUDGET / 10
+# A task that goes over the budget this many times within the window is no longer matched, until it is edited
+MAX_OVERRUNS = 3
+OVERRUN_WINDOW = 600
+PROFILE_TIMEOUT = 3
+
+_matchers: dict[tuple[int, date], "DayMatcher"] = {}
+
+
+class DayMatcher:
+    """Matches a drop message against all tasks of a day, with every task regex compiled once for the day.
+
+    The patterns are tried one after the other. A single pattern combining them all was measured to be slower
+    (bench/match_tasks.py), as a combined pattern loses the literal prefix search re does for each on its own.
+
+    When a message takes longer than MATCH_BUDGET, every pattern is timed on it again to find the slow ones, in
+    CPU time of the thread, so a pause of the process isn't blamed on the tasks. Their overruns are counted and
+    shown to the admins with the day's tasks. A task that overruns MAX_OVERRUNS times within OVERRUN_WINDOW seconds
+    is skipped from then on, so a bad pattern can only stall a few ticks. Timing every pattern as it is tried,
+    instead of timing them again, halved the matcher's throughput (bench/match_tasks.py).
+    """
+
+    def __init__(self, tasks: list[Task]):
+        self.patterns: list[tuple[int, re.Pattern]] = [(task.task_id, re.compile(task.regex_search))
+                                                       for task in tasks]
+        self.overruns: dict[int, int] = {}
+        self.recent_overruns: dict[int, list[float]] = {}
+        self.skipped: set[int] = set()
+
+    def matches(self, message: str) -> set[int]:
+        """Returns the IDs of all tasks whose regex matches the lowercased message."""
+        message = message.lower()
+        started: float = time.perf_counter()
+        matched: set[int] = {task_id for task_id, pattern in self.patterns if pattern.search(message) is not None}
+        seconds: float = time.perf_counter() - started
+        if seconds > MATCH_BUDGET:
+            metrics.observe("drops.match.overrun", seconds)
+            self.find_overruns(message)
+        return matched
+
+    def find_overruns(self, message: str):
+        for task_id, pattern in self.patterns:
+            started: float = time.thread_time()
+            pattern.search(message)
+            seconds: float = time.thread_time() - started
+            if seconds > MATCH_BUDGET:
+                self.overrun(task_id, message, seconds)
+
+    def overrun(self, task_id: int, message: str, seconds: float):
+        self.overruns[task_id] = self.overruns.get(task_id, 0) + 1
+        if self.overruns[task_id] == 1:
+            print(f"Task {task_id} took {seconds * 1000:.1f}ms to match {message!r}, over the "
+                  f"{MATCH_BUDGET * 1000:.0f}ms budget")
+        now: float = time.monotonic()
+        recent: list[float] = [moment for moment in self.recent_overruns.get(task_id, [])
+                               if now - moment < OVERRUN_WINDOW] + [now]
+        self.recent_overruns[task_id] = recent
+        if len(recent) >= MAX_OVERRUNS:
+            # Replaced rather than changed in place, the list may be iterated in another thread
+            self.patterns = [(other_id, pattern) for other_id, pattern in self.patterns if other_id != task_id]
+            self.skipped.add(task_id)
+            print(f"Task {task_id} went over the budget {len(recent)} times in {OVERRUN_WINDOW // 60} minutes, it "
+                  f"is no longer matched until it is edited")
+
+
+def get_matcher(day: Day) -> DayMatcher:
+    matcher: DayMatcher = _matchers.get((day.competition_id, day.date))
+    if matcher is None:
+        matcher = DayMatcher(day.tasks)
+        _matchers[(day.competition_id, day.date)] = matcher
+    return matcher
+
+
+def invalidate(competition_id: int, day: date):
+    _matchers.pop((competition_id, day), None)
+
+
+def adversarial_messages(regex: str) -> list[str]:
+    """Long runs of the characters a pattern matches, followed by one it doesn't. Nested quantifiers like
+    `(a+)+$` try every way of splitting such a run before giving up, which is what makes them blow up."""
+    characters: set[str] = {character for character in regex if character.isalnum() or character == " "}
+    messages: list[str] = ["i found " + "dragon " * 300, " " * 2000 + "!"]
+    for character in sorted(characters | {"a", "1", " "}):
+        messages.append("i found " + character * 40 + "\x00")
+        messages.append(character * 40 + "\x00")
+        messages.append("i found " + f"{character} " * 40 + "\x00")
+    return messages
+
+
+def worst_match_seconds(regex: str, messages: list[str]) -> float:
+    pattern: re.Pattern = re.compile(regex)
+    worst: float = 0.0
+    for message in messages:
+        started: float = time.thread_time()
+        pattern.search(message.lower())
+        worst = max(worst, time.thread_time() - started)
+    return worst
+
+
+# One worker kept warm, so a profile isn't charged for starting an interpreter and its imports
+_profiler = None
+_profiler_lock: threading.Lock = threading.Lock()
+
+
+def profile_in_process(regex: str, messages: list[str]) -> float | None:
+    import multiprocessing
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = multiprocessing.get_context("spawn").Pool(1)
+            # The timeout only starts once the worker is up
+            _profiler.apply(int)
+        try:
+            return _profiler.apply_async(worst_match_seconds, (regex, messages)).get(PROFILE_TIMEOUT)
+        except multiprocessing.TimeoutError:
+            # A pattern can backtrack for longer than anyone would wait, only a process can be stopped part way
+            # through
+            _profiler.terminate()
+            _profiler = None
+            return None
+
+
+async def profile(regex: str, messages: list[str]) -> (str | None, float | None):
+    """Compiles a task regex and times it on the given drop messages and on inputs known to make patterns
+    backtrack. Returns an error if it can't be used, and the worst time it took on a single message."""
+    try:
+        re.compile(regex)
+    except re.error as e:
+        return f"Invalid regex `{regex}`: {e}", None
+    seconds: float | None = await asyncio.get_running_loop().run_in_executor(
+        None, profile_in_process, regex, messages + adversarial_messages(regex))
+    if seconds is None or seconds > MATCH_BUDGET:
+        took: str = f"more than {PROFILE_TIMEOUT}s" if seconds is None else f"{seconds * 1000:.1f}ms"
+        return (f"Regex `{regex}` took {took} to match a single message, which would stall polling. Avoid nesting "
+                f"quantifiers like `(a+)+`"), seconds
+    return None, seconds
+
+
+def describe_cost(seconds: float | None) -> str:
+    if seconds is None:
+        return "not profiled"
+    warning: str = " - slow" if seconds >= WARN_COST else ""
+    return f"{seconds * 1_000_000:.0f}µs worst case{warning}"
@@ -0,0 +1,114 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import NamedTuple
+
+_histograms: dict[str, "Histogram"] = {}
+_runner = None
+
+
+class Histogram:
+    """Keeps the most recent `size` durations of a span, along with lifetime totals."""
+
+    def __init__(self, size: int = 1000):
+        self.samples: deque[float] = deque(maxlen=size)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.errors: int = 0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered: list[float] = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Recorded(NamedTuple):
+    samples: list[float]
+    count: int
+    total: float
+    errors: int
+
+
+def histogram(name: str) -> Histogram:
+    if name not in _histograms:
+        _histograms[name] = Histogram()
+    return _histograms[name]
+
+
+def observe(name: str, seconds: float):
+    histogram(name).observe(seconds)
+
+
+def record_error(name: str):
+    histogram(name).errors += 1
+
+
+@contextmanager
+def span(name: str):
+    """Times the enclosed block. Exceptions are counted as errors of the span and re-raised."""
+    start: float = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(name)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def drain() -> dict[str, Recorded]:
+    """Returns everything recorded since the last drain and starts over, so a worker process can hand its spans
+    to the main process along with its results."""
+    recorded: dict[str, Recorded] = {name: Recorded(list(hist.samples), hist.count, hist.total, hist.errors)
+                                     for name, hist in _histograms.items()}
+    _histograms.clear()
+    return recorded
+
+
+def merge(recorded: dict[str, Recorded]):
+    for name, spans in recorded.items():
+        hist: Histogram = histogram(name)
+        hist.samples.extend(spans.samples)
+        hist.count += spans.count
+        hist.total += spans.total
+        hist.errors += spans.errors
+
+
+def summary() -> list[tuple[str, Histogram]]:
+    return sorted(_histograms.items())
+
+
+def render_prometheus() -> str:
+    lines: list[str] = ["# TYPE frosty_span_seconds summary"]
+    for name, hist in summary():
+        for q in (0.5, 0.95, 0.99):
+            lines.append(f'frosty_span_seconds{{span="{name}",quantile="{q}"}} {hist.quantile(q)}')
+        lines.append(f'frosty_span_seconds_sum{{span="{name}"}} {hist.total}')
+        lines.append(f'frosty_span_seconds_count{{span="{name}"}} {hist.count}')
+    lines.append("# TYPE frosty_span_errors_total counter")
+    for name, hist in summary():
+        lines.append(f'frosty_span_errors_total{{span="{name}"}} {hist.errors}')
+    return "\n".join(lines) + "\n"
+
+
+async def start_server(port: int):
+    """Serves the metrics in Prometheus text format on http://127.0.0.1:<port>/metrics."""
+    global _runner
+    if _runner is not None:
+        return
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, "127.0.0.1", port).start()
@@ -1,7 +1,7 @@
 from typing import List, Optional
 import datetime
 
-from sqlalchemy import Integer, String, ForeignKey
+from sqlalchemy import Integer, String, ForeignKey, ForeignKeyConstraint, Index, UniqueConstraint
 from sqlalchemy.orm import relationship, Mapped, DeclarativeBase, mapped_column
 
 
@@ -9,30 +9,52 @@ class Base(DeclarativeBase):
     pass
 
 
+class Competition(Base):
+    __tablename__ = "competition"
+    competition_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    name: Mapped[str]
+    guild_id: Mapped[Optional[int]] = mapped_column(unique=True)
+    channel_id: Mapped[Optional[int]]
+
+
 class Team(Base):
     __tablename__ = "team"
     team_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    name: Mapped[str] = mapped_column(unique=True)
+    competition_id: Mapped[int] = mapped_column(ForeignKey("competition.competition_id"))
+    name: Mapped[str]
     lives: Mapped[int] = mapped_column(default=3)
     #players: Mapped[List["Player"]] = relationship(back_populates="team")
+    __table_args__ = (
+        UniqueConstraint("competition_id", "name"),
+    )
 
 
 class Player(Base):
     __tablename__ = "player"
     player_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    rsn: Mapped[str] = mapped_column(unique=True)
+    rsn: Mapped[str]
     team_id: Mapped[int] = mapped_column(ForeignKey("team.team_id"))
-    team: Mapped["Team"] = relationship()
+    team: Mapped["Team"] = relationship(lazy="joined")
     #drops: Mapped[List["Drop"]] = relationship(back_populates="player")
+    # An RSN is unique within a competition, but the same player may compete in several
+    __table_args__ = (
+        Index("ix_player_rsn", "rsn"),
+    )
 
 
 class Drop(Base):
     __tablename__ = "drop"
     drop_id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     player_id: Mapped[int] = mapped_column(ForeignKey("player.player_id"))
-    player: Mapped["Player"] = relationship()
+    player: Mapped["Player"] = relationship(lazy="joined")
     message: Mapped[str]
     date: Mapped[datetime.datetime]
+    dedupe_key: Mapped[Optional[str]]
+    __table_args__ = (
+        Index("ix_drop_date", "date"),
+        Index("ix_drop_player_date", "player_id", "date"),
+        Index("ix_drop_dedupe_key", "dedupe_key", unique=True),
+    )
 
 
 class Task(Base):
@@ -41,14 +63,21 @@ class Task(Base):
     description: Mapped[str]
     regex_search: Mapped[str]
     number_required: Mapped[int]
-    day: Mapped[datetime.date] = mapped_column(ForeignKey("day.date"))
+    competition_id: Mapped[int]
+    day: Mapped[datetime.date]
+    # Worst time the regex took on a single message when it was saved, in seconds
+    match_cost: Mapped[Optional[float]]
+    __table_args__ = (
+        ForeignKeyConstraint(["competition_id", "day"], ["day.competition_id", "day.date"]),
+    )
 
 
 class Day(Base):
     __tablename__ = "day"
+    competition_id: Mapped[int] = mapped_column(ForeignKey("competition.competition_id"), primary_key=True)
     date: Mapped[datetime.date] = mapped_column(primary_key=True)
     all_required: Mapped[int] = mapped_column(default=1)
-    tasks: Mapped[List["Task"]] = relationship()
+    tasks: Mapped[List["Task"]] = relationship(lazy="selectin")
     password: Mapped[Optional[str]]
 
 
@@ -56,9 +85,47 @@ class LastEntry(Base):
     __tablename__ = "last_entry"
     player_id: Mapped[str] = mapped_column(ForeignKey("player.player_id"), primary_key=True)
     date: Mapped[str]
+    seen: Mapped[Optional[str]]
 
 
 class LastDay(Base):
     __tablename__ = "last_day"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    competition_id: Mapped[int] = mapped_column(ForeignKey("competition.competition_id"), primary_key=True)
     day: Mapped[datetime.date]
+
+
+class TeamTaskProgress(Base):
+    __tablename__ = "team_task_progress"
+    team_id: Mapped[int] = mapped_column(ForeignKey("team.team_id"), primary_key=True)
+    task_id: Mapped[int] = mapped_column(ForeignKey("task.task_id"), primary_key=True)
+    completed: Mapped[int] = mapped_column(default=0)
+
+
+class TeamDayResult(Base):
+    __tablename__ = "team_day_result"
+    # How a team ended a day, written once when the day rolls over and never changed afterwards
+    team_id: Mapped[int] = mapped_column(ForeignKey("team.team_id"), primary_key=True)
+    date: Mapped[datetime.date] = mapped_column(primary_key=True)
+    competition_id: Mapped[int] = mapped_column(ForeignKey("competition.competition_id"))
+    all_completed: Mapped[int]
+    tasks_completed: Mapped[int]
+    drops: Mapped[int]
+    lives: Mapped[int]
+    tasks: Mapped[List["TeamDayTaskResult"]] = relationship(lazy="selectin")
+    __table_args__ = (
+        Index("ix_team_day_result_competition", "competition_id", "date"),
+    )
+
+
+class TeamDayTaskResult(Base):
+    __tablename__ = "team_day_task_result"
+    team_id: Mapped[int] = mapped_column(primary_key=True)
+    date: Mapped[datetime.date] = mapped_column(primary_key=True)
+    task_id: Mapped[int] = mapped_column(primary_key=True)
+    # Copied from the task, so the history still reads right after the task is edited or removed
+    description: Mapped[str]
+    completed: Mapped[int]
+    required: Mapped[int]
+    __table_args__ = (
+        ForeignKeyConstraint(["team_id", "date"], ["team_day_result.team_id", "team_day_result.date"]),
+    )
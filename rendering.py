@@ -0,0 +1,114 @@
+from io import BytesIO
+from typing import Iterable, Iterator
+
+import discord
+
+import metrics
+from dispatcher import MAX_CHARACTERS_PER_MESSAGE, MAX_FIELDS_PER_EMBED
+from structures import Progress, Score
+
+MAX_FIELD_CHARACTERS = 1024
+# Past this many pages, a file is easier to read than paging through embeds
+MAX_PAGES = 10
+# The size estimate is approximate, so pages are planned with some room to spare
+PAGE_BUDGET = MAX_CHARACTERS_PER_MESSAGE - 1000
+
+
+def field_values(score: Score) -> Iterator[str]:
+    """Splits the lines of a score into field values no longer than Discord allows."""
+    value: str = ""
+    for line in score.lines():
+        line = line[:MAX_FIELD_CHARACTERS]
+        if value and len(value) + 1 + len(line) > MAX_FIELD_CHARACTERS:
+            yield value
+            value = ""
+        value = f"{value}\n{line}" if value else line
+    yield value or "-"
+
+
+def progress_fields(progress: Progress) -> Iterator[tuple[str, str]]:
+    for team_name, score in progress.scores.items():
+        check: str = '✅️' if score.all_completed else '❌'
+        for i, value in enumerate(field_values(score)):
+            yield f'**{team_name} - {check} **' if i == 0 else f'**{team_name} (continued)**', value
+
+
+def field_pages(title: str, fields: Iterable[tuple[str, str]]) -> list[discord.Embed]:
+    """Lays the fields out over as many embeds as needed, each of which fits in a message of its own."""
+    pages: list[discord.Embed] = []
+    embed: discord.Embed | None = None
+    for name, value in fields:
+        if (embed is None or len(embed.fields) == MAX_FIELDS_PER_EMBED
+                or len(embed) + len(name) + len(value) > MAX_CHARACTERS_PER_MESSAGE - 50):
+            embed = discord.Embed(title=f"__**{title}**__", color=0x03f8fc)
+            pages.append(embed)
+        embed.add_field(name=name, value=value, inline=False)
+    if not pages:
+        pages.append(discord.Embed(title=f"__**{title}**__", color=0x03f8fc))
+    if len(pages) > 1:
+        for i, page in enumerate(pages):
+            page.set_footer(text=f"Page {i + 1}/{len(pages)}")
+    return pages
+
+
+def progress_file(title: str, progress: Progress) -> discord.File:
+    """Writes the progress as plain text, one line at a time."""
+    buffer: BytesIO = BytesIO()
+    buffer.write(title.encode())
+    for team_name, score in progress.scores.items():
+        check: str = '✅️' if score.all_completed else '❌'
+        buffer.write(f"\n{team_name} - {check}".encode())
+        for line in score.lines(markdown=False):
+            buffer.write(f"\n{line}".encode())
+        buffer.write(b"\n")
+    buffer.seek(0)
+    return discord.File(buffer, filename="progress.txt")
+
+
+class PageView(discord.ui.View):
+    def __init__(self, pages: list[discord.Embed]):
+        super().__init__(timeout=600)
+        self.pages: list[discord.Embed] = pages
+        self.page: int = 0
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == len(self.pages) - 1
+
+    async def show(self, interaction: discord.Interaction):
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.pages[self.page], view=self)
+
+    @discord.ui.button(label="Previous page", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page -= 1
+        await self.show(interaction)
+
+    @discord.ui.button(label="Next page", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page += 1
+        await self.show(interaction)
+
+
+async def send_pages(followup: discord.Webhook, pages: list[discord.Embed], ephemeral: bool = False):
+    if len(pages) == 1:
+        await followup.send(embed=pages[0], ephemeral=ephemeral)
+    else:
+        await followup.send(embed=pages[0], view=PageView(pages), ephemeral=ephemeral)
+
+
+async def send_progress(followup: discord.Webhook, title: str, progress: Progress):
+    """Sends the progress as embeds, paged with buttons if it doesn't fit in one, or as a text file if it would
+    take too many pages. The choice is made up front from the size of the progress, rather than by waiting for
+    Discord to reject an embed that is too large."""
+    with metrics.span("progress.render"):
+        if progress.size() > PAGE_BUDGET * MAX_PAGES:
+            file: discord.File = progress_file(title, progress)
+            pages: list[discord.Embed] = []
+        else:
+            pages = field_pages(title, progress_fields(progress))
+    if not pages:
+        await followup.send(file=file)
+    else:
+        await send_pages(followup, pages)
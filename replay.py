@@ -0,0 +1,220 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple
+
+from constants import DATETIME_FORMAT
+
+type Tick = tuple[datetime, dict[str, list[dict[str, str]]]]
+
+
+class Recorder:
+    """Appends the event logs that changed during a tick to a JSON lines file, one line per tick."""
+
+    def __init__(self, path: str):
+        self.path: str = path
+
+    def record(self, now: datetime, event_logs: dict[str, list[dict[str, str]]]):
+        with open(self.path, "a") as file:
+            file.write(json.dumps({"time": now.isoformat(), "logs": event_logs}) + "\n")
+
+
+class FakeChannel:
+    """Stands in for a Discord channel and counts what would have been sent to it."""
+
+    def __init__(self):
+        self.messages: int = 0
+        self.embeds: int = 0
+
+    async def send(self, content: str = None, embed=None, embeds: list = None, **kwargs):
+        self.messages += 1
+        self.embeds += len(embeds) if embeds else int(embed is not None)
+
+
+class TickReport(NamedTuple):
+    time: str
+    tick_seconds: float
+    check_seconds: float
+    queries: int
+    drops: int
+    matches: int
+    notifications: int
+    messages: int
+
+
+def load_corpus(path: str) -> list[Tick]:
+    ticks: list[Tick] = []
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                tick: dict = json.loads(line)
+                ticks.append((datetime.fromisoformat(tick["time"]), tick["logs"]))
+    return ticks
+
+
+def synthesize(players: int, ticks: int, interval: timedelta, start: datetime, seed: int = 0) -> list[Tick]:
+    """Generates a corpus in which every player finds something every few ticks."""
+    import runemetrics
+    items: list[str] = ["dragon bones", "a rune platebody", "an abyssal whip", "a clue scroll (hard)", "some coins",
+                        "a dragon hatchet", "a crystal key", "an onyx"]
+    rng: random.Random = random.Random(seed)
+    event_logs: dict[str, list[dict[str, str]]] = {f"player {i}": [] for i in range(players)}
+    corpus: list[Tick] = []
+    for tick in range(ticks):
+        now: datetime = start + tick * interval
+        changed: dict[str, list[dict[str, str]]] = {}
+        for rsn, event_log in event_logs.items():
+            if rng.random() < 0.3:
+                text: str = f"I found {rng.choice(items)}" if rng.random() < 0.6 else "I levelled my Slayer skill"
+                event_date: str = now.astimezone(runemetrics.london()).strftime(DATETIME_FORMAT)
+                event_log.insert(0, {"date": event_date, "text": text, "details": text})
+                del event_log[runemetrics.PAGE_SIZE:]
+                changed[rsn] = list(event_log)
+        corpus.append((now, changed))
+    return corpus
+
+
+async def seed_competition(db, corpus: list[Tick], team_size: int):
+    """Fills an empty database with one competition, teams of the players in the corpus and a few tasks on
+    every day the corpus covers."""
+    await db.claim_competition(0, 0)
+    competition_id: int = (await db.get_competition(0)).competition_id
+    rsns: list[str] = list(dict.fromkeys(rsn for _, event_logs in corpus for rsn in event_logs))
+    for i, rsn in enumerate(rsns):
+        team_name: str = f"Team {i // team_size + 1}"
+        if i % team_size == 0:
+            await db.add_team(competition_id, team_name)
+        await db.add_player(competition_id, rsn, team_name)
+    days: set[date] = {tick_time.astimezone(timezone.utc).date() for tick_time, _ in corpus}
+    for day in sorted(days):
+        await db.add_task(competition_id, day, "Dragon bones", "dragon bones", 3)
+        await db.add_task(competition_id, day, "Any rune or dragon item", r"i found an? (rune|dragon) \w+", 2)
+
+
+async def replay(corpus: list[Tick], check: bool) -> list[TickReport]:
+    import database as db
+    from dispatcher import build_embeds, pack_messages
+    from models import Drop, TeamTaskProgress
+    from rollover import start_new_day
+    from sqlalchemy import event, func, select
+
+    queries: list[int] = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    async def totals() -> (int, int):
+        async with db.Session() as session:
+            drops: int = (await session.execute(select(func.count(Drop.drop_id)))).scalar()
+            matches: int = (await session.execute(select(func.sum(TeamTaskProgress.completed)))).scalar() or 0
+            return drops, matches
+
+    event.listen(db.engine.sync_engine, "before_cursor_execute", count_query)
+    channel: FakeChannel = FakeChannel()
+    reports: list[TickReport] = []
+    for tick_time, event_logs in corpus:
+        current_day: date = tick_time.astimezone(timezone.utc).date()
+        drops_before, matches_before = await totals()
+        queries_before, messages_before = queries[0], channel.messages
+        started: float = time.perf_counter()
+        competitions = await db.get_competitions()
+        for competition in competitions:
+            await start_new_day(competition.competition_id, channel, current_day)
+        notifications = await db.periodic_update(current_day, event_logs)
+        for embeds in pack_messages(build_embeds(notifications)):
+            await channel.send(embeds=embeds)
+        tick_seconds: float = time.perf_counter() - started
+        started = time.perf_counter()
+        if check:
+            from structures import Progress
+            for competition in competitions:
+                await db.check_day(competition.competition_id, current_day, Progress())
+        check_seconds: float = time.perf_counter() - started
+        queries_issued: int = queries[0] - queries_before
+        drops_after, matches_after = await totals()
+        reports.append(TickReport(tick_time.isoformat(), tick_seconds, check_seconds, queries_issued,
+                                  drops_after - drops_before, matches_after - matches_before, len(notifications),
+                                  channel.messages - messages_before))
+    return reports
+
+
+def quantile(values: list[float], q: float) -> float:
+    ordered: list[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def summarize(reports: list[TickReport]) -> dict:
+    tick_seconds: list[float] = [report.tick_seconds for report in reports]
+    check_seconds: list[float] = [report.check_seconds for report in reports]
+    return {
+        "ticks": len(reports),
+        "tick_seconds": {"p50": quantile(tick_seconds, 0.5), "p95": quantile(tick_seconds, 0.95),
+                         "max": max(tick_seconds, default=0.0), "total": sum(tick_seconds)},
+        "check_seconds": {"p50": quantile(check_seconds, 0.5), "p95": quantile(check_seconds, 0.95),
+                          "max": max(check_seconds, default=0.0)},
+        "queries": sum(report.queries for report in reports),
+        "drops": sum(report.drops for report in reports),
+        "matches": sum(report.matches for report in reports),
+        "notifications": sum(report.notifications for report in reports),
+        "messages": sum(report.messages for report in reports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays recorded event logs (run the bot with RECORD_TICKS=<path> "
+                                                 "to record them) through the update pipeline against a throwaway "
+                                                 "database, and reports how every tick performed.")
+    parser.add_argument("corpus", nargs="?", help="JSON lines file written by the bot with RECORD_TICKS")
+    parser.add_argument("--synthetic", type=int, metavar="PLAYERS", help="generate a corpus instead of loading one")
+    parser.add_argument("--ticks", type=int, default=576, help="ticks to generate, 5 minutes apart (default: 2 days)")
+    parser.add_argument("--seed", help="database to copy as the starting point, instead of generating teams and tasks")
+    parser.add_argument("--team-size", type=int, default=5)
+    parser.add_argument("--no-check", action="store_true", help="skip running check_day after every tick")
+    parser.add_argument("--report", help="write the per-tick report and summary to this JSON file")
+    args = parser.parse_args()
+    if args.synthetic:
+        start: datetime = datetime(2024, 1, 1, 22, tzinfo=timezone.utc)
+        corpus: list[Tick] = synthesize(args.synthetic, args.ticks, timedelta(minutes=5), start)
+    elif args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        parser.error("either a corpus or --synthetic is required")
+
+    directory: str = tempfile.mkdtemp(prefix="frosty-replay-")
+    os.environ["DATABASE_PATH"] = os.path.join(directory, "database.sqlite")
+    if args.seed:
+        shutil.copyfile(args.seed, os.environ["DATABASE_PATH"])
+
+    async def run() -> list[TickReport]:
+        import database as db
+        await db.create_schema()
+        if not args.seed:
+            await seed_competition(db, corpus, args.team_size)
+        reports: list[TickReport] = await replay(corpus, not args.no_check)
+        await db.engine.dispose()
+        return reports
+
+    try:
+        reports: list[TickReport] = asyncio.run(run())
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    summary: dict = summarize(reports)
+    print(f"{summary['ticks']} ticks: tick p50 {summary['tick_seconds']['p50'] * 1000:.1f}ms, "
+          f"p95 {summary['tick_seconds']['p95'] * 1000:.1f}ms, max {summary['tick_seconds']['max'] * 1000:.1f}ms; "
+          f"check_day p50 {summary['check_seconds']['p50'] * 1000:.1f}ms, "
+          f"p95 {summary['check_seconds']['p95'] * 1000:.1f}ms")
+    print(f"{summary['queries']} queries, {summary['drops']} drops stored, {summary['matches']} task matches, "
+          f"{summary['notifications']} notifications in {summary['messages']} messages")
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump({"summary": summary, "ticks": [report._asdict() for report in reports]}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
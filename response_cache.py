@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+# The cache only spares downloads after a restart, so it is written at most this often
+SAVE_INTERVAL = 15 * 60
+
+
+class CachedResponse(NamedTuple):
+    etag: str | None
+    last_modified: str | None
+    body_hash: str
+    activities: list[dict[str, str]]
+    parse_seconds: float
+
+
+class ResponseCache:
+    """Remembers the last RuneMetrics response per player, so an unchanged profile doesn't have to be decoded
+    or searched for drops again. Responses fetched during a tick only become visible to later ticks once the
+    tick commits, so a failed update can't cause new drops to be skipped as unchanged."""
+
+    def __init__(self, path: str, max_entries: int, save_interval: float = SAVE_INTERVAL):
+        self.path: str = path
+        self.max_entries: int = max_entries
+        self.save_interval: float = save_interval
+        self.saved_at: float = time.monotonic()
+        self.dirty: bool = False
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.pending: dict[str, CachedResponse] = {}
+        self.bytes_downloaded: int = 0
+        self.cpu_seconds_saved: float = 0.0
+        self.unchanged: int = 0
+
+    def get(self, key: str) -> CachedResponse | None:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        return self.entries.get(key)
+
+    def put(self, key: str, response: CachedResponse):
+        self.pending[key] = response
+
+    def record_unchanged(self, response: CachedResponse):
+        self.unchanged += 1
+        self.cpu_seconds_saved += response.parse_seconds
+
+    def commit(self) -> (int, float, int):
+        """Keeps the responses of the current tick, evicting the least recently used ones beyond
+        `max_entries`. Returns the bytes downloaded, CPU seconds saved and number of unchanged responses since
+        the previous commit."""
+        self.dirty = self.dirty or bool(self.pending)
+        for key, response in self.pending.items():
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+        self.pending.clear()
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        stats = (self.bytes_downloaded, self.cpu_seconds_saved, self.unchanged)
+        self.bytes_downloaded, self.cpu_seconds_saved, self.unchanged = 0, 0.0, 0
+        return stats
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                for key, response in json.load(file).items():
+                    self.entries[key] = CachedResponse(**response)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Could not load response cache, starting empty: {e!r}")
+            self.entries.clear()
+
+    async def save_if_due(self):
+        """Writes the committed responses if they changed and `save_interval` has passed since the last write.
+        Encoding thousands of event logs takes a while, so it is done in a thread, on a copy of the entries."""
+        if not self.dirty or time.monotonic() - self.saved_at < self.save_interval:
+            return
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        try:
+            await asyncio.to_thread(self.save, list(self.entries.items()))
+        except OSError as e:
+            print(f"Could not save response cache: {e!r}")
+            self.dirty = True
+
+    def save(self, entries: list[tuple[str, CachedResponse]]):
+        temporary_path: str = self.path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({key: response._asdict() for key, response in entries}, file)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable
+
+import discord
+
+import database as db
+import metrics
+from cache import CompetitionSnapshot, DaySnapshot
+from structures import DayOutcome
+
+# The rollover loop can wake up a moment before midnight
+ROLLOVER_SLACK = timedelta(minutes=1)
+
+# The description of a day's tasks, rendered ahead of the rollover, with the day it was rendered from
+_prepared: dict[tuple[int, date], tuple[DaySnapshot, str]] = {}
+
+
+async def prepare(day: date):
+    """Renders the tasks of `day` for every competition ahead of time, so the rollover only has to send them."""
+    for (competition_id, day_date), day_object in (await db.get_days()).items():
+        if day_date == day:
+            await task_description(competition_id, day, day_object)
+    for key in [key for key in _prepared if key[1] < day]:
+        del _prepared[key]
+
+
+async def task_description(competition_id: int, day: date, day_object: DaySnapshot = None) -> str | None:
+    """Returns the prepared description of the tasks of `day`, rendering it again if the tasks were edited
+    since."""
+    if day_object is None:
+        day_object = (await db.get_days()).get((competition_id, day))
+    if day_object is None:
+        return None
+    prepared: tuple[DaySnapshot, str] | None = _prepared.get((competition_id, day))
+    if prepared is None or prepared[0] != day_object:
+        prepared = day_object, db.describe_day(day_object)
+        _prepared[(competition_id, day)] = prepared
+    return prepared[1]
+
+
+def outcome_field(outcome: DayOutcome) -> (str, str):
+    title: str = f'**{outcome.team} - {outcome.lives * '❤️'} **'
+    if outcome.all_completed:
+        content: str = f'{outcome.team} completed yesterday\'s quest, congratulations!'
+    elif outcome.lives > 0:
+        content: str = f'{outcome.team} failed to complete yesterday\'s quest.'
+    else:
+        content: str = (
+            f'{outcome.team} failed to complete yesterday\'s quest and dropped to 0 lives. They '
+            f'have been eliminated.')
+    return title, content
+
+
+async def start_new_day(competition_id: int, channel: discord.abc.Messageable, current_day: date) -> bool:
+    """Rolls the competition over to `current_day` and announces how yesterday went, unless it already was.
+    Returns whether it was rolled over by this call."""
+    last_checked_day: date | None = await db.get_last_day(competition_id)
+    if last_checked_day is not None and last_checked_day >= current_day:
+        return False
+    with metrics.span("rollover.day"):
+        # Rendered before the rollover changes the lives and with them the cached snapshot
+        description: str | None = await task_description(competition_id, current_day)
+        rolled, _, outcomes = await db.roll_over(competition_id, current_day)
+        if not rolled:
+            return False
+        embed = discord.Embed(title=f"__**It's a new day!**__", color=0x03f8fc)
+        for outcome in outcomes:
+            name, value = outcome_field(outcome)
+            embed.add_field(name=name, value=value, inline=False)
+        embed.add_field(name="Today's Task", value=description, inline=False)
+    with metrics.span("discord.send"):
+        await channel.send(embed=embed)
+    return True
+
+
+def rollover_day(now: datetime) -> date:
+    """Returns the day a rollover at `now` moves the competitions on to."""
+    return (now + ROLLOVER_SLACK).date()
+
+
+async def start_new_days(current_day: date, get_channel: Callable[[int], Awaitable[discord.abc.Messageable]],
+                         final_poll: Callable[[date], Awaitable[None]]) -> int:
+    """Rolls every competition over to `current_day`. Competitions that already are on it are left alone, so
+    this also catches up on a midnight the bot was offline for. Before a day is closed, every player is polled
+    one last time with `final_poll`, so drops from just before midnight count for it. Returns the number of
+    competitions that were rolled over by this call."""
+    behind: list[tuple[CompetitionSnapshot, date | None]] = []
+    for competition in await db.get_competitions():
+        if competition.channel_id is None:
+            continue
+        last_day: date | None = await db.get_last_day(competition.competition_id)
+        if last_day is None or last_day < current_day:
+            behind.append((competition, last_day))
+    # A competition that was only just started has no day to close yet
+    if any(last_day is not None for _, last_day in behind):
+        try:
+            with metrics.span("rollover.poll"):
+                await final_poll(current_day - timedelta(days=1))
+        except Exception as e:
+            print(f"Could not poll the players before the rollover: {e!r}")
+    rolled: int = 0
+    for competition, _ in behind:
+        try:
+            channel: discord.abc.Messageable = await get_channel(competition.channel_id)
+            rolled += await start_new_day(competition.competition_id, channel, current_day)
+        except Exception as e:
+            print(f"Could not start a new day for competition {competition.competition_id}: {e!r}")
+    return rolled
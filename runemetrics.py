@@ -1,37 +1,166 @@
-import requests
+import asyncio
 import datetime
-import pytz
+import functools
+import hashlib
+import json
+import os
+import time
+
+import aiohttp
+import metrics
+from response_cache import ResponseCache, CachedResponse
 from constants import DATETIME_FORMAT
-from models import Task, Player, Drop, Team, LastEntry
 
 type EventLogEntry = dict[str, str]
 
+PAGE_SIZE = 20
+DEEP_PAGE_SIZE = 50
+# Pointed at a local stub by the benchmarks, worker processes inherit it through the environment
+API_URL = os.environ.get("RUNEMETRICS_URL", "https://apps.runescape.com/runemetrics")
+
+_session: aiohttp.ClientSession | None = None
+
 
 # https://secure.runescape.com/m=avatar-rs/Sportoftran/chat.png
 
-def get_event_log(rsn: str) -> list[EventLogEntry]:
-    response = requests.get(f'https://apps.runescape.com/runemetrics/profile/profile?user={rsn}&activities=20',
-                            headers={'content-type': 'application/json'})
-    activities = response.json().get("activities")
-    return activities if activities else []
-
-
-def extract_relevant_activities(player: Player, last_entry: LastEntry) -> list[Drop]:
-    drops: list[Drop] = []
-    if player.rsn.startswith("*"):
-        return []
-    else:
-        event_log = get_event_log(player.rsn)
-        for activity in event_log:
-            if last_entry.date and last_entry.date == activity["date"]:
-                break
-            elif "I found" in activity["text"]:
-                utc_date = datetime.datetime.strptime(activity["date"], DATETIME_FORMAT)
-                utc_date = pytz.timezone('Europe/London').localize(utc_date).astimezone(pytz.utc)
-                drops.append(
-                    Drop(player_id=player.player_id, player=player, message=activity["text"], date=utc_date))
-        if not event_log or len(event_log) == 0:
-            print(f"No activity found for {player.rsn}")
-        else:
-            last_entry.date = event_log[0]["date"]
-        return drops
+def get_session(concurrency: int) -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def response_key(rsn: str, activities: int) -> str:
+    return f"{rsn}:{activities}"
+
+
+async def get_event_log(session: aiohttp.ClientSession, rsn: str, activities: int = PAGE_SIZE,
+                        response_cache: ResponseCache = None) -> (list[EventLogEntry], bool):
+    """Returns the player's event log, and whether it is unchanged since the cached response. Unchanged
+    responses are neither decoded nor searched for drops again."""
+    key: str = response_key(rsn, activities)
+    cached: CachedResponse = response_cache.get(key) if response_cache else None
+    headers: dict[str, str] = {'content-type': 'application/json'}
+    if cached and cached.etag:
+        headers['If-None-Match'] = cached.etag
+    if cached and cached.last_modified:
+        headers['If-Modified-Since'] = cached.last_modified
+    async with session.get(f'{API_URL}/profile/profile?user={rsn}&activities={activities}',
+                           headers=headers) as response:
+        if cached and response.status == 304:
+            response_cache.record_unchanged(cached)
+            return cached.activities, True
+        body: bytes = await response.read()
+    body_hash: str = hashlib.sha1(body).hexdigest()
+    if response_cache:
+        response_cache.bytes_downloaded += len(body)
+    if cached and cached.body_hash == body_hash:
+        response_cache.record_unchanged(cached)
+        return cached.activities, True
+    started: float = time.process_time()
+    event_log: list[EventLogEntry] = json.loads(body).get("activities") or []
+    if response_cache:
+        response_cache.put(key, CachedResponse(response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                                               body_hash, event_log, time.process_time() - started))
+    return event_log, False
+
+
+async def get_event_logs(rsns: list[str], concurrency: int = 10, cursors: dict[str, set[str]] = None,
+                         response_cache: ResponseCache = None) -> (dict[str, list[EventLogEntry]], set[str]):
+    """Fetches the event logs of all given players in parallel, at most `concurrency` requests at a time.
+    Players whose request failed are left out of the result. If none of the entries in a player's log
+    were seen before, according to `cursors`, a deeper page is fetched to close the gap. Also returns the
+    players whose log is unchanged since the last committed response."""
+    cursors = cursors or {}
+    session = get_session(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(rsn: str) -> (str, list[EventLogEntry], bool):
+        async with semaphore:
+            try:
+                with metrics.span("runemetrics.fetch"):
+                    event_log, unchanged = await get_event_log(session, rsn, PAGE_SIZE, response_cache)
+                if not unchanged and has_gap(event_log, cursors.get(rsn)):
+                    with metrics.span("runemetrics.fetch"):
+                        event_log, unchanged = await get_event_log(session, rsn, DEEP_PAGE_SIZE, response_cache)
+                    if has_gap(event_log, cursors.get(rsn)):
+                        print(f"More than {len(event_log)} new events for {rsn}, some drops may be missed")
+                return rsn, event_log, unchanged
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"Could not fetch activity for {rsn}: {e!r}")
+                return rsn, None, False
+
+    results = await asyncio.gather(*(fetch(rsn) for rsn in rsns))
+    event_logs: dict[str, list[EventLogEntry]] = {}
+    unchanged_rsns: set[str] = set()
+    for rsn, event_log, unchanged in results:
+        if event_log is not None:
+            event_logs[rsn] = event_log
+        if unchanged:
+            unchanged_rsns.add(rsn)
+    return event_logs, unchanged_rsns
+
+
+def entry_keys(event_log: list[EventLogEntry]) -> list[str]:
+    """Returns a content hash for every entry of the log. Identical entries in the same minute are told apart
+    by the number of identical entries older than them, which stays the same as newer entries come in.
+
+    Only the entries on the page can be counted. A run of identical entries cut by the end of the page gets other
+    keys on a deeper page, or once one of them falls off, than it had before. Counting from the newest entry
+    instead would shift the keys of every run that grows within its minute, which is far more common, as a poll
+    can land between two identical drops. A cut run only costs something when everything newer than it is new,
+    where the deeper page may store it again."""
+    keys: list[str] = [""] * len(event_log)
+    occurrences: dict[tuple[str, str], int] = {}
+    for i in range(len(event_log) - 1, -1, -1):
+        activity: EventLogEntry = event_log[i]
+        occurrence: int = occurrences.get((activity["date"], activity["text"]), 0)
+        occurrences[(activity["date"], activity["text"])] = occurrence + 1
+        keys[i] = entry_key(activity["date"], activity["text"], occurrence)
+    return keys
+
+
+def entry_key(event_date: str, text: str, occurrence: int) -> str:
+    return hashlib.sha1(f'{event_date}|{text}|{occurrence}'.encode()).hexdigest()[:16]
+
+
+def has_gap(event_log: list[EventLogEntry], seen: set[str] | None) -> bool:
+    return bool(seen) and bool(event_log) and seen.isdisjoint(entry_keys(event_log))
+
+
+@functools.cache
+def london():
+    # pytz is only needed once the first drop is parsed, so it stays out of the startup path
+    import pytz
+    return pytz.timezone('Europe/London')
+
+
+def parse_date(event_date: str) -> datetime.datetime:
+    utc_date = datetime.datetime.strptime(event_date, DATETIME_FORMAT)
+    return london().localize(utc_date).astimezone(datetime.timezone.utc)
+
+
+def find_new_drops(last_date: str, last_seen: str | None,
+                   event_log: list[EventLogEntry]) -> (list[tuple[str, datetime.datetime, str]], list[str]):
+    """Returns the message, date and content hash of every drop in the log that is newer than the player's
+    cursor, along with the content hashes of the whole log, which become the new cursor."""
+    drops: list[tuple[str, datetime.datetime, str]] = []
+    keys: list[str] = entry_keys(event_log)
+    seen: set[str] = set(last_seen.split(",")) if last_seen else set()
+    for activity, key in zip(event_log, keys):
+        if key in seen:
+            break
+        # Cursors stored before content hashes existed only have the date of the newest entry
+        elif not seen and last_date and last_date == activity["date"]:
+            break
+        elif "I found" in activity["text"]:
+            drops.append((activity["text"], parse_date(activity["date"]), key))
+    return drops, keys
@@ -0,0 +1,71 @@
+from collections import deque
+from datetime import datetime, timedelta
+
+from runemetrics import EventLogEntry
+
+
+class PlayerSchedule:
+    def __init__(self, rsn: str, interval: timedelta, next_due: datetime, last_change: datetime | None):
+        self.rsn: str = rsn
+        self.interval: timedelta = interval
+        self.next_due: datetime = next_due
+        self.last_change: datetime | None = last_change
+        self.head: str | None = None
+
+
+class PollScheduler:
+    """Decides which players are polled on a tick.
+
+    Players whose event log changed recently are polled every `base_interval`. Once a player has been idle
+    for `idle_after`, every unchanged poll doubles their interval, up to `max_interval`. At most `budget`
+    players are polled per tick, the most overdue first.
+    """
+
+    def __init__(self, base_interval: timedelta, max_interval: timedelta, idle_after: timedelta, budget: int):
+        self.base_interval: timedelta = base_interval
+        self.max_interval: timedelta = max_interval
+        self.idle_after: timedelta = idle_after
+        self.budget: int = budget
+        self.schedules: dict[str, PlayerSchedule] = {}
+        self.requests: deque[datetime] = deque()
+
+    def sync(self, players: dict[str, datetime | None], now: datetime):
+        """Starts tracking new players and forgets removed ones. `players` maps each RSN to the time of its
+        last known activity, which decides whether a new player starts out as idle. Players without any
+        history are treated as active."""
+        for rsn in self.schedules.keys() - players.keys():
+            del self.schedules[rsn]
+        for rsn, last_activity in players.items():
+            if rsn not in self.schedules:
+                self.schedules[rsn] = PlayerSchedule(rsn, self.base_interval, now, last_activity or now)
+
+    def due(self, now: datetime) -> list[str]:
+        # Ticks never fire at exactly the same offset, so anything due within half an interval is polled now
+        horizon: datetime = now + self.base_interval / 2
+        due: list[PlayerSchedule] = [schedule for schedule in self.schedules.values() if schedule.next_due <= horizon]
+        due.sort(key=lambda schedule: schedule.next_due)
+        return [schedule.rsn for schedule in due[:self.budget]]
+
+    def record(self, rsn: str, event_log: list[EventLogEntry], now: datetime):
+        """Reschedules a player after their event log was fetched."""
+        self.requests.append(now)
+        schedule: PlayerSchedule = self.schedules.get(rsn)
+        if schedule is None:
+            return
+        head: str | None = event_log[0]["date"] if event_log else None
+        if schedule.head is not None and head != schedule.head:
+            schedule.last_change = now
+        schedule.head = head
+        if schedule.last_change is not None and now - schedule.last_change < self.idle_after:
+            schedule.interval = self.base_interval
+        else:
+            schedule.interval = min(schedule.interval * 2, self.max_interval)
+        schedule.next_due = now + schedule.interval
+
+    def requests_last_hour(self, now: datetime) -> int:
+        while self.requests and now - self.requests[0] > timedelta(hours=1):
+            self.requests.popleft()
+        return len(self.requests)
+
+    def queue(self) -> list[PlayerSchedule]:
+        return sorted(self.schedules.values(), key=lambda schedule: schedule.next_due)
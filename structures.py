@@ -1,17 +1,48 @@
+from typing import Iterator, NamedTuple
+
+
+class TaskProgress(NamedTuple):
+    description: str
+    completed: int
+    required: int
+    # (rsn, drop message) of every drop that counted towards the task
+    drops: tuple[tuple[str, str], ...]
+
+    def lines(self, markdown: bool = True) -> Iterator[str]:
+        check: str = '✅️' if self.completed >= self.required else '❌'
+        yield f'{self.description} - {self.completed}/{self.required} - {check}'
+        for rsn, message in self.drops:
+            yield f'- *{rsn}{message[1:]}*' if markdown else f'- {rsn}{message[1:]}'
+
+    def size(self) -> int:
+        """Returns roughly how many characters `lines` produces, without formatting them."""
+        return len(self.description) + 16 + sum(len(rsn) + len(message) + 5 for rsn, message in self.drops)
+
+
 class Score:
+    __slots__ = ("tasks", "all_completed")
 
     def __init__(self):
-        self.lines: list[str] = []
+        self.tasks: list[TaskProgress] = []
         self.all_completed: bool = False
 
-    def add_line(self, line: str):
-        self.lines.append(line)
+    def add_task(self, task: TaskProgress):
+        self.tasks.append(task)
+
+    def lines(self, markdown: bool = True) -> Iterator[str]:
+        for task in self.tasks:
+            yield from task.lines(markdown)
+
+    def size(self) -> int:
+        return sum(task.size() + 1 for task in self.tasks)
 
     def set_all_completed(self, completed: bool):
         self.all_completed = completed
 
 
 class Progress:
+    __slots__ = ("scores", "all_required")
+
     def __init__(self):
         self.scores: dict[str, Score] = {}
         self.all_required: bool = True
@@ -22,9 +53,30 @@ class Progress:
     def add_score(self, team: str, score: Score):
         self.scores[team] = score
 
+    def size(self) -> int:
+        return sum(len(team) + score.size() for team, score in self.scores.items())
+
+
+class Standing(NamedTuple):
+    team: str
+    lives: int
+    days_completed: int
+    days_played: int
+    drops: int
+
+
+class DayOutcome(NamedTuple):
+    team: str
+    all_completed: bool
+    lives: int
+
 
 class DropNotification:
-    def __init__(self, rsn: str, header: str, body: str,):
+    def __init__(self, rsn: str, header: str, body: str, team: str = None, task_id: int = None,
+                 competition_id: int = None):
         self.rsn: str = rsn
         self.header: str = header
-        self.body: str = body
\ No newline at end of file
+        self.body: str = body
+        self.team: str = team
+        self.task_id: int = task_id
+        self.competition_id: int = competition_id
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# database.py opens its engine on import, so the tests and benchmarks point it at a scratch file before anything
+# imports it, which the processes they start share
+os.environ["DATABASE_PATH"] = os.environ.setdefault(
+    "SCRATCH_DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="frosty-"), "database.sqlite"))
@@ -0,0 +1,61 @@
+import os
+import unittest
+from datetime import date, datetime
+
+import autocomplete
+import cache
+import database as db
+import matcher
+from models import Competition, Day, Player, Task, Team
+
+GUILD_ID = 1
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """Runs every test against an empty database with the current schema, and nothing cached from the last."""
+
+    async def asyncSetUp(self):
+        await reset_database()
+        await db.create_schema()
+
+    async def asyncTearDown(self):
+        await db.engine.dispose()
+
+
+async def reset_database():
+    await db.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db.database_path + suffix):
+            os.remove(db.database_path + suffix)
+    cache.roster.invalidate()
+    cache.drops.invalidate()
+    matcher._matchers.clear()
+    autocomplete._rosters.clear()
+    autocomplete._drops.clear()
+
+
+async def add_competition(teams: dict[str, list[str]], tasks: dict[date, list[tuple[str, str, int]]],
+                          lives: int = 3) -> int:
+    """Creates a competition with players per team name, and (description, regex, required) tasks per day.
+    Tasks are inserted directly, without profiling their regex in another process. Returns its ID."""
+    async with db.Session.begin() as session:
+        competition = Competition(name="test", guild_id=GUILD_ID, channel_id=1)
+        session.add(competition)
+        await session.flush()
+        for name, rsns in teams.items():
+            team = Team(competition_id=competition.competition_id, name=name, lives=lives)
+            session.add(team)
+            await session.flush()
+            session.add_all([Player(rsn=rsn, team_id=team.team_id) for rsn in rsns])
+        for day, day_tasks in tasks.items():
+            session.add(Day(competition_id=competition.competition_id, date=day))
+            session.add_all([Task(description=description, regex_search=regex, number_required=required,
+                                  competition_id=competition.competition_id, day=day)
+                             for description, regex, required in day_tasks])
+        competition_id: int = competition.competition_id
+    cache.roster.invalidate()
+    return competition_id
+
+
+def at(day: date, hour: int, minute: int = 0) -> datetime:
+    return datetime(day.year, day.month, day.day, hour, minute)
@@ -0,0 +1,38 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import discord
+
+import app
+
+GUILD = discord.Object(id=1234)
+
+
+class CommandSyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for command in app.competition_commands:
+            app.tree.add_command(command, guild=GUILD, override=True)
+        self.addCleanup(app.tree.clear_commands, guild=GUILD)
+
+    def test_payload_of_the_global_and_guild_commands(self):
+        self.assertIn("start-competition", [command["name"] for command in json.loads(app.command_payload(None))])
+        names: list[str] = [command["name"] for command in json.loads(app.command_payload(GUILD))]
+        self.assertEqual(sorted(command.name for command in app.competition_commands), sorted(names))
+
+    async def test_commands_are_only_synced_when_they_changed(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.mkdir(os.path.join(directory.name, "database"))
+        cwd: str = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+        with mock.patch.object(app.tree, "sync", mock.AsyncMock()) as sync:
+            await app.sync_commands(GUILD)
+            await app.sync_commands(GUILD)
+            self.assertEqual(1, sync.await_count)
+            app.tree.remove_command("stats", guild=GUILD)
+            await app.sync_commands(GUILD)
+            self.assertEqual(2, sync.await_count)
@@ -0,0 +1,104 @@
+import json
+import os
+import unittest
+from datetime import date
+
+from sqlalchemy import select
+
+import database as db
+import matcher
+import runemetrics
+from models import Drop
+from replay import Tick, load_corpus
+from tests.support import DatabaseTestCase, add_competition
+from workers import find_drop_records
+
+DAY = date(2024, 5, 1)
+# Event logs of two players as RuneMetrics returned them on consecutive polls: an unchanged poll, identical drops
+# in the same minute, and an entry falling off the end of the page
+TICKS: list[Tick] = load_corpus(os.path.join(os.path.dirname(__file__), "fixtures", "runemetrics_ticks.jsonl"))
+# A deep page of one player: identical drops in one minute at the top, and another run of them cut by the end of the
+# first page
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "runemetrics_deep_page.json")) as fixture:
+    DEEP_PAGE: list[dict[str, str]] = json.load(fixture)["activities"]
+DROPS = [
+    ("frost bite", "I found some dragon bones", "2024-05-01 11:00"),
+    ("lava lad", "I found a dragon dagger", "2024-05-01 10:58"),
+    ("frost bite", "I found some dragon bones", "2024-05-01 11:05"),
+    ("frost bite", "I found some dragon bones", "2024-05-01 11:05"),
+    ("frost bite", "I found a dragon dagger", "2024-05-01 11:30"),
+]
+
+
+class CursorTest(unittest.TestCase):
+    def test_keys_of_entries_stay_the_same_as_newer_entries_come_in(self):
+        older: list[str] = runemetrics.entry_keys(TICKS[1][1]["frost bite"])
+        newer: list[str] = runemetrics.entry_keys(TICKS[3][1]["frost bite"])
+        self.assertEqual(older[:3], newer[1:])
+        self.assertEqual(len(set(older)), len(older))
+
+    def test_keys_are_the_same_on_a_deeper_page(self):
+        page: list[str] = runemetrics.entry_keys(DEEP_PAGE[:runemetrics.PAGE_SIZE])
+        deep_page: list[str] = runemetrics.entry_keys(DEEP_PAGE)
+        self.assertEqual(len(set(deep_page)), len(deep_page))
+        self.assertEqual(page[:17], deep_page[:17])
+        # The known limit: the run cut by the end of the first page is counted from its oldest entry on the page,
+        # so its entries there have the keys of the oldest ones of the run on the deeper page
+        self.assertEqual(page[17:], deep_page[20:23])
+
+    def test_deeper_page_finds_nothing_new_behind_the_cursor(self):
+        cursor: str = ",".join(runemetrics.entry_keys(DEEP_PAGE[:runemetrics.PAGE_SIZE]))
+        found, _ = runemetrics.find_new_drops("", cursor, DEEP_PAGE)
+        self.assertEqual([], found)
+        found, _ = runemetrics.find_new_drops("", cursor, DEEP_PAGE[2:])
+        self.assertEqual([], found)
+
+    def test_cursor_from_before_content_hashes_is_honoured(self):
+        event_log: list[dict[str, str]] = TICKS[3][1]["frost bite"]
+        found, keys = runemetrics.find_new_drops("01-May-2024 12:05", None, event_log)
+        self.assertEqual(["I found a dragon dagger"], [message for message, _, _ in found])
+        self.assertEqual(runemetrics.entry_keys(event_log), keys)
+
+
+class DedupeReplayTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.competition_id: int = await add_competition(
+            {"Ice": ["frost bite"], "Fire": ["lava lad"]},
+            {DAY: [("Dragon bones", "dragon bones", 3), ("Dragon items", "dragon (?:bones|dagger)", 5)]})
+
+    async def stored_drops(self) -> list[tuple[str, str, str]]:
+        async with db.Session() as session:
+            drops = (await session.scalars(select(Drop).order_by(Drop.drop_id))).all()
+            return [(drop.player.rsn, drop.message, drop.date.strftime("%Y-%m-%d %H:%M")) for drop in drops]
+
+    async def counters(self) -> list[int]:
+        async with db.Session() as session:
+            counters = await db.get_day_counters(session, self.competition_id, DAY)
+        return sorted(counters.values())
+
+    async def test_every_drop_is_stored_once(self):
+        notifications: list[int] = []
+        for _, event_logs in TICKS:
+            notifications.append(len(await db.periodic_update(DAY, event_logs)))
+        self.assertEqual(DROPS, await self.stored_drops())
+        # Dragon bones for Ice, dragon items for Fire and Ice
+        self.assertEqual([1, 3, 4], await self.counters())
+        self.assertEqual([3, 4, 0, 1], notifications)
+
+    async def test_replaying_every_tick_again_stores_nothing(self):
+        for _, event_logs in TICKS + TICKS:
+            await db.periodic_update(DAY, event_logs)
+        self.assertEqual(DROPS, await self.stored_drops())
+        self.assertEqual([1, 3, 4], await self.counters())
+
+    async def test_drops_stored_without_their_cursor_are_not_stored_again(self):
+        # A tick that stored its drops but was stopped before the cursors were written
+        _, event_logs = TICKS[1]
+        players = await db.get_player_cursors(list(event_logs))
+        drops, _ = find_drop_records(players, event_logs, await db.get_days(), matcher.get_matcher)
+        await db.apply_drop_records(DAY, drops, [])
+        for _, event_logs in TICKS:
+            await db.periodic_update(DAY, event_logs)
+        self.assertEqual(5, len(await self.stored_drops()))
+        self.assertEqual([1, 3, 4], await self.counters())
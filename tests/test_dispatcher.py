@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+from dispatcher import MAX_CHARACTERS_PER_MESSAGE, MAX_EMBEDS_PER_MESSAGE, NotificationDispatcher, build_embeds, \
+    pack_messages
+from replay import FakeChannel
+from structures import DropNotification
+
+
+def notification(team: str, task_id: int, body: str = "Dragon bones: 1/3") -> DropNotification:
+    return DropNotification("frost bite", f"frost bite found some dragon bones for {team}", body, team, task_id, 1)
+
+
+class BrokenChannel:
+    async def send(self, **kwargs):
+        raise RuntimeError("channel is gone")
+
+
+class PackMessagesTest(unittest.TestCase):
+    def test_messages_stay_within_discords_limits(self):
+        notifications: list[DropNotification] = [notification(f"Team {i % 30}", i % 3, "x" * 900) for i in range(90)]
+        messages = pack_messages(build_embeds(notifications))
+        self.assertEqual(90, sum(len(embed.fields) for embeds in messages for embed in embeds))
+        for embeds in messages:
+            self.assertLessEqual(len(embeds), MAX_EMBEDS_PER_MESSAGE)
+            self.assertLessEqual(sum(len(embed) for embed in embeds), MAX_CHARACTERS_PER_MESSAGE)
+
+
+class NotificationDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_notifications_queued_together_are_sent_in_one_message(self):
+        dispatcher = NotificationDispatcher(rate=100, capacity=10)
+        channel = FakeChannel()
+        for i in range(5):
+            dispatcher.submit(channel, [notification("Ice", 1)])
+        dispatcher.start()
+        await asyncio.sleep(0.05)
+        self.assertEqual((1, 1), (channel.messages, channel.embeds))
+        dispatcher.task.cancel()
+
+    async def test_a_failing_channel_does_not_stop_the_dispatcher(self):
+        dispatcher = NotificationDispatcher(rate=100, capacity=10)
+        dispatcher.start()
+        channel = FakeChannel()
+        dispatcher.submit(BrokenChannel(), [notification("Ice", 1)])
+        await asyncio.sleep(0.05)
+        dispatcher.submit(channel, [notification("Ice", 1)])
+        await asyncio.sleep(0.05)
+        self.assertFalse(dispatcher.task.done())
+        self.assertEqual(1, channel.messages)
+        dispatcher.task.cancel()
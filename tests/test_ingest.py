@@ -0,0 +1,93 @@
+import os
+import socket
+import unittest
+from datetime import date
+
+import aiohttp
+from sqlalchemy import func, select
+
+import database as db
+from ingest import BatchResult, IngestError, IngestServer, parse_events
+from models import Drop
+from replay import Tick, load_corpus
+from tests.support import DatabaseTestCase, add_competition
+
+DAY = date(2024, 5, 1)
+TICKS: list[Tick] = load_corpus(os.path.join(os.path.dirname(__file__), "fixtures", "runemetrics_ticks.jsonl"))
+
+
+def event(rsn: str, message: str, timestamp: str) -> dict[str, str]:
+    return {"rsn": rsn, "message": message, "timestamp": timestamp}
+
+
+class ParseEventsTest(unittest.TestCase):
+    def test_timestamps_without_an_offset_are_utc(self):
+        events = parse_events({"events": [event("frost bite", "I found a dragon dagger", "2024-05-01T11:30:00"),
+                                          event("frost bite", "I found a dragon dagger", "2024-05-01T12:30:00+01:00")]})
+        self.assertEqual(events[0].date, events[1].date)
+
+    def test_invalid_batches_are_rejected(self):
+        for payload in ([], {"events": {}}, {"events": [{"rsn": "frost bite"}]},
+                        {"events": [event("frost bite", "I found a dragon dagger", "yesterday")]}):
+            with self.assertRaises(IngestError):
+                parse_events(payload)
+
+
+class PushAndPollTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await add_competition({"Ice": ["frost bite"], "Fire": ["lava lad"]},
+                              {DAY: [("Dragon bones", "dragon bones", 3)]})
+        self.server: IngestServer = IngestServer(self.notify)
+
+    async def notify(self, notifications):
+        pass
+
+    async def drops(self) -> int:
+        async with db.Session() as session:
+            return (await session.execute(select(func.count(Drop.drop_id)))).scalar()
+
+    async def test_pushed_drops_are_not_stored_again_when_polled(self):
+        # The same drops as the first two polls, pushed as they happened, identical ones in the order they dropped
+        results, _ = await self.server.apply([parse_events({"events": [
+            event("frost bite", "I found some dragon bones", "2024-05-01T11:00:00Z"),
+            event("frost bite", "I found some dragon bones", "2024-05-01T11:05:10Z"),
+            event("frost bite", "I found some dragon bones", "2024-05-01T11:05:40Z"),
+        ]})])
+        self.assertEqual([BatchResult(3, 0, [])], results)
+        for _, event_logs in TICKS[:3]:
+            await db.periodic_update(DAY, event_logs)
+        # Only lava lad's drop was new to the poller
+        self.assertEqual(4, await self.drops())
+
+    async def test_polled_drops_are_not_stored_again_when_pushed(self):
+        await db.periodic_update(DAY, TICKS[0][1])
+        results, notifications = await self.server.apply([parse_events({"events": [
+            event("frost bite", "I found some dragon bones", "2024-05-01T12:00:00+01:00"),
+            event("lava lad", "I found a dragon dagger", "2024-05-01T10:58:00Z"),
+            event("lava lad", "I found a dragon dagger", "2024-05-01T11:40:00Z"),
+            event("nobody", "I found a dragon dagger", "2024-05-01T11:40:00Z")]})])
+        self.assertEqual([BatchResult(1, 2, ["nobody"])], results)
+        self.assertEqual([], notifications)
+        self.assertEqual(3, await self.drops())
+
+    async def test_retried_batch_gets_the_first_response(self):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port: int = probe.getsockname()[1]
+        await self.server.start(port)
+        payload = {"events": [event("frost bite", "I found some dragon bones", "2024-05-01T11:00:00Z")]}
+        try:
+            async with aiohttp.ClientSession() as session:
+                responses: list[dict] = []
+                for _ in range(2):
+                    async with session.post(f"http://127.0.0.1:{port}/drops", json=payload,
+                                            headers={"Idempotency-Key": "batch-1"}) as response:
+                        responses.append(await response.json())
+                async with session.post(f"http://127.0.0.1:{port}/drops", json={"events": 1}) as response:
+                    self.assertEqual(400, response.status)
+        finally:
+            self.server.consumer.cancel()
+            await self.server.runner.cleanup()
+        self.assertEqual([{"accepted": 1, "duplicates": 0, "unknown": []}] * 2, responses)
+        self.assertEqual(1, await self.drops())
@@ -0,0 +1,85 @@
+import re
+import unittest
+from unittest import mock
+
+import matcher
+from cache import TaskSnapshot
+
+MESSAGES = [
+    "I found some dragon bones",
+    "I found a dragon dagger",
+    "I found a bronze dagger",
+    "I found 2 dragon bones and a dragon dagger",
+    "I levelled my Slayer skill, I am now level 99.",
+]
+
+
+def task(task_id: int, regex: str, match_cost: float | None = None) -> TaskSnapshot:
+    return TaskSnapshot(task_id, f"Task {task_id}", regex, 1, match_cost)
+
+
+class DayMatcherTest(unittest.TestCase):
+    def assert_matches_like_search(self, tasks: list[TaskSnapshot]):
+        day_matcher = matcher.DayMatcher(tasks)
+        for message in MESSAGES:
+            expected: set[int] = {task.task_id for task in tasks if re.search(task.regex_search, message.lower())}
+            self.assertEqual(expected, day_matcher.matches(message), message)
+
+    def test_matches_like_a_search_per_task(self):
+        self.assert_matches_like_search([task(1, "dragon bones"), task(2, r"dragon (?:dagger|sword)"),
+                                         task(3, r"^i found a \w+ dagger$"), task(4, r"level (?P<level>\d+)")])
+
+    def test_backreferences_and_named_groups_are_matched(self):
+        self.assert_matches_like_search([task(1, r"(dragon) .*\1"), task(2, "(?P<item>bones)"),
+                                         task(3, "(?P<item>dagger)")])
+
+    def test_task_over_the_budget_is_still_matched(self):
+        day_matcher = matcher.DayMatcher([task(1, "dragon"), task(2, "dagger")])
+        with mock.patch.object(matcher, "MATCH_BUDGET", -1):
+            self.assertEqual({1, 2}, day_matcher.matches("I found a dragon dagger"))
+            self.assertEqual({1}, day_matcher.matches("I found some dragon bones"))
+        self.assertEqual({1: 2, 2: 2}, day_matcher.overruns)
+        self.assertEqual({1, 2}, day_matcher.matches("I found a dragon dagger"))
+        self.assertEqual({1: 2, 2: 2}, day_matcher.overruns)
+
+    def test_task_that_keeps_overrunning_is_skipped(self):
+        day_matcher = matcher.DayMatcher([task(1, "dragon"), task(2, "dagger")])
+        with mock.patch.object(matcher, "MATCH_BUDGET", -1):
+            for _ in range(matcher.MAX_OVERRUNS - 1):
+                self.assertEqual({1, 2}, day_matcher.matches("I found a dragon dagger"))
+            self.assertEqual({1, 2}, day_matcher.matches("I found a dragon dagger"))
+        self.assertEqual({1, 2}, day_matcher.skipped)
+        self.assertEqual(set(), day_matcher.matches("I found a dragon dagger"))
+
+    def test_overruns_outside_the_window_are_forgotten(self):
+        day_matcher = matcher.DayMatcher([task(1, "dragon")])
+        with mock.patch.object(matcher, "MATCH_BUDGET", -1), mock.patch.object(matcher.time, "monotonic") as now:
+            for i in range(2 * matcher.MAX_OVERRUNS):
+                now.return_value = i * matcher.OVERRUN_WINDOW
+                self.assertEqual({1}, day_matcher.matches("I found a dragon dagger"))
+        self.assertEqual({1: 2 * matcher.MAX_OVERRUNS}, day_matcher.overruns)
+        self.assertEqual(set(), day_matcher.skipped)
+
+
+class ProfileTest(unittest.IsolatedAsyncioTestCase):
+    async def test_nested_quantifiers_are_rejected(self):
+        for regex in ("(a+)+$", "(x+x+)+y"):
+            error, _ = await matcher.profile(regex, MESSAGES)
+            self.assertIn("would stall polling", error, regex)
+
+    async def test_ordinary_patterns_are_accepted(self):
+        for regex in ("dragon bones", r"(?:abyssal|dragon) (?:whip|dagger)"):
+            error, seconds = await matcher.profile(regex, MESSAGES)
+            self.assertIsNone(error, regex)
+            self.assertLess(seconds, matcher.MATCH_BUDGET)
+
+    async def test_a_timed_out_profile_does_not_hold_up_the_next(self):
+        error, _ = await matcher.profile("(a+)+$", MESSAGES)
+        self.assertIn("would stall polling", error)
+        error, _ = await matcher.profile("dragon bones", MESSAGES)
+        self.assertIsNone(error)
+
+    async def test_invalid_patterns_are_rejected(self):
+        error, seconds = await matcher.profile("dragon (bones", MESSAGES)
+        self.assertIn("Invalid regex", error)
+        self.assertIsNone(seconds)
@@ -0,0 +1,68 @@
+import sqlite3
+from datetime import date, datetime
+
+from sqlalchemy import select, text
+
+import database as db
+from models import Drop, LastDay, Player, Task, Team
+from tests.support import DatabaseTestCase, reset_database
+
+# The schema as the first release created it, before competitions, dedupe keys and cursors
+BASELINE_SCHEMA = """
+CREATE TABLE day (date DATE NOT NULL, all_required INTEGER NOT NULL, password VARCHAR, PRIMARY KEY (date));
+CREATE TABLE last_day (id INTEGER NOT NULL, day DATE NOT NULL, PRIMARY KEY (id));
+CREATE TABLE team (team_id INTEGER NOT NULL, name VARCHAR NOT NULL, lives INTEGER NOT NULL, PRIMARY KEY (team_id),
+    UNIQUE (name));
+CREATE TABLE player (player_id INTEGER NOT NULL, rsn VARCHAR NOT NULL, team_id INTEGER NOT NULL,
+    PRIMARY KEY (player_id), UNIQUE (rsn), FOREIGN KEY(team_id) REFERENCES team (team_id));
+CREATE TABLE task (task_id INTEGER NOT NULL, description VARCHAR NOT NULL, regex_search VARCHAR NOT NULL,
+    number_required INTEGER NOT NULL, day DATE NOT NULL, PRIMARY KEY (task_id),
+    FOREIGN KEY(day) REFERENCES day (date));
+CREATE TABLE "drop" (drop_id INTEGER NOT NULL, player_id INTEGER NOT NULL, message VARCHAR NOT NULL,
+    date DATETIME NOT NULL, PRIMARY KEY (drop_id), FOREIGN KEY(player_id) REFERENCES player (player_id));
+CREATE TABLE last_entry (player_id INTEGER NOT NULL, date VARCHAR NOT NULL, PRIMARY KEY (player_id),
+    FOREIGN KEY(player_id) REFERENCES player (player_id));
+
+INSERT INTO day VALUES ('2024-05-01', 1, NULL);
+INSERT INTO last_day VALUES (1, '2024-05-01');
+INSERT INTO team VALUES (1, 'Ice', 2);
+INSERT INTO player VALUES (1, 'frost bite', 1);
+INSERT INTO task VALUES (1, 'Dragon bones', 'dragon bones', 2, '2024-05-01');
+INSERT INTO "drop" VALUES (1, 1, 'I found some dragon bones', '2024-05-01 12:00:00.000000');
+INSERT INTO last_entry VALUES (1, '01-May-2024 12:00');
+"""
+
+
+class MigrationTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await reset_database()
+        with sqlite3.connect(db.database_path) as connection:
+            connection.executescript(BASELINE_SCHEMA)
+        connection.close()
+        await db.create_schema()
+
+    async def test_baseline_database_moves_into_the_first_competition(self):
+        async with db.Session() as session:
+            team: Team = (await session.scalars(select(Team))).one()
+            task: Task = (await session.scalars(select(Task))).one()
+            drop: Drop = (await session.scalars(select(Drop))).one()
+            last_day: LastDay = (await session.scalars(select(LastDay))).one()
+            rsns: list[str] = (await session.scalars(select(Player.rsn))).all()
+        self.assertEqual((1, "Ice", 2), (team.competition_id, team.name, team.lives))
+        self.assertEqual((1, date(2024, 5, 1), "dragon bones", None),
+                         (task.competition_id, task.day, task.regex_search, task.match_cost))
+        self.assertEqual(("I found some dragon bones", datetime(2024, 5, 1, 12), None),
+                         (drop.message, drop.date, drop.dedupe_key))
+        self.assertEqual((1, date(2024, 5, 1)), (last_day.competition_id, last_day.day))
+        self.assertEqual(["frost bite"], rsns)
+
+    async def test_progress_is_rebuilt_from_the_existing_drops(self):
+        async with db.Session() as session:
+            counters: dict[tuple[int, int], int] = await db.get_day_counters(session, 1, date(2024, 5, 1))
+        self.assertEqual({(1, 1): 1}, counters)
+
+    async def test_migrated_database_is_not_migrated_again(self):
+        await db.engine.dispose()
+        async with db.engine.connect() as connection:
+            self.assertEqual(db.SCHEMA_VERSION, (await connection.execute(text("PRAGMA user_version"))).scalar())
+        await db.create_schema()
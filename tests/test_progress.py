@@ -0,0 +1,45 @@
+from datetime import date
+
+import database as db
+from structures import Progress
+from tests.support import DatabaseTestCase, add_competition, at
+
+DAY = date(2024, 5, 1)
+
+
+class CheckDayTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.competition_id: int = await add_competition(
+            {"Ice": ["frost bite", "snow man"], "Fire": ["lava lad"]},
+            {DAY: [("Dragon bones", "dragon bones", 2), ("Whip", "abyssal whip", 1)]})
+        for rsn, message, hour in (("frost bite", "I found some dragon bones", 10),
+                                   ("snow man", "I found some dragon bones", 11),
+                                   ("lava lad", "I found some dragon bones", 12),
+                                   ("lava lad", "I found a bronze dagger", 13),
+                                   ("lava lad", "I found some dragon bones", 23)):
+            await db.add_drop(self.competition_id, rsn, message, at(DAY, hour))
+        await db.add_drop(self.competition_id, "frost bite", "I found an abyssal whip", at(date(2024, 5, 2), 0))
+
+    async def test_lists_the_drops_of_every_team_per_task(self):
+        progress = Progress()
+        self.assertIsNone(await db.check_day(self.competition_id, DAY, progress))
+        self.assertEqual({
+            "Ice": ["Dragon bones - 2/2 - ✅️", "- *frost bite found some dragon bones*",
+                    "- *snow man found some dragon bones*", "Whip - 0/1 - ❌"],
+            "Fire": ["Dragon bones - 2/2 - ✅️", "- *lava lad found some dragon bones*",
+                     "- *lava lad found some dragon bones*", "Whip - 0/1 - ❌"],
+        }, {team: list(score.lines()) for team, score in progress.scores.items()})
+        self.assertEqual([False, False], [score.all_completed for score in progress.scores.values()])
+
+    async def test_counters_match_progress_rebuilt_from_the_drops(self):
+        async with db.Session() as session:
+            counted: dict[tuple[int, int], int] = await db.get_day_counters(session, self.competition_id, DAY)
+        self.assertIsNone(await db.rebuild_progress(self.competition_id, DAY))
+        async with db.Session() as session:
+            self.assertEqual(counted, await db.get_day_counters(session, self.competition_id, DAY))
+        self.assertEqual([2, 2], sorted(counted.values()))
+
+    async def test_unknown_day(self):
+        self.assertEqual("Day 01-Jan-2024 was not found",
+                         await db.check_day(self.competition_id, date(2024, 1, 1), Progress()))
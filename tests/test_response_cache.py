@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from response_cache import CachedResponse, ResponseCache
+
+RESPONSE = CachedResponse('"etag"', None, "hash", [{"date": "01-May-2024 12:00", "text": "I found a dragon dagger"}],
+                          0.001)
+
+
+class ResponseCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.path: str = os.path.join(tempfile.mkdtemp(prefix="frosty-tests-"), "response_cache.json")
+
+    async def test_responses_are_only_visible_once_committed(self):
+        response_cache = ResponseCache(self.path, 10)
+        response_cache.put("frost bite:20", RESPONSE)
+        self.assertIsNone(response_cache.get("frost bite:20"))
+        response_cache.commit()
+        self.assertEqual(RESPONSE, response_cache.get("frost bite:20"))
+
+    async def test_least_recently_used_responses_are_evicted(self):
+        response_cache = ResponseCache(self.path, 2)
+        for key in ("a:20", "b:20"):
+            response_cache.put(key, RESPONSE)
+        response_cache.commit()
+        response_cache.get("a:20")
+        response_cache.put("c:20", RESPONSE)
+        response_cache.commit()
+        self.assertEqual(["a:20", "c:20"], list(response_cache.entries))
+
+    async def test_saved_once_the_interval_passed_and_only_if_changed(self):
+        response_cache = ResponseCache(self.path, 10, save_interval=60)
+        response_cache.put("frost bite:20", RESPONSE)
+        response_cache.commit()
+        self.assertFalse(os.path.exists(self.path))
+        await response_cache.save_if_due()
+        self.assertFalse(os.path.exists(self.path))
+
+        response_cache.saved_at -= 60
+        await response_cache.save_if_due()
+        loaded = ResponseCache(self.path, 10)
+        loaded.load()
+        self.assertEqual({"frost bite:20": RESPONSE}, dict(loaded.entries))
+
+        os.remove(self.path)
+        response_cache.saved_at -= 60
+        response_cache.commit()
+        await response_cache.save_if_due()
+        self.assertFalse(os.path.exists(self.path))
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+from sqlalchemy import select
+
+import cache
+import database as db
+import matcher
+import rollover
+from models import TeamDayResult
+from replay import FakeChannel
+from tests.support import DatabaseTestCase, add_competition, at
+
+DAY = date(2024, 5, 1)
+NEXT_DAY = DAY + timedelta(days=1)
+MIDNIGHT = datetime(2024, 5, 2, tzinfo=timezone.utc)
+
+
+class RollOverTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.competition_id: int = await add_competition(
+            {"Ice": ["frost bite"], "Fire": ["lava lad"]},
+            {DAY: [("Dragon bones", "dragon bones", 2), ("Any dragon item", "dragon", 3)]})
+        await db.roll_over(self.competition_id, DAY)
+
+    async def results(self) -> dict[int, TeamDayResult]:
+        async with db.Session() as session:
+            return {result.team_id: result for result in (await session.scalars(select(TeamDayResult))).all()}
+
+    async def test_drops_matching_several_tasks_count_once(self):
+        for minute in range(3):
+            await db.add_drop(self.competition_id, "frost bite", "I found some dragon bones", at(DAY, 12, minute))
+        await db.add_drop(self.competition_id, "frost bite", "I found a bronze dagger", at(DAY, 13))
+        await db.add_drop(self.competition_id, "lava lad", "I found a dragon dagger", at(DAY, 14))
+
+        rolled, last_day, outcomes = await db.roll_over(self.competition_id, NEXT_DAY)
+
+        self.assertTrue(rolled)
+        self.assertEqual(DAY, last_day)
+        self.assertEqual({"Ice": (True, 3), "Fire": (False, 2)},
+                         {outcome.team: (outcome.all_completed, outcome.lives) for outcome in outcomes})
+        results: dict[int, TeamDayResult] = await self.results()
+        self.assertEqual([3, 1], [result.drops for _, result in sorted(results.items())])
+        self.assertEqual([2, 0], [result.tasks_completed for _, result in sorted(results.items())])
+
+
+class StartNewDaysTest(DatabaseTestCase):
+    """Runs the midnight rollover against a simulated clock, with a final poll that finds a drop from a minute
+    before midnight."""
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.competition_id: int = await add_competition({"Ice": ["frost bite"], "Fire": ["lava lad"]},
+                                                         {DAY: [("Dragon bones", "dragon bones", 1)]})
+        await db.roll_over(self.competition_id, DAY)
+        self.channel: FakeChannel = FakeChannel()
+        self.polled: list[date] = []
+
+    async def get_channel(self, channel_id: int) -> FakeChannel:
+        return self.channel
+
+    async def final_poll(self, closing_day: date):
+        self.polled.append(closing_day)
+        # 23:58 UTC, which RuneMetrics logs in London time
+        await db.periodic_update(closing_day, {"frost bite": [
+            {"date": "02-May-2024 00:58", "text": "I found some dragon bones", "details": ""}]})
+
+    async def start_new_days(self, now: datetime) -> int:
+        return await rollover.start_new_days(rollover.rollover_day(now), self.get_channel, self.final_poll)
+
+    async def lives(self) -> dict[str, int]:
+        return {team.name: team.lives for team in (await db.get_roster()).competition_teams(self.competition_id)}
+
+    def test_rollover_moves_on_to_the_day_starting_at_the_nearest_midnight(self):
+        self.assertEqual(NEXT_DAY, rollover.rollover_day(datetime(2024, 5, 1, 23, 59, 30, tzinfo=timezone.utc)))
+        self.assertEqual(NEXT_DAY, rollover.rollover_day(datetime(2024, 5, 2, 0, 0, 5, tzinfo=timezone.utc)))
+        self.assertEqual(DAY, rollover.rollover_day(datetime(2024, 5, 1, 23, 58, tzinfo=timezone.utc)))
+
+    async def test_drops_polled_at_midnight_count_for_the_day_that_ends(self):
+        self.assertEqual(1, await self.start_new_days(MIDNIGHT - timedelta(seconds=20)))
+        self.assertEqual([DAY], self.polled)
+        self.assertEqual(NEXT_DAY, await db.get_last_day(self.competition_id))
+        self.assertEqual({"Ice": 3, "Fire": 2}, await self.lives())
+        self.assertEqual(1, self.channel.messages)
+
+    async def test_concurrent_rollovers_close_the_day_once(self):
+        rolled: list[int] = await asyncio.gather(*(self.start_new_days(MIDNIGHT) for _ in range(2)))
+        self.assertEqual(1, sum(rolled))
+        self.assertEqual(0, await self.start_new_days(MIDNIGHT + timedelta(minutes=5)))
+        self.assertEqual({"Ice": 3, "Fire": 2}, await self.lives())
+        self.assertEqual(1, self.channel.messages)
+        self.assertEqual([1, 1], [standing.days_played for standing in await db.get_leaderboard(self.competition_id)])
+
+    async def test_rollover_that_failed_halfway_is_redone_after_a_restart(self):
+        with mock.patch.object(db, "get_day_drop_counts", side_effect=RuntimeError("stopped")):
+            self.assertEqual(0, await self.start_new_days(MIDNIGHT))
+        self.assertEqual(DAY, await db.get_last_day(self.competition_id))
+        self.assertEqual({"Ice": 3, "Fire": 3}, await self.lives())
+
+        await restart()
+        self.assertEqual(1, await self.start_new_days(MIDNIGHT + timedelta(minutes=1)))
+        self.assertEqual({"Ice": 3, "Fire": 2}, await self.lives())
+        self.assertEqual(1, self.channel.messages)
+
+    async def test_rollover_is_not_repeated_after_a_restart_once_stored(self):
+        with mock.patch.object(self.channel, "send", side_effect=RuntimeError("stopped")):
+            self.assertEqual(0, await self.start_new_days(MIDNIGHT))
+        await restart()
+        self.assertEqual(0, await self.start_new_days(MIDNIGHT + timedelta(minutes=1)))
+        self.assertEqual({"Ice": 3, "Fire": 2}, await self.lives())
+        self.assertEqual(NEXT_DAY, await db.get_last_day(self.competition_id))
+
+
+async def restart():
+    """Forgets everything the process had in memory, as if the bot was started again on the same database."""
+    await db.engine.dispose()
+    cache.roster.invalidate()
+    cache.drops.invalidate()
+    matcher._matchers.clear()
+    rollover._prepared.clear()
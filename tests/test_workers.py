@@ -0,0 +1,68 @@
+import asyncio
+import os
+import socket
+import unittest
+from unittest import mock
+from datetime import date
+
+import metrics
+import runemetrics
+from cache import DaySnapshot, TaskSnapshot
+from replay import Tick, load_corpus
+from response_cache import CachedResponse, ResponseCache
+from workers import PlayerCursor, ShardResult, WorkerPool
+
+DAY = date(2024, 5, 1)
+TICKS: list[Tick] = load_corpus(os.path.join(os.path.dirname(__file__), "fixtures", "runemetrics_ticks.jsonl"))
+EVENT_LOGS: dict[str, list[dict[str, str]]] = {**TICKS[0][1], **TICKS[1][1]}
+DAYS: dict[tuple[int, date], DaySnapshot] = {
+    (1, DAY): DaySnapshot(1, DAY, 1, None, (TaskSnapshot(1, "Dragon bones", "dragon bones", 3, None),))}
+
+
+class WorkerPoolTest(unittest.IsolatedAsyncioTestCase):
+    """Polls a local stand-in for RuneMetrics from worker processes."""
+
+    async def asyncSetUp(self):
+        from aiohttp import web
+
+        async def profile(request: web.Request) -> web.Response:
+            return web.json_response({"activities": EVENT_LOGS[request.query["user"]]})
+
+        app = web.Application()
+        app.router.add_get("/runemetrics/profile/profile", profile)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port: int = probe.getsockname()[1]
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        url: str = f"http://127.0.0.1:{port}/runemetrics"
+        patcher = mock.patch.dict(os.environ, {"RUNEMETRICS_URL": url})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool: WorkerPool = WorkerPool(2, 4)
+        self.players: list[PlayerCursor] = [PlayerCursor(1, "frost bite", 1, "", None),
+                                            PlayerCursor(2, "lava lad", 1, "", None)]
+
+    async def asyncTearDown(self):
+        await asyncio.to_thread(self.pool.executor.shutdown)
+        await self.runner.cleanup()
+
+    async def test_spans_recorded_in_the_workers_reach_the_main_process(self):
+        fetches: int = metrics.histogram("runemetrics.fetch").count
+        matches: int = metrics.histogram("drops.match").count
+        result: ShardResult = await self.pool.poll(self.players, DAYS, ResponseCache("", 10))
+        self.assertEqual(4, len(result.drops))
+        self.assertEqual(fetches + 2, metrics.histogram("runemetrics.fetch").count)
+        self.assertEqual(matches + 4, metrics.histogram("drops.match").count)
+
+        await self.pool.poll(self.players, DAYS, ResponseCache("", 10))
+        self.assertEqual(fetches + 4, metrics.histogram("runemetrics.fetch").count)
+
+    async def test_responses_handed_to_workers_are_marked_as_used(self):
+        response_cache: ResponseCache = ResponseCache("", 2)
+        used_key: str = runemetrics.response_key("frost bite", runemetrics.PAGE_SIZE)
+        response_cache.entries[used_key] = CachedResponse(None, None, "", [], 0.0)
+        response_cache.entries["someone else:20"] = CachedResponse(None, None, "", [], 0.0)
+        await self.pool.poll(self.players[:1], DAYS, response_cache)
+        self.assertEqual(["someone else:20", used_key], list(response_cache.entries))
@@ -0,0 +1,165 @@
+import asyncio
+from datetime import date, datetime
+from typing import Callable, NamedTuple
+
+import matcher
+import metrics
+import runemetrics
+from cache import DaySnapshot
+from response_cache import ResponseCache, CachedResponse
+from runemetrics import EventLogEntry, DEEP_PAGE_SIZE, PAGE_SIZE
+
+
+class PlayerCursor(NamedTuple):
+    player_id: int
+    rsn: str
+    competition_id: int
+    date: str
+    seen: str | None
+
+
+class DropRecord(NamedTuple):
+    player_id: int
+    message: str
+    date: datetime
+    dedupe_key: str
+    task_ids: tuple[int, ...]
+
+
+class EntryRecord(NamedTuple):
+    player_id: int
+    date: str
+    seen: str
+
+
+class ShardResult(NamedTuple):
+    # Only the newest entry of every fetched log, which is all the scheduler needs
+    heads: dict[str, list[EventLogEntry]]
+    unchanged: set[str]
+    drops: list[DropRecord]
+    entries: list[EntryRecord]
+    responses: dict[str, CachedResponse]
+    bytes_downloaded: int
+    cpu_seconds_saved: float
+    # The spans recorded in the worker, which would otherwise never reach /metrics
+    timings: dict[str, metrics.Recorded]
+
+
+def poll_shard(players: list[PlayerCursor], days: dict[tuple[int, date], DaySnapshot],
+               responses: dict[str, CachedResponse], concurrency: int) -> ShardResult:
+    """Runs in a worker process: fetches the event logs of a shard of players and matches their new drops
+    against the tasks of their competition. Everything is returned as plain tuples, so nothing but the
+    result has to cross back to the main process."""
+    return asyncio.run(_poll_shard(players, days, responses, concurrency))
+
+
+async def _poll_shard(players: list[PlayerCursor], days: dict[tuple[int, date], DaySnapshot],
+                      responses: dict[str, CachedResponse], concurrency: int) -> ShardResult:
+    # Whatever the last shard on this worker recorded was returned with it
+    metrics.drain()
+    response_cache: ResponseCache = ResponseCache("", len(responses))
+    response_cache.entries.update(responses)
+    cursors: dict[str, set[str]] = {}
+    for player in players:
+        if player.seen:
+            cursors.setdefault(player.rsn, set()).update(player.seen.split(","))
+    rsns: list[str] = list(dict.fromkeys(player.rsn for player in players))
+    try:
+        event_logs, unchanged = await runemetrics.get_event_logs(rsns, concurrency, cursors, response_cache)
+    finally:
+        # The session belongs to this call's event loop, the next shard runs on a new one
+        await runemetrics.close_session()
+
+    # Matchers are built per shard, a worker never hears about tasks that were edited since the last one
+    day_matchers: dict[tuple[int, date], matcher.DayMatcher] = {}
+
+    def get_matcher(day: DaySnapshot) -> matcher.DayMatcher:
+        if (day.competition_id, day.date) not in day_matchers:
+            day_matchers[(day.competition_id, day.date)] = matcher.DayMatcher(day.tasks)
+        return day_matchers[(day.competition_id, day.date)]
+
+    changed_logs = {rsn: event_log for rsn, event_log in event_logs.items() if rsn not in unchanged}
+    drops, entries = find_drop_records(players, changed_logs, days, get_matcher)
+    return ShardResult({rsn: event_log[:1] for rsn, event_log in event_logs.items()}, unchanged, drops, entries,
+                       response_cache.pending, response_cache.bytes_downloaded, response_cache.cpu_seconds_saved,
+                       metrics.drain())
+
+
+def find_drop_records(players: list[PlayerCursor], event_logs: dict[str, list[EventLogEntry]],
+                      days: dict[tuple[int, date], DaySnapshot],
+                      get_matcher: Callable[[DaySnapshot], matcher.DayMatcher]
+                      ) -> (list[DropRecord], list[EntryRecord]):
+    """Finds the new drops in the event logs of the given players, together with the tasks they count for,
+    and their updated cursors."""
+    drops: list[DropRecord] = []
+    entries: list[EntryRecord] = []
+    for player in players:
+        if player.rsn not in event_logs:
+            continue
+        event_log: list[EventLogEntry] = event_logs[player.rsn]
+        if not event_log:
+            print(f"No activity found for {player.rsn}")
+            continue
+        found, keys = runemetrics.find_new_drops(player.date, player.seen, event_log)
+        for message, drop_date, key in found:
+            day: DaySnapshot = days.get((player.competition_id, drop_date.date()))
+            task_ids: tuple[int, ...] = ()
+            if day:
+                with metrics.span("drops.match"):
+                    task_ids = tuple(get_matcher(day).matches(message))
+            drops.append(DropRecord(player.player_id, message, drop_date, f"{player.player_id}:{key}", task_ids))
+        entries.append(EntryRecord(player.player_id, event_log[0]["date"], ",".join(keys)))
+    return drops, entries
+
+
+class WorkerPool:
+    """Shards the polling and matching of players across worker processes, so a large roster isn't limited to
+    the one core the bot runs on. Every RSN goes to exactly one shard, together with all competitions it plays
+    in, and the request concurrency is split between the workers."""
+
+    def __init__(self, workers: int, concurrency: int):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers: int = workers
+        self.concurrency: int = max(1, concurrency // workers)
+        # Forking would copy the bot's event loop and database threads into every worker
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(workers,
+                                                                 mp_context=multiprocessing.get_context("spawn"))
+
+    def shard(self, players: list[PlayerCursor]) -> list[list[PlayerCursor]]:
+        """Deals the RSNs out round robin, in the order they are due, so every shard gets as many overdue players."""
+        shards: list[list[PlayerCursor]] = [[] for _ in range(self.workers)]
+        assigned: dict[str, int] = {}
+        for player in players:
+            if player.rsn not in assigned:
+                assigned[player.rsn] = len(assigned) % self.workers
+            shards[assigned[player.rsn]].append(player)
+        return [shard for shard in shards if shard]
+
+    async def poll(self, players: list[PlayerCursor], days: dict[tuple[int, date], DaySnapshot],
+                   response_cache: ResponseCache) -> ShardResult:
+        loop = asyncio.get_running_loop()
+
+        async def run(shard: list[PlayerCursor]) -> ShardResult:
+            keys: list[str] = [runemetrics.response_key(player.rsn, activities)
+                               for player in shard for activities in (PAGE_SIZE, DEEP_PAGE_SIZE)]
+            # Read through get, so the responses in use stay clear of eviction
+            responses = {key: response for key in keys if (response := response_cache.get(key)) is not None}
+            with metrics.span("workers.shard"):
+                return await loop.run_in_executor(self.executor, poll_shard, shard, days, responses,
+                                                  self.concurrency)
+
+        results: list[ShardResult] = await asyncio.gather(*(run(shard) for shard in self.shard(players)))
+        merged: ShardResult = ShardResult({}, set(), [], [], {}, 0, 0.0, {})
+        for result in results:
+            merged.heads.update(result.heads)
+            merged.unchanged.update(result.unchanged)
+            merged.drops.extend(result.drops)
+            merged.entries.extend(result.entries)
+            for key, response in result.responses.items():
+                response_cache.put(key, response)
+            response_cache.bytes_downloaded += result.bytes_downloaded
+            response_cache.cpu_seconds_saved += result.cpu_seconds_saved
+            response_cache.unchanged += len(result.unchanged)
+            metrics.merge(result.timings)
+        return merged